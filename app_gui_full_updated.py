@@ -15,9 +15,10 @@ from pyluach import dates, hebrewcal
 
 # ייבוא פונקציות לוגיות מהמודול הנפרד
 from torah_logic_full_updated import (
-    load_data, get_length_from_node, has_relevant_data_recursive,
-    calculate_study_days, write_ics_file,
-    write_bookmark_html, write_bookmark_pdf, is_holiday,
+    load_tree_index, TreeIndex, TREE_MODES, BALANCE_PROPORTIONAL, BALANCE_MIN_MAX,
+    configure_schedule_cache,
+    calculate_study_days, find_nth_study_day, write_ics_file,
+    write_bookmark_html, write_bookmark_pdf,
     Gematria, HEBREW_MONTH_NAMES
 )
 
@@ -36,6 +37,7 @@ ctk.set_appearance_mode("system")  # הגדרת ערכת נושא בהתאם ל
 ctk.set_default_color_theme("blue") # הגדרת צבע ברירת מחדל
 
 DEFAULT_FILE = "torah_tree_data_full.json" # קובץ נתונים ברירת מחדל
+SCHEDULE_CACHE_DIR = "schedule_cache" # תיקיית מטמון הלוחות המחושבים
 
 def resource_path(filename):
     """החזרת נתיב לקובץ – עובד גם בפיתוח וגם בתוך EXE"""
@@ -206,6 +208,10 @@ class TorahTreeApp(ctk.CTk):
         self.round_up_halves_var = ctk.BooleanVar(value=False)
         # איזון פרקי משנה לפי מספר המשניות שלהם
         self.balance_chapters_by_mishnayot_var = ctk.BooleanVar(value=False)
+        # איזון אופטימלי: מזעור העומס ביום העמוס ביותר במקום יעד יומי שווה
+        self.balance_min_max_var = ctk.BooleanVar(value=False)
+        # סיום ימי לימוד בסוף פרק או מסכת (במצבי משניות/דפים/עמודים)
+        self.align_to_boundaries_var = ctk.BooleanVar(value=False)
         # סוג הזנת תאריך: 'gregorian' או 'hebrew'
         self.date_mode_var = ctk.StringVar(value="hebrew")
         # טקסט עבור מתג בחירת סוג התאריך
@@ -220,13 +226,18 @@ class TorahTreeApp(ctk.CTk):
             "חמישי": 3, "שישי": 4, "שבת": 5  # Sunday is 6 in Python's weekday()
         }
 
-        self.data = {} # מילון שיחזיק את נתוני הלימוד הנטענים מהקובץ
-        self.node_map = {} # מיפוי בין ID של פריט בעץ לנתונים המקוריים שלו
+        self.tree_index = TreeIndex.from_tree({}) # אינדקס העץ המהודר של הנתונים הטעונים
+        self.data = self.tree_index # נתוני הלימוד המועברים לפונקציות הייצוא
+        self.node_map = {} # מיפוי בין ID של פריט בעץ למזהה הצומת באינדקס
+        self._reset_selection_state() # סכומי הבחירה הנוכחית, מתעדכנים בהפרשים
         self.radio_buttons = {} # מילון לאחסון כפתורי הרדיו של סוג הספירה
         self.current_total_content = 0 # משתנה לשמירת האורך הכולל של הפריטים שנבחרו
 
         self._setup_initial_geometry() # הגדרת גודל חלון ראשוני
 
+        # לוחות שחושבו נשמרים בדיסק, כך שייצוא חוזר (ICS/HTML/PDF) אינו מחשב אותם שוב
+        configure_schedule_cache(resource_path(SCHEDULE_CACHE_DIR))
+
         # בניית כל רכיבי הממשק הגרפי
         self.build_gui()
 
@@ -545,6 +556,18 @@ class TorahTreeApp(ctk.CTk):
             variable=self.balance_chapters_by_mishnayot_var
         ).pack(anchor="w", padx=10, pady=(0,6))
 
+        ctk.CTkSwitch(
+            self.settings_window,
+            text="איזון אופטימלי (מזעור היום העמוס ביותר)",
+            variable=self.balance_min_max_var
+        ).pack(anchor="w", padx=20, pady=(0,6))
+
+        ctk.CTkSwitch(
+            self.settings_window,
+            text="סיים ימים בסוף פרק או מסכת",
+            variable=self.align_to_boundaries_var
+        ).pack(anchor="w", padx=10, pady=(0,6))
+
         ctk.CTkLabel(self.settings_window, text="סוג תאריכים:").pack(anchor="w", padx=10, pady=(10,0))
         self.date_mode_switch = ctk.CTkSwitch(
             self.settings_window,
@@ -567,14 +590,17 @@ class TorahTreeApp(ctk.CTk):
     def load_and_build(self, path):
         """
         טוען נתונים מקובץ JSON נתון, בונה את עץ התצוגה ומעדכן את ממשק המשתמש.
+        הטעינה עוברת דרך הקובץ המהודר שליד ה-JSON כשהוא בתוקף.
         """
-        self.data = load_data(path)
-        if self.data: # אם הטעינה הצליחה והקובץ אינו ריק
+        self.tree_index = load_tree_index(path)
+        self.data = self.tree_index
+        if self.tree_index.size > 1: # אם הטעינה הצליחה והקובץ אינו ריק
             # ניקוי העץ הקיים והמפה
             self.tree.delete(*self.tree.get_children())
             self.node_map.clear()
+            self._reset_selection_state()
             # בניית העץ מחדש
-            self._build_full_tree_recursive("", self.data)
+            self._build_full_tree_recursive("", TreeIndex.ROOT)
             self.update_sum_and_daily_progress() # עדכון ראשוני
             if self.tree.get_children(): # אם יש פריטים בעץ לאחר הבנייה
                 first_item = self.tree.get_children()[0]
@@ -587,61 +613,53 @@ class TorahTreeApp(ctk.CTk):
             self.daily_progress_label.configure(text="הספק יומי: N/A")
             self.tree.insert("", "end", text="טעינת הקובץ נכשלה או שהקובץ ריק.", open=True)
 
-    def _build_full_tree_recursive(self, parent_iid, node_data):
+    def _build_full_tree_recursive(self, parent_iid, node_id):
         """
-        פונקציית עזר רקורסיבית לבניית עץ התצוגה מנתוני ה-JSON.
+        פונקציית עזר רקורסיבית לבניית עץ התצוגה מאינדקס העץ המהודר.
 
         Args:
             parent_iid (str): ה-ID של צומת האב בעץ התצוגה.
                               עבור השורש, זהו מחרוזת ריקה.
-            node_data (dict or any): הנתונים של הצומת הנוכחי (בדרך כלל מילון).
-                                     אם אינו מילון, הרקורסיה נעצרת עבור ענף זה.
+            node_id (int): מזהה הצומת הנוכחי באינדקס (TreeIndex.ROOT עבור השורש).
         """
-        if not isinstance(node_data, dict): return
-        for key, val in node_data.items():
-            # אל תוסיף לעץ את מפתחות הנתונים עצמם (אורך, משניות וכו')
-            if key in ["אורך בדפים", "עמוד אחרון", "משניות", "פרקים"] and not isinstance(val, dict):
-                continue
-            iid = self.tree.insert(parent_iid, "end", text=key, open=False) # פריטים סגורים כברירת מחדל
-            self.node_map[iid] = val # שמירת הנתונים המקוריים של הצומת
-            if isinstance(val, dict):
-                self._build_full_tree_recursive(iid, val)
-
-    def _node_matches_query(self, node_data, query):
+        index = self.tree_index
+        for child_id in index.children(node_id):
+            iid = self.tree.insert(parent_iid, "end", text=index.names[child_id], open=False) # פריטים סגורים כברירת מחדל
+            self.node_map[iid] = child_id # שמירת מזהה הצומת באינדקס
+            if index.is_branch[child_id]:
+                self._build_full_tree_recursive(iid, child_id)
+
+    def _node_matches_query(self, node_id, query):
         """בודק אם צומת כלשהו בעץ מכיל את מחרוזת החיפוש."""
-        if not isinstance(node_data, dict):
-            return False
-        for k, v in node_data.items():
-            if k in ["אורך בדפים", "עמוד אחרון", "משניות", "פרקים"] and not isinstance(v, dict):
-                continue
-            if query in k:
+        index = self.tree_index
+        for child_id in index.children(node_id):
+            if query in index.names[child_id]:
                 return True
-            if isinstance(v, dict) and self._node_matches_query(v, query):
+            if index.is_branch[child_id] and self._node_matches_query(child_id, query):
                 return True
         return False
 
-    def _build_filtered_tree_recursive(self, parent_iid, node_data, query):
+    def _build_filtered_tree_recursive(self, parent_iid, node_id, query):
         """בונה את העץ בהתאם למחרוזת חיפוש."""
-        if not isinstance(node_data, dict):
-            return
-        for key, val in node_data.items():
-            if key in ["אורך בדפים", "עמוד אחרון", "משניות", "פרקים"] and not isinstance(val, dict):
-                continue
-            if query in key or self._node_matches_query(val, query):
-                iid = self.tree.insert(parent_iid, "end", text=key, open=True)
-                self.node_map[iid] = val
-                if isinstance(val, dict):
-                    self._build_filtered_tree_recursive(iid, val, query)
+        index = self.tree_index
+        for child_id in index.children(node_id):
+            name = index.names[child_id]
+            if query in name or self._node_matches_query(child_id, query):
+                iid = self.tree.insert(parent_iid, "end", text=name, open=True)
+                self.node_map[iid] = child_id
+                if index.is_branch[child_id]:
+                    self._build_filtered_tree_recursive(iid, child_id, query)
 
     def filter_tree(self, event=None):
         """סינון פריטי העץ בהתאם לטקסט החיפוש."""
         query = self.search_var.get().strip()
         self.tree.delete(*self.tree.get_children())
         self.node_map.clear()
+        self._reset_selection_state()
         if not query:
-            self._build_full_tree_recursive("", self.data)
+            self._build_full_tree_recursive("", TreeIndex.ROOT)
         else:
-            self._build_filtered_tree_recursive("", self.data, query)
+            self._build_filtered_tree_recursive("", TreeIndex.ROOT, query)
         self.update_sum_and_daily_progress()
 
     def disable_all_radio_buttons(self):
@@ -651,7 +669,44 @@ class TorahTreeApp(ctk.CTk):
         for opt in self.radio_buttons:
             self.radio_buttons[opt].configure(state="disabled")
 
+    def _balance_strategy(self):
+        """
+        מחזיר את אסטרטגיית איזון פרקי המשנה שנבחרה בהגדרות, או False אם האיזון כבוי.
+        """
+        if not self.balance_chapters_by_mishnayot_var.get():
+            return False
+        return BALANCE_MIN_MAX if self.balance_min_max_var.get() else BALANCE_PROPORTIONAL
+
     # ==================== טיפול באירועים ועדכונים ====================
+    def _reset_selection_state(self):
+        """
+        מאפס את סכומי הבחירה המצטברים (לאחר בנייה מחדש של העץ).
+        """
+        self.selected_iids = set()
+        self.selection_totals = [0] * len(TREE_MODES) # אורך כולל לכל סוג ספירה
+        self.selection_mode_counts = [0] * len(TREE_MODES) # מספר הצמתים הנבחרים הרלוונטיים לכל סוג
+
+    def _sync_selection_totals(self):
+        """
+        מעדכן את סכומי הבחירה לפי ההפרש בין הבחירה הקודמת לנוכחית בלבד,
+        בעזרת הסכומים והמסכות שחושבו מראש לכל צומת באינדקס העץ.
+        """
+        current = set(self.tree.selection())
+        added = current - self.selected_iids
+        removed = self.selected_iids - current
+        for iids, sign in ((added, 1), (removed, -1)):
+            for iid in iids:
+                node_id = self.node_map.get(iid)
+                if node_id is None:
+                    continue
+                node_totals = self.tree_index.mode_totals(node_id)
+                mask = self.tree_index.relevant_mask(node_id)
+                for i in range(len(TREE_MODES)):
+                    self.selection_totals[i] += sign * node_totals[i]
+                    if mask & (1 << i):
+                        self.selection_mode_counts[i] += sign
+        self.selected_iids = current
+
     def on_tree_select(self, event):
         """
         מטפל באירוע בחירת פריט/ים בעץ התצוגה. מעדכן את כפתורי הרדיו ואת סיכום התוכן.
@@ -664,14 +719,13 @@ class TorahTreeApp(ctk.CTk):
             self.daily_progress_label.configure(text="הספק יומי: N/A")
             return
 
-        # בדוק אילו סוגי ספירה רלוונטיים לבחירה הנוכחית
-        relevant_modes_for_selection = set()
-        for iid in selected_items:
-            if iid in self.node_map:
-                node_data = self.node_map[iid] # קבל את הנתונים המקוריים של הצומת
-                for mode_option in ["פרקים", "משניות", "דפים", "עמודים"]:
-                    if has_relevant_data_recursive(node_data, mode_option):
-                        relevant_modes_for_selection.add(mode_option)
+        # בדוק אילו סוגי ספירה רלוונטיים לבחירה הנוכחית (עדכון לפי הפריטים שנוספו/הוסרו)
+        self._sync_selection_totals()
+        relevant_modes_for_selection = {
+            mode_option
+            for mode_option, count in zip(TREE_MODES, self.selection_mode_counts)
+            if count > 0
+        }
         # עדכון מצב כפתורי הרדיו (הצגה/הסתרה, הפעלה/השבתה)
         current_mode_active = False
         new_default_mode = "" # למקרה שהמצב הנוכחי לא רלוונטי יותר
@@ -706,11 +760,11 @@ class TorahTreeApp(ctk.CTk):
         if not selected_items or not mode: # אם אין בחירה או אין מצב ספירה
             display_total = 0
         else:
-            # חישוב האורך הכולל על סמך הפריטים הנבחרים ומצב הספירה
-            for iid in selected_items:
-                if iid in self.node_map:
-                    node = self.node_map[iid]  # השתמש בנתונים המקוריים מהמפה
-                    total += get_length_from_node(node, mode)
+            # האורך הכולל נשמר מצטבר לכל סוג ספירה ומתעדכן לפי שינויי הבחירה בלבד
+            self._sync_selection_totals()
+            total = self.selection_totals[TREE_MODES.index(mode)]
+            if total == int(total):
+                total = int(total)
             display_total = math.ceil(total) if self.round_up_halves_var.get() else total
 
         self.current_total_content = display_total
@@ -776,33 +830,13 @@ class TorahTreeApp(ctk.CTk):
         # חישוב מספר ימי הלימוד הנדרשים (עיגול כלפי מעלה)
         study_sessions_needed = math.ceil(total_material / units_per_day_val)
 
-        current_date = start_date_obj
-        sessions_counted = 0
-        days_iterated = 0 # מונה בטיחות למניעת לולאות אינסופיות
-        
         # בדיקה אם בכלל אפשר ללמוד (למקרה שכל ימות השבוע מוגדרים כחופש)
         can_study_at_all = any(i not in no_study_weekdays_set for i in range(7))
         if not can_study_at_all and total_material > 0:
             return None # לא ניתן להתקדם אם כל הימים הם ימי חופש
 
-        while sessions_counted < study_sessions_needed:
-            if current_date.weekday() not in no_study_weekdays_set:
-                if not (skip_holidays and is_holiday(current_date)):
-                    # אם היום הוא יום לימוד, קדם את מונה ימי הלימוד
-                    sessions_counted += 1
-            
-            if sessions_counted == study_sessions_needed: # הגענו למספר ימי הלימוד הנדרש
-                break
-            
-            current_date += timedelta(days=1)
-            days_iterated += 1
-
-            # מנגנון בטיחות למקרה של תוכנית ארוכה מאוד או בעיה בחישוב
-            if days_iterated > 365 * 50: # מעל 50 שנה
-                # במקרה כזה, החישוב כנראה נתקע או שהתוכנית ארוכה מדי
-                return None 
-        
-        return current_date
+        # איתור יום הלימוד האחרון בעזרת אינדקס ימי הלימוד (עד 50 שנה קדימה)
+        return find_nth_study_day(start_date_obj, study_sessions_needed, no_study_weekdays_set, skip_holidays)
 
     def calculate_and_display_daily_progress(self):
         """
@@ -956,7 +990,8 @@ class TorahTreeApp(ctk.CTk):
                 units_per_day=self.units_per_day_var.get() if self.schedule_mode_var.get() == 1 else None,
                 skip_holidays=self.skip_holidays_var.get(),
                 alarm_time=alarm_time,
-                balance_chapters_by_mishnayot=self.balance_chapters_by_mishnayot_var.get(),
+                balance_chapters_by_mishnayot=self._balance_strategy(),
+                align_to_boundaries=self.align_to_boundaries_var.get(),
             )
             messagebox.showinfo("הצלחה", f"הקובץ נשמר:\n{saved_path}")
         except Exception as e:
@@ -1036,7 +1071,8 @@ class TorahTreeApp(ctk.CTk):
                 no_study_weekdays_set=no_study_weekdays_set,
                 units_per_day=self.units_per_day_var.get() if self.schedule_mode_var.get() == 1 else None,
                 skip_holidays=self.skip_holidays_var.get(),
-                balance_chapters_by_mishnayot=self.balance_chapters_by_mishnayot_var.get()
+                balance_chapters_by_mishnayot=self._balance_strategy(),
+                align_to_boundaries=self.align_to_boundaries_var.get(),
             )
             messagebox.showinfo("הצלחה", f"הקובץ HTML נשמר:\n{saved_path}")
             webbrowser.open(resource_path(saved_path))  # פתיחת הקובץ בדפדפן ברירת המחדל
@@ -1104,7 +1140,8 @@ class TorahTreeApp(ctk.CTk):
                 no_study_weekdays_set=no_study_weekdays_set,
                 units_per_day=self.units_per_day_var.get() if self.schedule_mode_var.get() == 1 else None,
                 skip_holidays=self.skip_holidays_var.get(),
-                balance_chapters_by_mishnayot=self.balance_chapters_by_mishnayot_var.get(),
+                balance_chapters_by_mishnayot=self._balance_strategy(),
+                align_to_boundaries=self.align_to_boundaries_var.get(),
             )
             if saved_path:
                 messagebox.showinfo("הצלחה", f"הקובץ PDF נשמר:\n{saved_path}")
@@ -8,7 +8,7 @@ import pytest
 def load_module():
     path = Path(__file__).resolve().parents[1] / "torah_logic_full_updated.py"
 
-    # Stub external GUI/ICS dependencies so the module can be imported
+    # Stub external GUI dependencies so the module can be imported
     if "customtkinter" not in sys.modules:
         ctk = types.ModuleType("customtkinter")
         ctk.set_appearance_mode = lambda *a, **k: None
@@ -34,12 +34,6 @@ def load_module():
         tkcalendar.DateEntry = type("DateEntry", (), {})
         sys.modules["tkcalendar"] = tkcalendar
 
-    if "ics" not in sys.modules:
-        ics = types.ModuleType("ics")
-        ics.Calendar = type("Calendar", (), {})
-        ics.Event = type("Event", (), {})
-        ics.DisplayAlarm = type("DisplayAlarm", (), {})
-        sys.modules["ics"] = ics
 
     if "tkinter" not in sys.modules:
         tk = types.ModuleType("tkinter")
@@ -169,3 +163,834 @@ def test_build_sefaria_ref_cross_book_mishnah(torah_tree):
     }
     ref = torah_tree.build_sefaria_ref(first, last, "משניות")
     assert ref == ["משנה_ברכות.ט.4-ט.5", "משנה_פאה.א.1-א.2"]
+
+
+def test_holiday_index_matches_pyluach(torah_tree):
+    from datetime import date, timedelta
+    from pyluach import dates
+
+    index = torah_tree.HolidayIndex()
+    day = date(2024, 9, 1)
+    end = date(2025, 9, 30)
+    expected = []
+    while day <= end:
+        h_d = dates.GregorianDate(day.year, day.month, day.day).to_heb()
+        regular = h_d.holiday(hebrew=True, israel=True)
+        national = torah_tree.get_israeli_national_holiday_on_gregorian_date(
+            day, h_d.year
+        )
+        assert (day in index) == bool(regular or national)
+        if regular or national:
+            expected.append(day)
+        day += timedelta(days=1)
+    assert index.holidays_between(date(2024, 9, 1), end) == expected
+    assert index.label(date(2025, 5, 1)) == "יום העצמאות"
+
+
+def test_study_day_index_counts_and_nth(torah_tree):
+    from datetime import date, timedelta
+
+    start, end = date(2024, 9, 1), date(2025, 9, 30)
+    no_study = {4, 5}
+    index = torah_tree.StudyDayIndex(start, end, no_study, skip_holidays=True)
+    study_days = []
+    day = start
+    while day <= end:
+        if day.weekday() not in no_study and not torah_tree.is_holiday(day):
+            study_days.append(day)
+        day += timedelta(days=1)
+    assert index.total == len(study_days)
+    assert index.count_between(date(2024, 10, 1), date(2024, 10, 31)) == len(
+        [d for d in study_days if d.month == 10 and d.year == 2024]
+    )
+    assert index.nth_study_day(1) == study_days[0]
+    assert index.nth_study_day(100) == study_days[99]
+    assert index.nth_study_day(len(study_days) + 1) is None
+    assert torah_tree.find_nth_study_day(start, 100, no_study, True) == study_days[99]
+    assert torah_tree.find_nth_study_day(start, 1, set(range(7))) is None
+
+
+def test_hebrew_date_string_matches_pyluach(torah_tree):
+    from datetime import date
+    from pyluach import dates
+
+    # טווח הכולל שנה מעוברת ומעבר בין שנים עבריות
+    ordinals = list(range(date(2023, 9, 1).toordinal(), date(2025, 10, 16).toordinal()))
+    h_years, h_months, h_days = torah_tree.ordinals_to_hebrew(ordinals)
+    for ordinal, year, month, day in zip(
+        ordinals, h_years.tolist(), h_months.tolist(), h_days.tolist()
+    ):
+        h_d = dates.GregorianDate.from_pydate(date.fromordinal(ordinal)).to_heb()
+        assert torah_tree.hebrew_date_string(year, month, day) == (
+            h_d.hebrew_date_string(True)
+        )
+
+
+def test_calendar_table_roundtrip_and_rebuild(torah_tree, tmp_path):
+    import json
+    from datetime import date
+    from pyluach import dates, parshios
+
+    path = tmp_path / "table.json"
+    table = torah_tree.read_calendar_table(str(path), 5785, 5786)
+    assert path.exists()
+    index = torah_tree.HolidayIndex(table)
+    shabbat = date(2025, 1, 4)
+    assert index.parsha(shabbat) == parshios.getparsha_string(
+        dates.GregorianDate.from_pydate(shabbat), hebrew=True, israel=True
+    )
+    assert index.label(date(2025, 4, 13)) == "פסח"
+
+    # טבלה שנפגעה נבנית מחדש לפי בדיקת הגיבוב
+    original = json.loads(path.read_text(encoding="utf-8"))
+    payload = dict(original, holiday_labels=[i + 1 for i in original["holiday_labels"]])
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    rebuilt = torah_tree.read_calendar_table(str(path), 5785, 5786)
+    assert rebuilt.holidays == table.holidays
+    assert json.loads(path.read_text(encoding="utf-8")) == original
+
+
+def test_vectorized_calendar_engine_matches_pyluach(torah_tree):
+    import random
+    from datetime import date
+    import numpy as np
+    from pyluach import dates
+
+    years = np.arange(3762, 9990)
+    new_years = torah_tree.hebrew_new_year_ordinals(years)
+    for year, ordinal in zip(years.tolist(), new_years.tolist()):
+        assert dates.HebrewDate(year, 7, 1).to_pydate().toordinal() == ordinal
+
+    rng = random.Random(5785)
+    first, last = date(1, 9, 1).toordinal(), date(9999, 8, 1).toordinal()
+    sample = [rng.randint(first, last) for _ in range(3000)]
+    sample += list(range(date(2023, 9, 1).toordinal(), date(2025, 10, 1).toordinal()))
+    ordinals = np.array(sample)
+    h_years, h_months, h_days = torah_tree.ordinals_to_hebrew(ordinals)
+    for ordinal, year, month, day in zip(
+        sample, h_years.tolist(), h_months.tolist(), h_days.tolist()
+    ):
+        h_d = dates.GregorianDate.from_pydate(date.fromordinal(ordinal)).to_heb()
+        assert (h_d.year, h_d.month, h_d.day) == (year, month, day)
+    assert (torah_tree.hebrew_to_ordinals(h_years, h_months, h_days) == ordinals).all()
+
+
+def test_tree_index_matches_nested_tree(torah_tree, sample_tree):
+    index = torah_tree.TreeIndex.from_tree(sample_tree)
+    for mode in ("פרקים", "משניות", "דפים", "עמודים"):
+        for path, node_id in index.path_ids.items():
+            node = torah_tree._get_node_from_path(path.split(" / "), sample_tree)
+            assert index.subtree_length(node_id, mode) == torah_tree.get_length_from_node(node, mode)
+            assert index.has_relevant_data(node_id, mode) == torah_tree.has_relevant_data_recursive(node, mode)
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    index = torah_tree.get_tree_index(tree)
+    assert torah_tree.get_tree_index(tree) is index
+    assert index.subtree_length(torah_tree.TreeIndex.ROOT, "דפים") == torah_tree.get_length_from_node(tree, "דפים")
+    berakhot = index.find("משנה / זרעים / ברכות")
+    assert [index.names[c] for c in index.chapter_children(berakhot)][:3] == ["פרק א", "פרק ב", "פרק ג"]
+    assert torah_tree.find_exact_whole_branch(["משנה / זרעים / ברכות"], tree) == "משנה / זרעים / ברכות"
+
+
+def test_tree_index_aggregates_cover_full_tree(torah_tree):
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    index = torah_tree.get_tree_index(tree)
+    for path, node_id in index.path_ids.items():
+        node = torah_tree._get_node_from_path(path.split(" / "), tree)
+        expected_mask = 0
+        for i, mode in enumerate(torah_tree.TREE_MODES):
+            assert index.mode_totals(node_id)[i] == torah_tree.get_length_from_node(node, mode)
+            if torah_tree.has_relevant_data_recursive(node, mode):
+                expected_mask |= torah_tree.TREE_MODE_BITS[mode]
+        assert index.relevant_mask(node_id) == expected_mask
+
+
+def test_selection_resolves_to_unit_ranges(torah_tree):
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    index = torah_tree.get_tree_index(tree)
+    seder = index.find("משנה / זרעים")
+    children = [index.paths[c] for c in index.branch_children(seder)]
+
+    selection = torah_tree.resolve_selection(children, tree, "משניות")
+    whole = torah_tree.resolve_selection(["משנה / זרעים"], tree, "משניות")
+    assert selection.ranges == whole.ranges and len(whole.ranges) == 1
+    assert whole[0] == {
+        "book_display_name": "משנה / זרעים / ברכות / פרק א",
+        "unit_type": "משנה",
+        "unit_display_name": "א",
+        "sort_key": 1,
+        "unit_num_int": 1,
+    }
+    tail = whole[len(whole) - 3 :]
+    assert len(tail) == 3 and list(tail)[-1] == whole[-1]
+
+    amudim = torah_tree.resolve_selection(["תלמוד בבלי / ברכות"], tree, "עמודים")
+    assert len(amudim) == 2 * int(index.subtree_length(index.find("תלמוד בבלי / ברכות"), "דפים"))
+    assert (amudim[1]["unit_num_int"], amudim[1]["side"], amudim[1]["unit_display_name"]) == (2, "b", "ב:")
+
+
+def test_study_unit_records(torah_tree):
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    selection = torah_tree.resolve_selection(["תלמוד בבלי / ברכות"], tree, "עמודים")
+    first, last = selection[0], selection[3]
+    assert isinstance(first, torah_tree.StudyUnit)
+    assert not hasattr(first, "__dict__")
+    assert first.book_display_name is last.book_display_name
+    assert "chapter_name" not in first and first.get("side") == "a"
+
+    ref = torah_tree.build_sefaria_ref(first, last, "עמודים")
+    assert ref == torah_tree.build_sefaria_ref(first.as_dict(), last.as_dict(), "עמודים")
+    assert ref.endswith(".2a-3b")
+    assert torah_tree.build_description(first, last, "עמודים") == "תלמוד בבלי / ברכות – עמוד ב. עד עמוד ג:"
+
+
+def test_compiled_tree_file_reused_and_rebuilt(torah_tree, tmp_path, monkeypatch):
+    import json
+    import os
+    import weakref
+
+    source = tmp_path / "tree.json"
+    source.write_text(json.dumps({"ספר": {"פרק א": {"משניות": 4}}}), encoding="utf-8")
+    compiled = tmp_path / ("tree.json" + torah_tree.TREE_INDEX_SUFFIX)
+
+    index = torah_tree.load_tree_index(str(source))
+    assert compiled.exists() and index.subtree_length(index.find("ספר"), "משניות") == 4
+    header, mapped = torah_tree.read_tree_index_file(str(compiled))
+    assert not mapped.parents.flags.writeable
+    assert mapped.names == index.names
+
+    # המבנים המחושבים נטענים מהקובץ, ללא חישוב מחדש
+    def no_compute(self):
+        raise AssertionError("derived arrays recomputed on load")
+
+    with monkeypatch.context() as m:
+        m.setattr(torah_tree.TreeIndex, "_compute_structure", no_compute)
+        m.setattr(torah_tree.TreeIndex, "_compute_aggregates", no_compute)
+        reloaded = torah_tree.read_tree_index_file(str(compiled))[1]
+    assert reloaded.paths == index.paths and reloaded.path_ids == index.path_ids
+    assert reloaded.totals.tolist() == index.totals.tolist()
+    assert reloaded.chapter_children(1) == index.chapter_children(1)
+    assert reloaded.relevant_mask(1) == index.relevant_mask(1)
+    del reloaded
+
+    del mapped
+    # כמו ב-Windows: החלפת הקובץ המהודר נכשלת כל עוד הוא ממופה
+    maps = []
+    read_file = torah_tree.read_tree_index_file
+
+    def tracking_read(path):
+        loaded = read_file(path)
+        if loaded is not None:
+            maps.append(weakref.ref(loaded[1].parents))
+        return loaded
+
+    def guarded_replace(src, dst):
+        if any(ref() is not None for ref in maps):
+            raise PermissionError("file is mapped")
+        os.rename(src, dst)
+
+    monkeypatch.setattr(torah_tree, "read_tree_index_file", tracking_read)
+    monkeypatch.setattr(torah_tree.os, "replace", guarded_replace)
+
+    # אותו תוכן עם זמן שינוי אחר: הקובץ המהודר נשאר בתוקף לפי ה-hash,
+    # והכותרת מתעדכנת כך שבטעינה הבאה אין צורך לחשב hash
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert torah_tree.load_tree_index(str(source)).names == index.names
+    header = read_file(str(compiled))[0]
+    assert header["source"]["mtime_ns"] == stat.st_mtime_ns + 10**9
+
+    source.write_text(json.dumps({"ספר": {"פרק א": {"משניות": 7}}}), encoding="utf-8")
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+    rebuilt = torah_tree.load_tree_index(str(source))
+    assert rebuilt.subtree_length(rebuilt.find("ספר"), "משניות") == 7
+    assert read_file(str(compiled))[1].mishnayot.max() == 7
+
+
+def test_allocate_units_to_days(torah_tree):
+    import numpy as np
+
+    days = np.arange(738000, 738007)
+    ordinals, starts, ends = torah_tree.allocate_units_to_days(np.ones(17, dtype=int), days)
+    assert ordinals.tolist() == days.tolist()
+    assert (ends - starts).tolist() == [3, 3, 3, 2, 2, 2, 2]
+
+    # יחידה כבדה "תופסת" את הימים שלה; ימים ריקים אינם מוחזרים
+    ordinals, starts, ends = torah_tree.allocate_units_to_days(
+        np.array([1, 12, 1, 1, 1]), days[:4]
+    )
+    assert list(zip(starts.tolist(), ends.tolist())) == [(0, 1), (1, 2), (2, 5)]
+    assert ordinals.tolist() == [days[0], days[1], days[3]]
+
+
+def test_min_max_partition_balancing(torah_tree):
+    import numpy as np
+    from datetime import date
+
+    weights = np.array([5, 1, 1, 1, 5, 1, 1, 1, 5])
+    ordinals, starts, ends = torah_tree.partition_units_min_max(weights, np.arange(3))
+    loads = [int(weights[s:e].sum()) for s, e in zip(starts, ends)]
+    assert loads == [7, 7, 7] and ends[-1] == len(weights) and len(ordinals) == 3
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    args = (date(2024, 1, 1), date(2024, 3, 1), ["משנה / נזיקין"], "פרקים", tree, {5}, None, True)
+    heaviest = {}
+    for strategy in torah_tree.BALANCE_STRATEGIES:
+        schedule = torah_tree._generate_study_schedule(*args, strategy)
+        heaviest[strategy] = max(
+            sum(int(w) for w in day["units"].chapter_weights()) for day in schedule
+        )
+    assert heaviest[torah_tree.BALANCE_MIN_MAX] <= heaviest[torah_tree.BALANCE_PROPORTIONAL]
+
+
+def test_boundary_aligned_segmentation(torah_tree):
+    import numpy as np
+    from datetime import date
+
+    # שלושה "פרקים" באורכים 4, 5, 3 על פני שלושה ימים: החיתוכים נופלים בגבולות
+    levels = np.zeros(13, dtype=np.int8)
+    levels[[4, 9]] = torah_tree.BOUNDARY_PEREK
+    levels[12] = torah_tree.BOUNDARY_MASECHET
+    _, starts, ends = torah_tree.segment_units_at_boundaries(levels, np.arange(3))
+    assert ends.tolist() == [4, 9, 12] and starts.tolist() == [0, 4, 9]
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    args = (date(2024, 1, 1), date(2024, 6, 1), ["משנה / זרעים"], "משניות", tree, {5}, None, True, False)
+    plain = torah_tree._generate_study_schedule(*args)
+    aligned = torah_tree._generate_study_schedule(*args, True)
+    levels = torah_tree.resolve_selection(["משנה / זרעים"], tree, "משניות").boundary_levels()
+
+    def aligned_day_ends(schedule):
+        cuts = np.cumsum([len(day["units"]) for day in schedule])
+        return int((levels[cuts] > 0).sum())
+
+    assert len(aligned) == len(plain)
+    assert sum(len(day["units"]) for day in aligned) == len(levels) - 1
+    assert aligned_day_ends(aligned) > 2 * aligned_day_ends(plain)
+
+
+def test_iter_study_schedule_is_lazy(torah_tree):
+    import types as _types
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    args = (date(2024, 1, 1), None, ["תלמוד בבלי"], "דפים", tree, {5}, 1, True)
+    days = torah_tree.iter_study_schedule(*args)
+    assert isinstance(days, _types.GeneratorType)
+    first = next(days)
+    assert first["description"] == "תלמוד בבלי / ברכות – דף ב"
+
+    full = torah_tree._generate_study_schedule(*args)
+    assert [d["date"] for d in torah_tree.iter_study_schedule(*args)] == [
+        d["date"] for d in full
+    ]
+    assert list(torah_tree.iter_study_schedule(date(2024, 2, 1), date(2024, 1, 1), ["תנך"], "פרקים", tree, set())) == []
+
+
+def test_study_schedule_random_access(torah_tree):
+    from datetime import date, timedelta
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    args = (date(2024, 1, 1), date(2030, 12, 31), ["משנה"], "משניות", tree, {5}, None, True)
+    schedule = torah_tree.build_study_schedule(*args)
+    full = torah_tree._generate_study_schedule(*args)
+    assert len(schedule) == len(full)
+
+    day = full[1000]
+    assert schedule.portion_on(day["date"])["description"] == day["description"]
+    assert schedule.portion_on(date(2024, 1, 6)) is None  # שבת
+    assert schedule.next_day_index(date(2024, 1, 6)) == 5
+
+    position = sum(len(d["units"]) for d in full[:1000])
+    assert schedule.date_of_unit(position) == day["date"]
+    assert schedule.date_of_unit(-1) == full[-1]["date"]
+
+    window = list(schedule.window(day["date"], days=30))
+    expected = [d for d in full if day["date"] <= d["date"] < day["date"] + timedelta(days=30)]
+    assert [d["description"] for d in window] == [d["description"] for d in expected]
+
+
+def test_study_cycle_modular_lookup(torah_tree):
+    from datetime import date, timedelta
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    anchor = date(2024, 1, 1)
+    fixed = torah_tree._generate_study_schedule(anchor, None, ["משנה"], "משניות", tree, {5}, 2)
+    cycle = torah_tree.build_study_cycle(["משנה"], "משניות", tree, anchor, 2, {5})
+    assert cycle.days_per_cycle == len(fixed)
+
+    # המחזור הראשון זהה ללוח בהספק קבוע, והמחזורים הבאים והקודמים חוזרים עליו
+    for day in (fixed[0], fixed[777], fixed[-1]):
+        portion = cycle.portion_on(day["date"])
+        assert portion["description"] == day["description"] and portion["cycle"] == 0
+    later = cycle.date_of_unit(0, cycle=3)
+    assert cycle.portion_on(later)["description"] == fixed[0]["description"]
+    earlier = cycle.date_of_unit(-1, cycle=-1)
+    assert earlier < anchor and cycle.portion_on(earlier)["cycle"] == -1
+    assert cycle.portion_on(earlier)["description"] == fixed[-1]["description"]
+    assert cycle.portion_on(date(2024, 1, 6)) is None  # שבת
+
+    window = list(cycle.window(fixed[100]["date"], days=14))
+    expected = [d for d in fixed if fixed[100]["date"] <= d["date"] < fixed[100]["date"] + timedelta(days=14)]
+    assert [d["description"] for d in window] == [d["description"] for d in expected]
+
+
+def test_reschedule_keeps_days_before_pivot(torah_tree):
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    schedule = torah_tree.build_study_schedule(
+        date(2024, 1, 1), date(2024, 12, 31), ["משנה / זרעים"], "משניות", tree, {5}
+    )
+    pivot = schedule.day(100)["date"]
+    completed = int(schedule.day_starts[90])  # הלומד פיגר בעשרה ימים
+    updated = torah_tree.reschedule_study_schedule(
+        schedule, pivot, completed, date(2024, 12, 31), {0, 5}
+    )
+
+    assert [updated.day(i) for i in range(100)] == [schedule.day(i) for i in range(100)]
+    assert updated.day(100)["date"] == pivot
+    assert int(updated.day_starts[100]) == completed
+    assert int(updated.day_ends[-1]) == len(schedule.units)
+    tail_dates = [d["date"] for d in updated.iter_days(100)]
+    assert all(d.weekday() not in (0, 5) for d in tail_dates) and tail_dates[-1] <= date(2024, 12, 31)
+
+    # ללא completed_units - ממשיכים מהמקום המתוכנן, והלוח נשאר זהה
+    same = torah_tree.reschedule_study_schedule(schedule, pivot, None, None, {5}, units_per_day=3)
+    assert int(same.day_starts[100]) == int(schedule.day_starts[100])
+
+    # במצב טווח ללא תאריך סיום - הלוח מסתיים באותו תאריך כמו הלוח הקיים
+    minimal = torah_tree.reschedule_study_schedule(schedule, pivot)
+    assert minimal.last_date <= schedule.last_date
+    assert int(minimal.day_ends[-1]) == len(schedule.units)
+    with pytest.raises(ValueError):
+        torah_tree.reschedule_study_schedule(schedule, pivot, end_date=date(2023, 12, 31))
+
+
+def test_schedule_cache_memory_and_disk(torah_tree, tmp_path, monkeypatch):
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    args = (date(2024, 1, 1), date(2024, 6, 1), ["משנה / זרעים"], "משניות", tree, {5})
+    monkeypatch.setattr(torah_tree, "SCHEDULE_CACHE", torah_tree.OrderedDict())
+    torah_tree.configure_schedule_cache(str(tmp_path), memory_size=4, disk_entries=2)
+    try:
+        first = torah_tree.get_study_schedule(*args)
+        assert torah_tree.get_study_schedule(*args) is first
+        # תאריך הסיום אינו חלק מהמפתח במצב הספק קבוע
+        assert torah_tree.schedule_cache_key(*args[:1], date(2030, 1, 1), *args[2:], 2) == (
+            torah_tree.schedule_cache_key(*args, 2)
+        )
+        assert len(list(tmp_path.glob("*.npz"))) == 1
+
+        # שכבת הדיסק: זיכרון ריק, והלוח נטען מהקובץ ללא חישוב
+        torah_tree.SCHEDULE_CACHE.clear()
+        with monkeypatch.context() as m:
+            m.setattr(torah_tree, "build_study_schedule", None)
+            loaded = torah_tree.get_study_schedule(*args)
+        assert loaded.day_ends.tolist() == first.day_ends.tolist()
+        assert loaded.day(10) == first.day(10)
+
+        for units_per_day in (1, 2, 3):
+            torah_tree.get_study_schedule(*args, units_per_day)
+        assert len(list(tmp_path.glob("*.npz"))) == 2
+        assert len(torah_tree.SCHEDULE_CACHE) == 4
+    finally:
+        torah_tree.configure_schedule_cache()
+
+
+def test_run_plan_batch_streams_results(tmp_path, monkeypatch):
+    import importlib
+    import multiprocessing
+    from datetime import date
+
+    # תהליכי העבודה מאתרים את פונקציות המודול לפי שמו, ולכן המודול נטען כאן
+    # בשמו האמיתי; spawn (ברירת המחדל ב-Windows וב-macOS) מייבא אותו מחדש
+    root = str(Path(__file__).resolve().parents[1])
+    monkeypatch.syspath_prepend(root)
+    monkeypatch.chdir(root)
+    torah_tree = importlib.import_module("torah_logic_full_updated")
+    base = {
+        "format": "html",
+        "mode": "פרקים",
+        "end_date": date(2024, 3, 1),
+        "no_study_weekdays_set": {5},
+    }
+    specs = [
+        dict(base, titles_list=["תנך / תורה / בראשית"], start_date=date(2024, 1, 1), output_path=str(tmp_path / "a.html")),
+        dict(base, titles_list=["תנך / תורה / שמות"], start_date=date(2024, 1, 8), output_path=str(tmp_path / "b.html")),
+        dict(base, format="docx", titles_list=["תנך"], start_date=date(2024, 1, 1)),
+    ]
+    results = {
+        r["index"]: r
+        for r in torah_tree.run_plan_batch(
+            specs, max_workers=2, mp_context=multiprocessing.get_context("spawn")
+        )
+    }
+
+    assert sorted(results) == [0, 1, 2]
+    assert results[0]["path"] == str(tmp_path / "a.html") and results[0]["error"] is None
+    assert "שמות" in (tmp_path / "b.html").read_text(encoding="utf-8")
+    assert results[2]["path"] is None and results[2]["error"].startswith("KeyError")
+
+
+def test_multi_track_schedule(torah_tree, tmp_path):
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    start, end = date(2024, 1, 1), date(2024, 3, 31)
+    tracks = [
+        {"titles_list": ["תנך / תורה"], "mode": "פרקים"},
+        {"titles_list": ["תלמוד בבלי / ברכות"], "mode": "דפים", "units_per_day": 1},
+        {"titles_list": ["משנה / זרעים"], "mode": "משניות", "units_per_day": 2},
+    ]
+    schedules = torah_tree.build_multi_track_schedule(start, end, tracks, tree, {5})
+
+    # כל מסלול זהה ללוח שהיה מחושב עבורו בנפרד
+    for track, schedule in zip(tracks, schedules):
+        alone = torah_tree.build_study_schedule(
+            start, end, track["titles_list"], track["mode"], tree, {5}, track.get("units_per_day")
+        )
+        assert schedule.day_ordinals.tolist() == alone.day_ordinals.tolist()
+        assert schedule.day_ends.tolist() == alone.day_ends.tolist()
+
+    merged = list(torah_tree.iter_multi_track_schedule(schedules))
+    assert merged[0]["description"].count("\n") == 2
+    assert merged[-1]["date"] == max(s.last_date for s in schedules)
+    assert merged[-1]["tracks"][0] is None and merged[-1]["tracks"][2]["mode"] == "משניות"
+
+    out = torah_tree.write_multi_track_bookmark_html(
+        tracks, start, end, tree, {5}, output_path=str(tmp_path / "multi.html")
+    )
+    html = (tmp_path / "multi.html").read_text(encoding="utf-8")
+    assert out and merged[0]["tracks"][1]["description"] in html
+    assert merged[0]["tracks"][2]["description"] in html
+
+    # מסלול טווח ללא תאריך סיום אינו מושמט בשקט
+    with pytest.raises(ValueError):
+        torah_tree.build_multi_track_schedule(start, None, tracks[:2], tree, {5})
+
+    # מסלול ריק אינו נכלל בשם הקובץ ובכותרת האירוע
+    with_empty = [{"titles_list": [], "mode": "פרקים", "units_per_day": 1}, tracks[1]]
+    ics_path = torah_tree.write_multi_track_ics_file(
+        with_empty, start, end, tree, {5}, output_path=str(tmp_path / "multi.ics")
+    )
+    summary = next(
+        l for l in open(ics_path, encoding="utf-8").read().split("\n") if l.startswith("SUMMARY")
+    )
+    assert summary.strip() == "SUMMARY:סדר לימוד: ברכות"
+    filename = torah_tree._multi_track_export(start, end, with_empty, tree, {5}, False, "ics")[2]
+    assert " + " not in filename
+
+
+def test_sefaria_resolver_preloaded(torah_tree, monkeypatch):
+    import builtins
+
+    resolver = torah_tree.get_sefaria_resolver()
+    info = resolver.book_info("תלמוד בבלי / ברכות")
+    assert info["last_amud"] == (64, "a")
+
+    # אחרי הטעינה אין קריאות קבצים נוספות
+    def no_open(*args, **kwargs):
+        raise AssertionError("file opened during resolution")
+
+    first = {"book_display_name": "תלמוד בבלי / ברכות", "unit_num_int": 63, "unit_type": "דף"}
+    last = {"book_display_name": "תלמוד בבלי / שבת", "unit_num_int": 3, "unit_type": "דף"}
+    with monkeypatch.context() as m:
+        m.setattr(builtins, "open", no_open)
+        assert torah_tree.build_sefaria_ref(first, last, "דפים") == ["Berakhot.63a-64a", "Shabbat.2a-3b"]
+        assert resolver.resolve_many([first, last], "דפים") == ["Berakhot.63a", "Shabbat.3a"]
+
+    # האצווה זהה להפניה של כל יחידה בנפרד, בכל סוגי הלימוד
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    for titles, mode in [
+        (["תנך / תורה / בראשית", "תנך / תורה / שמות"], "פרקים"),
+        (["משנה / זרעים / ברכות", "משנה / זרעים / פאה"], "משניות"),
+        (["תלמוד בבלי / ברכות", "תלמוד בבלי / שבת"], "דפים"),
+        (["תלמוד בבלי / ברכות", "תלמוד בבלי / שבת"], "עמודים"),
+    ]:
+        units = torah_tree.resolve_selection(titles, tree, mode)
+        expected = [resolver.resolve(u, u, mode) for u in units]
+        assert resolver.resolve_many(units, mode) == expected and None not in expected
+
+    template = "https://example.org/{ref}?lang=he"
+    assert torah_tree.ref_links(["Berakhot.2a", "א ב"], template) == [
+        "https://example.org/Berakhot.2a?lang=he",
+        "https://example.org/%D7%90%20%D7%91?lang=he",
+    ]
+
+
+def test_coalesced_links_split_at_books(torah_tree):
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    units = torah_tree.resolve_selection(["תלמוד בבלי / ברכות", "תלמוד בבלי / שבת"], tree, "עמודים")
+    day = units[120:130]  # סוף ברכות ותחילת שבת
+    assert day.book_runs() == [(0, 4), (4, 10)]
+    assert torah_tree.coalesced_links(day, "עמודים", "{ref}") == ["Berakhot.62a-63b", "Shabbat.2a-4b"]
+
+    # יום של משניות בתוך מסכת אחת - קישור אחד במקום קישור לכל משנה
+    schedule = torah_tree.build_study_schedule(
+        date(2024, 1, 1), date(2024, 2, 1), ["משנה / זרעים / ברכות"], "משניות", tree, set()
+    )
+    day = schedule.day(0)
+    links = torah_tree.coalesced_links(day["units"], "משניות", "{ref}")
+    assert len(day["units"]) > 1 and len(links) == 1
+    assert links == torah_tree.ref_links(
+        torah_tree.build_sefaria_ref(day["first_unit"], day["last_unit"], "משניות"), "{ref}"
+    )
+
+
+def test_native_ics_writer_folds_and_escapes(torah_tree, tmp_path):
+    from datetime import date, time
+
+    line = "DESCRIPTION:" + torah_tree._ics_escape("א,ב;ג\\ד\n" + "ש" * 60)
+    assert line.startswith("DESCRIPTION:א\\,ב\\;ג\\\\ד\\nש")
+    folded = torah_tree._ics_fold(line)
+    parts = folded[:-2].split("\r\n")
+    assert len(parts) > 1 and all(len(p.encode("utf-8")) <= 75 for p in parts)
+    assert all(p.startswith(" ") for p in parts[1:])
+    assert "".join(p[1:] if i else p for i, p in enumerate(parts)) == line
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    path = torah_tree.write_ics_file(
+        ["משנה / זרעים / ברכות"],
+        "משניות",
+        date(2024, 1, 1),
+        date(2024, 1, 31),
+        tree,
+        set(),
+        alarm_time=time(8, 0),
+        output_path=str(tmp_path / "plan.ics"),
+    )
+    raw = open(path, "rb").read()
+    assert raw.startswith(b"BEGIN:VCALENDAR\r\n") and raw.endswith(b"END:VCALENDAR\r\n")
+    assert b"\n" not in raw.replace(b"\r\n", b"")
+    assert all(len(l) <= 75 for l in raw.split(b"\r\n"))
+    unfolded = raw.replace(b"\r\n ", b"").decode("utf-8").split("\r\n")
+    starts = [l for l in unfolded if l.startswith("DTSTART")]
+    assert starts[0] == "DTSTART;VALUE=DATE:20240101" and len(starts) == 31
+    assert starts == sorted(starts)
+    assert unfolded.count("BEGIN:VALARM") == 31
+
+
+def test_ics_stable_uids_and_diff_export(torah_tree, tmp_path):
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    titles = ["משנה / זרעים / ברכות"]
+
+    def events(path):
+        raw = open(path, "rb").read().replace(b"\r\n ", b"").decode("utf-8")
+        found = {}
+        for block in raw.split("BEGIN:VEVENT")[1:]:
+            props = dict(l.split(":", 1) for l in block.split("\r\n") if ":" in l)
+            found[props["DTSTART;VALUE=DATE"]] = props
+        return found
+
+    first = torah_tree.write_ics_file(
+        titles, "משניות", date(2024, 1, 1), date(2024, 1, 31), tree, set(),
+        output_path=str(tmp_path / "plan.ics"),
+    )
+    again = torah_tree.write_ics_file(
+        titles, "משניות", date(2024, 1, 1), date(2024, 1, 31), tree, set(),
+        output_path=str(tmp_path / "plan.ics"),
+    )
+    assert again == first
+    base = events(first)
+    assert len(base) == 31 and all(e["SEQUENCE"] == "0" for e in base.values())
+    assert base["20240101"]["UID"].endswith("-20240101@hspek")
+
+    # חישוב מחדש על פני פחות ימים: הימים הראשונים משתנים והאחרונים מבוטלים
+    update = torah_tree.write_ics_file(
+        titles, "משניות", date(2024, 1, 1), date(2024, 1, 20), tree, set(),
+        output_path=str(tmp_path / "update.ics"), diff_from=first,
+    )
+    diff = events(update)
+    assert 0 < len(diff) <= 31
+    assert diff["20240131"]["STATUS"] == "CANCELLED"
+    assert diff["20240131"]["UID"] == base["20240131"]["UID"]
+    assert all(e["SEQUENCE"] == "1" for e in diff.values())
+    state = torah_tree.load_ics_state(update)
+    assert state["events"]["20240131"]["cancelled"]
+    assert state["events"]["20240101"]["sequence"] == 1
+
+    # ייצוא חוזר ללא שינוי מול העדכון - קובץ השינויים ריק
+    empty = torah_tree.write_ics_file(
+        titles, "משניות", date(2024, 1, 1), date(2024, 1, 20), tree, set(),
+        output_path=str(tmp_path / "none.ics"), diff_from=update,
+    )
+    assert events(empty) == {}
+
+    # תוכניות שונות על אותו חומר אינן חולקות מזהים, אלא אם נבחר plan_id משותף
+    def uids(name, **kwargs):
+        path = torah_tree.write_ics_file(
+            titles, "משניות", date(2024, 1, 1), None, tree, set(),
+            output_path=str(tmp_path / name), **kwargs,
+        )
+        return {e["UID"] for e in events(path).values()}
+
+    one, two = uids("one.ics", units_per_day=1), uids("two.ics", units_per_day=2)
+    assert one and two and not one & two
+    assert not one & {e["UID"] for e in base.values()}
+    shared = uids("a.ics", units_per_day=1, plan_id="berakhot")
+    assert shared & uids("b.ics", units_per_day=2, plan_id="berakhot")
+
+
+def test_webcal_server_conditional_gzip_window(torah_tree):
+    import gzip
+    import threading
+    import urllib.error
+    import urllib.request
+    from datetime import date, timedelta
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    today = date.today()
+    spec = {
+        "titles_list": ["תלמוד בבלי"],
+        "mode": "דפים",
+        "start_date": today - timedelta(days=100),
+        "end_date": None,
+        "units_per_day": 1,
+    }
+    server = torah_tree.WebcalServer({"daf": spec}, tree, port=0, past_days=3, future_days=10)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def get(path, **headers):
+        request = urllib.request.Request(base + path, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, b""
+
+    try:
+        status, headers, body = get("/daf.ics", **{"Accept-Encoding": "gzip"})
+        assert status == 200 and headers["Content-Encoding"] == "gzip"
+        text = gzip.decompress(body).decode("utf-8")
+        starts = [l for l in text.split("\r\n") if l.startswith("DTSTART")]
+        assert len(starts) == 14
+        assert starts[0].endswith(f"{today - timedelta(days=3):%Y%m%d}")
+
+        status, plain_headers, plain = get("/daf.ics")
+        assert status == 200 and "Content-Encoding" not in plain_headers
+        assert plain.decode("utf-8") == text
+
+        etag, modified = headers["ETag"], headers["Last-Modified"]
+        assert etag.endswith('-gz"') and plain_headers["ETag"] == etag.replace("-gz", "")
+        assert get("/daf.ics", **{"If-None-Match": etag})[0] == 304
+        assert get("/daf.ics", **{"If-None-Match": plain_headers["ETag"]})[0] == 304
+        assert get("/daf.ics", **{"If-None-Match": '"other"'})[0] == 200
+        assert get("/daf.ics", **{"If-Modified-Since": modified})[0] == 304
+        assert get("/missing.ics")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # חלון שזז ביום קדימה משנה את התוכן ואת ה-ETag
+    feed = server.feeds["daf"]
+    before = feed.snapshot
+    after = feed.refresh(today + timedelta(days=1))
+    assert after is feed.snapshot and after.gzip_etag != etag
+    assert before.gzip_etag == etag and before.body == plain  # גרסה קודמת אינה משתנה
+
+    # הגדרה שגויה נכשלת ביצירת השרת; כשל בזמן ריצה מוחזר כ-500
+    with pytest.raises(ValueError, match="bad"):
+        torah_tree.WebcalServer({"bad": dict(spec, cycle_anchor=today, units_per_day=None)}, tree, port=0)
+    server = torah_tree.WebcalServer({"daf": spec}, tree, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def broken(today=None):
+        raise FileNotFoundError("sefaria_masechet_map.json")
+
+    server.feeds["daf"].refresh = broken
+    try:
+        assert get("/daf.ics")[0] == 500
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_webcal_feed_state_survives_restart(torah_tree, tmp_path):
+    from datetime import date, time, timedelta
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    today = date.today()
+    spec = {
+        "titles_list": ["משנה / זרעים / ברכות"],
+        "mode": "משניות",
+        "start_date": today - timedelta(days=5),
+        "end_date": None,
+        "units_per_day": 2,
+    }
+    server = torah_tree.WebcalServer(
+        {"ברכות": spec}, tree, port=0, past_days=3, future_days=5, state_dir=str(tmp_path)
+    )
+    server.server_close()
+    feed = server.feeds["ברכות"].snapshot
+    state_path = server.feeds["ברכות"].state_path
+    assert (tmp_path / "%D7%91%D7%A8%D7%9B%D7%95%D7%AA.state.json").exists()
+
+    # "הפעלה מחדש": גוף זהה, אותו ETag ואותו Last-Modified
+    restarted = torah_tree.WebcalFeed(spec, tree, 3, 5, state_path).refresh()
+    assert restarted.body == feed.body and restarted.etag == feed.etag
+    assert restarted.last_modified == feed.last_modified
+
+    # שינוי בתוכן אחרי ההפעלה מחדש ממשיך את מספרי הגרסה
+    changed = torah_tree.WebcalFeed(dict(spec, alarm_time=time(7, 0)), tree, 3, 5, state_path)
+    changed = changed.refresh()
+    assert b"SEQUENCE:0" in feed.body and b"SEQUENCE:0" not in changed.body
+    assert b"SEQUENCE:1" in changed.body
+
+
+def test_ics_diff_after_reschedule_keeps_plan_uids(torah_tree, tmp_path):
+    from datetime import date
+
+    tree = torah_tree.load_data("torah_tree_data_full.json")
+    titles, mode = ["משנה / זרעים / ברכות"], "משניות"
+    start, end, pivot = date(2024, 1, 1), date(2024, 3, 1), date(2024, 2, 1)
+
+    def events(path):
+        raw = open(path, "rb").read().replace(b"\r\n ", b"").decode("utf-8")
+        found = {}
+        for block in raw.split("BEGIN:VEVENT")[1:]:
+            props = dict(l.split(":", 1) for l in block.split("\r\n") if ":" in l)
+            found[props["DTSTART;VALUE=DATE"]] = props
+        return found
+
+    schedule = torah_tree.build_study_schedule(start, end, titles, mode, tree, {5})
+    old = torah_tree.write_ics_file(
+        titles, mode, start, end, tree, {5}, output_path=str(tmp_path / "old.ics")
+    )
+    base = events(old)
+
+    # שינוי ימי המנוחה מ-pivot: ימי שני יוצאים מהלוח
+    updated = torah_tree.reschedule_study_schedule(
+        schedule, pivot, end_date=end, no_study_weekdays={0, 5}
+    )
+    update = torah_tree.write_ics_file(
+        titles, mode, start, end, tree, {0, 5}, schedule=updated,
+        output_path=str(tmp_path / "update.ics"), diff_from=old,
+    )
+    diff = events(update)
+    prefix = next(iter(base.values()))["UID"].split("-")[0]
+    assert diff and all(e["UID"].startswith(prefix + "-") for e in diff.values())
+    assert all(key >= f"{pivot:%Y%m%d}" for key in diff)
+    cancelled = [key for key, e in diff.items() if e.get("STATUS") == "CANCELLED"]
+    assert cancelled and all(date(int(k[:4]), int(k[4:6]), int(k[6:])).weekday() == 0 for k in cancelled)
+    assert all(key in base for key in cancelled)
+
+    # plan_id מפורש שאינו תואם, או ייצוא קודם ללא קובץ מצב - שגיאה ולא עדכון "מלא"
+    with pytest.raises(ValueError):
+        torah_tree.write_ics_file(
+            titles, mode, start, end, tree, {0, 5}, schedule=updated,
+            output_path=str(tmp_path / "other.ics"), diff_from=old, plan_id="other",
+        )
+    with pytest.raises(ValueError):
+        torah_tree.write_ics_file(
+            titles, mode, start, end, tree, {5},
+            output_path=str(tmp_path / "x.ics"), diff_from=str(tmp_path / "missing.ics"),
+        )
@@ -1,14 +1,28 @@
-from datetime import date, timedelta, datetime, time
-from ics import Calendar, Event, DisplayAlarm
+from datetime import date, timedelta, datetime, time, timezone
+import gzip
+import io
 import json
+import hashlib
+import importlib.metadata
+import itertools
 import os
 import sys
 import re
-from urllib.parse import quote_plus, quote
+import math
+import threading
+from urllib.parse import quote_plus, quote, unquote, urlsplit
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
+import numpy as np
 from pyluach import dates, hebrewcal, parshios
 from jinja2 import Environment, FileSystemLoader
-from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import NamedTuple
+from bisect import bisect_left, bisect_right
 
 # כתובת ברירת מחדל לפתיחת חומר הלימוד היומי
 # {ref} מוחלף בהפניה המדויקת בספריא (לדוגמה "בראשית.א-ב")
@@ -237,20 +251,150 @@ HEBREW_MONTH_NAMES = [
 ]
 
 
+# ==================== מנוע לוח עברי וקטורי ====================
+# חישוב אריתמטי טהור של הלוח העברי (מולד ודחיות) על מערכי NumPy שלמים.
+# התאריכים הגרגוריאניים מיוצגים כ-ordinals של פייתון (date.toordinal()).
+
+# ה-ordinal של א' בתשרי שנת א' לבריאת העולם (ללא דחיות)
+HEBREW_EPOCH_ORDINAL = -1373427
+# אורך השנה העברית הממוצעת בימים (235 חודשים ב-19 שנים)
+_MEAN_HEBREW_YEAR = 35975351 / 98496
+
+
+def _build_hebrew_year_type_tables():
+    """
+    בונה טבלאות עזר לששת סוגי השנים העבריות (353-355 ו-383-385 ימים).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]:
+            - month_starts[type, pos]: היום בשנה (מ-0) בו מתחיל החודש ה-pos מתשרי.
+            - month_order[type, pos]: מספר החודש לפי pyluach (ניסן=1) במיקום pos.
+            - month_pos[type, month]: המיקום מתשרי של חודש לפי מספרו.
+    """
+    padding = 10**6  # ערך גבוה לעמודת החודש ה-13 בשנה פשוטה
+    month_starts = np.full((6, 13), padding, dtype=np.int64)
+    month_order = np.zeros((6, 13), dtype=np.int64)
+    month_pos = np.full((6, 14), -1, dtype=np.int64)
+    for type_idx, year_length in enumerate((353, 354, 355, 383, 384, 385)):
+        leap = year_length > 380
+        heshvan = 30 if year_length % 10 == 5 else 29
+        kislev = 29 if year_length % 10 == 3 else 30
+        months = [(7, 30), (8, heshvan), (9, kislev), (10, 29), (11, 30)]
+        months += [(12, 30), (13, 29)] if leap else [(12, 29)]
+        months += [(1, 30), (2, 29), (3, 30), (4, 29), (5, 30), (6, 29)]
+        start = 0
+        for pos, (month, length) in enumerate(months):
+            month_starts[type_idx, pos] = start
+            month_order[type_idx, pos] = month
+            month_pos[type_idx, month] = pos
+            start += length
+    return month_starts, month_order, month_pos
+
+
+_HEBREW_MONTH_STARTS, _HEBREW_MONTH_ORDER, _HEBREW_MONTH_POS = (
+    _build_hebrew_year_type_tables()
+)
+
+
+def _hebrew_elapsed_days(years):
+    """מספר הימים מהמולד הראשון ועד ראש השנה של כל שנה (לאחר דחיית לא אד"ו ומולד זקן)."""
+    years = np.asarray(years, dtype=np.int64)
+    months_elapsed = (235 * years - 234) // 19
+    parts_elapsed = 12084 + 13753 * months_elapsed
+    days = 29 * months_elapsed + parts_elapsed // 25920
+    return np.where((3 * (days + 1)) % 7 < 3, days + 1, days)
+
+
+def hebrew_new_year_ordinals(years):
+    """
+    מחזיר את ה-ordinal של א' בתשרי עבור מערך של שנים עבריות.
+
+    כולל את הדחיות הנובעות מאורך השנה (גטר"ד ובטו תקפט).
+    """
+    years = np.asarray(years, dtype=np.int64)
+    previous = _hebrew_elapsed_days(years - 1)
+    current = _hebrew_elapsed_days(years)
+    following = _hebrew_elapsed_days(years + 1)
+    correction = np.where(
+        following - current == 356, 2, np.where(current - previous == 382, 1, 0)
+    )
+    return HEBREW_EPOCH_ORDINAL + current + correction
+
+
+def _hebrew_year_type(year_lengths):
+    """ממפה אורך שנה (353-355, 383-385) לאינדקס סוג שנה 0-5."""
+    return (year_lengths > 380) * 3 + (year_lengths % 10 - 3)
+
+
+def ordinals_to_hebrew(ordinals):
+    """
+    ממיר מערך ordinals גרגוריאניים לתאריכים עבריים במעבר וקטורי אחד.
+
+    Args:
+        ordinals (array-like): ordinals של פייתון (``date.toordinal()``).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: שנים, חודשים (ניסן=1) וימים.
+    """
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    approx = np.floor((ordinals - HEBREW_EPOCH_ORDINAL) / _MEAN_HEBREW_YEAR).astype(
+        np.int64
+    ) + 1
+    # השנה האמיתית היא approx-1, approx או approx+1
+    years = (
+        approx
+        - 1
+        + (hebrew_new_year_ordinals(approx) <= ordinals)
+        + (hebrew_new_year_ordinals(approx + 1) <= ordinals)
+    )
+    new_years = hebrew_new_year_ordinals(years)
+    year_types = _hebrew_year_type(hebrew_new_year_ordinals(years + 1) - new_years)
+    day_of_year = ordinals - new_years
+    starts = _HEBREW_MONTH_STARTS[year_types]
+    positions = (day_of_year[..., None] >= starts).sum(axis=-1) - 1
+    months = np.take_along_axis(
+        _HEBREW_MONTH_ORDER[year_types], positions[..., None], axis=-1
+    )[..., 0]
+    month_starts = np.take_along_axis(starts, positions[..., None], axis=-1)[..., 0]
+    return years, months, day_of_year - month_starts + 1
+
+
+def hebrew_to_ordinals(years, months, days):
+    """
+    ממיר מערכים של תאריכים עבריים (שנה, חודש לפי pyluach, יום) ל-ordinals גרגוריאניים.
+
+    Returns:
+        np.ndarray: ordinals של פייתון.
+    """
+    years, months, days = (np.asarray(a, dtype=np.int64) for a in (years, months, days))
+    new_years = hebrew_new_year_ordinals(years)
+    year_types = _hebrew_year_type(hebrew_new_year_ordinals(years + 1) - new_years)
+    positions = _HEBREW_MONTH_POS[year_types, months]
+    return new_years + _HEBREW_MONTH_STARTS[year_types, positions] + days - 1
+
+
+def hebrew_to_date(hebrew_year: int, month: int, day: int) -> date:
+    """ממיר תאריך עברי בודד לתאריך גרגוריאני בעזרת המנוע הווקטורי."""
+    return date.fromordinal(int(hebrew_to_ordinals(hebrew_year, month, day)))
+
+
+def date_to_hebrew(gregorian_date: date) -> tuple[int, int, int]:
+    """ממיר תאריך גרגוריאני בודד ל-(שנה, חודש, יום) עבריים בעזרת המנוע הווקטורי."""
+    years, months, days = ordinals_to_hebrew(gregorian_date.toordinal())
+    return int(years), int(months), int(days)
+
+
 # ==================== פונקציות עזר לחגים לאומיים ====================
-def get_israeli_national_holiday_on_gregorian_date(
-    gregorian_date_to_check: date, hebrew_year: int
-) -> str | None:
+def _israeli_national_holidays(hebrew_year: int) -> dict[date, str]:
     """
-    בודק האם תאריך גרגוריאני נתון הוא יום הזיכרון, יום העצמאות או יום ירושלים
-    בשנה עברית מסוימת, תוך התחשבות בדחיות.
+    מחשב את התאריכים הגרגוריאניים של יום הזיכרון, יום העצמאות ויום ירושלים
+    בשנה עברית נתונה, תוך התחשבות בדחיות.
 
     Args:
-        gregorian_date_to_check (date): התאריך הגרגוריאני לבדיקה.
-        hebrew_year (int): השנה העברית לבדיקת החגים.
+        hebrew_year (int): השנה העברית לחישוב החגים.
 
     Returns:
-        str | None: שם החג אם הוא חל בתאריך הנתון, אחרת None.
+        dict[date, str]: מיפוי מתאריך גרגוריאני לשם החג החל בו.
     """
 
     # --- יום הזיכרון ויום העצמאות ---
@@ -258,75 +402,471 @@ def get_israeli_national_holiday_on_gregorian_date(
     # חודש אייר הוא החודש השני לפי ספירת חודשי השנה של pyluach (ניסן=1)
 
     # קביעת ה' באייר המקורי
-    hd_iyar_5_original = dates.HebrewDate(hebrew_year, 2, 5)
-    gd_iyar_5_original = hd_iyar_5_original.to_pydate()
+    gd_iyar_5_original = hebrew_to_date(hebrew_year, 2, 5)
     weekday_iyar_5_original = (
         gd_iyar_5_original.weekday()
     )  # שני=0, שלישי=1 ... שישי=4, שבת=5, ראשון=6
 
-    actual_hd_yom_haatzmaut = hd_iyar_5_original
-
-    # כללי דחייה/הקדמה ליום העצמאות:
+    # כללי דחייה/הקדמה ליום העצמאות (הפרש בימים מה' באייר):
     if weekday_iyar_5_original == 4:  # אם ה' באייר הוא יום שישי
         # יום העצמאות מוקדם ליום חמישי, ד' באייר
-        actual_hd_yom_haatzmaut = dates.HebrewDate(hebrew_year, 2, 4)
+        shift = -1
     elif weekday_iyar_5_original == 5:  # אם ה' באייר הוא שבת
         # יום העצמאות מוקדם ליום חמישי, ג' באייר
-        actual_hd_yom_haatzmaut = dates.HebrewDate(hebrew_year, 2, 3)
+        shift = -2
     elif (
         weekday_iyar_5_original == 0
     ):  # אם ה' באייר הוא יום שני (כלומר ד' באייר, יום הזיכרון המקורי, הוא ראשון)
         # יום העצמאות נדחה ליום שלישי, ו' באייר (כדי למנוע חילול שבת בהכנות ליום הזיכרון)
-        actual_hd_yom_haatzmaut = dates.HebrewDate(hebrew_year, 2, 6)
+        shift = 1
+    else:
+        shift = 0
 
     # חישוב התאריך הגרגוריאני הסופי של יום העצמאות ויום הזיכרון
-    actual_gd_yom_haatzmaut = actual_hd_yom_haatzmaut.to_pydate()
+    actual_gd_yom_haatzmaut = gd_iyar_5_original + timedelta(days=shift)
     actual_gd_yom_hazikaron = actual_gd_yom_haatzmaut - timedelta(days=1)
 
-    if gregorian_date_to_check == actual_gd_yom_hazikaron:
-        return "יום הזיכרון"
-    if gregorian_date_to_check == actual_gd_yom_haatzmaut:
-        return "יום העצמאות"
-
     # --- יום ירושלים ---
-    # יום ירושלים חל במקור בכ"ח באייר
-    hd_iyar_28_original = dates.HebrewDate(hebrew_year, 2, 28)
-    gd_iyar_28_original = hd_iyar_28_original.to_pydate()
+    # יום ירושלים חל במקור בכ"ח באייר, 23 ימים אחרי ה' באייר
+    gd_iyar_28_original = gd_iyar_5_original + timedelta(days=23)
     weekday_iyar_28_original = gd_iyar_28_original.weekday()
 
-    actual_hd_yom_yerushalayim = hd_iyar_28_original
-
     # כללי דחייה/הקדמה ליום ירושלים:
     if weekday_iyar_28_original == 4:  # אם כ"ח באייר הוא יום שישי
         # יום ירושלים מוקדם ליום חמישי, כ"ז באייר
-        actual_hd_yom_yerushalayim = dates.HebrewDate(hebrew_year, 2, 27)
+        actual_gd_yom_yerushalayim = gd_iyar_28_original - timedelta(days=1)
     elif weekday_iyar_28_original == 5:  # אם כ"ח באייר הוא שבת
         # יום ירושלים נדחה ליום ראשון, כ"ט באייר (לפי הנוהג המקובל)
-        actual_hd_yom_yerushalayim = dates.HebrewDate(hebrew_year, 2, 29)
+        actual_gd_yom_yerushalayim = gd_iyar_28_original + timedelta(days=1)
+    else:
+        actual_gd_yom_yerushalayim = gd_iyar_28_original
+
+    return {
+        actual_gd_yom_hazikaron: "יום הזיכרון",
+        actual_gd_yom_haatzmaut: "יום העצמאות",
+        actual_gd_yom_yerushalayim: "יום ירושלים",
+    }
 
-    actual_gd_yom_yerushalayim = actual_hd_yom_yerushalayim.to_pydate()
-    if gregorian_date_to_check == actual_gd_yom_yerushalayim:
-        return "יום ירושלים"
 
-    return None
+def get_israeli_national_holiday_on_gregorian_date(
+    gregorian_date_to_check: date, hebrew_year: int
+) -> str | None:
+    """
+    בודק האם תאריך גרגוריאני נתון הוא יום הזיכרון, יום העצמאות או יום ירושלים
+    בשנה עברית מסוימת, תוך התחשבות בדחיות.
+
+    Args:
+        gregorian_date_to_check (date): התאריך הגרגוריאני לבדיקה.
+        hebrew_year (int): השנה העברית לבדיקת החגים.
+
+    Returns:
+        str | None: שם החג אם הוא חל בתאריך הנתון, אחרת None.
+    """
+    return _israeli_national_holidays(hebrew_year).get(gregorian_date_to_check)
+
+
+# ==================== טבלת חגים ופרשות ====================
+# טבלה קומפקטית של חגים ופרשות השבוע, הנבנית פעם אחת ונשמרת ליד קובץ הנתונים
+CALENDAR_TABLE_FILE = "hebrew_calendar_table.json"
+CALENDAR_TABLE_VERSION = 1
+CALENDAR_TABLE_FIRST_YEAR = 5780
+CALENDAR_TABLE_LAST_YEAR = 5900
+
+
+def _pyluach_version() -> str:
+    """מחזיר את גרסת pyluach המותקנת (משמשת לאימות הטבלה השמורה)."""
+    try:
+        return importlib.metadata.version("pyluach")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _hebrew_year_bounds(hebrew_year: int) -> tuple[int, int]:
+    """מחזיר את ה-ordinal של א' בתשרי בשנה הנתונה ושל היום האחרון בה."""
+    first, following = hebrew_new_year_ordinals([hebrew_year, hebrew_year + 1])
+    return int(first), int(following) - 1
+
+
+def _compute_year_holidays(hebrew_year: int) -> dict[int, str]:
+    """
+    מחשב בעזרת pyluach את כל ימי החג בשנה עברית אחת.
+
+    Returns:
+        dict[int, str]: מיפוי מ-ordinal לשם החג (חג רגיל וחג לאומי מופרדים בפסיק).
+    """
+    first, last = _hebrew_year_bounds(hebrew_year)
+    national = _israeli_national_holidays(hebrew_year)
+    h_d = dates.HebrewDate(hebrew_year, 7, 1)
+    labels = {}
+    for ordinal in range(first, last + 1):
+        holiday_parts = []
+        regular_holiday = h_d.holiday(hebrew=True, israel=True)
+        if regular_holiday:
+            holiday_parts.append(regular_holiday)
+        national_holiday = national.get(date.fromordinal(ordinal))
+        if national_holiday:
+            holiday_parts.append(national_holiday)
+        if holiday_parts:
+            labels[ordinal] = ", ".join(holiday_parts)
+        h_d = h_d + 1
+    return labels
+
+
+def _compute_year_parshiyot(hebrew_year: int) -> dict[int, str]:
+    """
+    מחשב בעזרת pyluach את פרשת השבוע (מנהג ארץ ישראל) לכל שבת בשנה עברית.
+
+    Returns:
+        dict[int, str]: מיפוי מ-ordinal של שבת לשם הפרשה. שבתות ללא פרשה אינן נכללות.
+    """
+    first, last = _hebrew_year_bounds(hebrew_year)
+    # השבת הראשונה בשנה (weekday() של שבת הוא 5)
+    first_shabbat = first + (5 - date.fromordinal(first).weekday()) % 7
+    parshiyot = {}
+    for ordinal in range(first_shabbat, last + 1, 7):
+        parsha = parshios.getparsha_string(
+            dates.GregorianDate.from_pydate(date.fromordinal(ordinal)),
+            hebrew=True,
+            israel=True,
+        )
+        if parsha:
+            parshiyot[ordinal] = parsha
+    return parshiyot
+
+
+def _delta_encode(ordinals_to_labels: dict[int, str], label_ids: dict[str, int]):
+    """מקודד מיפוי ordinal->תווית כרשימת הפרשים ורשימת מזהי תוויות."""
+    deltas, ids = [], []
+    previous = 0
+    for ordinal in sorted(ordinals_to_labels):
+        deltas.append(ordinal - previous)
+        ids.append(label_ids.setdefault(ordinals_to_labels[ordinal], len(label_ids)))
+        previous = ordinal
+    return deltas, ids
+
+
+def _calendar_table_hash(payload: dict) -> str:
+    """מחשב גיבוב SHA-256 של תוכן הטבלה (ללא שדה הגיבוב עצמו)."""
+    content = {k: v for k, v in payload.items() if k != "hash"}
+    raw = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def build_calendar_table(
+    first_year: int = CALENDAR_TABLE_FIRST_YEAR, last_year: int = CALENDAR_TABLE_LAST_YEAR
+) -> dict:
+    """
+    בונה את טבלת החגים והפרשות עבור טווח שנים עבריות (כולל).
+
+    Returns:
+        dict: תוכן הטבלה, מוכן לשמירה כ-JSON.
+    """
+    first_ordinal, _ = _hebrew_year_bounds(first_year)
+    year_lengths = []
+    holidays, parshiyot = {}, {}
+    for hebrew_year in range(first_year, last_year + 1):
+        first, last = _hebrew_year_bounds(hebrew_year)
+        year_lengths.append(last - first + 1)
+        holidays.update(_compute_year_holidays(hebrew_year))
+        parshiyot.update(_compute_year_parshiyot(hebrew_year))
+
+    label_ids = {}
+    holiday_deltas, holiday_labels = _delta_encode(holidays, label_ids)
+    parsha_deltas, parsha_labels = _delta_encode(parshiyot, label_ids)
+    payload = {
+        "version": CALENDAR_TABLE_VERSION,
+        "pyluach_version": _pyluach_version(),
+        "first_year": first_year,
+        "last_year": last_year,
+        "first_ordinal": first_ordinal,
+        "year_lengths": year_lengths,
+        "labels": list(label_ids),
+        "holiday_deltas": holiday_deltas,
+        "holiday_labels": holiday_labels,
+        "parsha_deltas": parsha_deltas,
+        "parsha_labels": parsha_labels,
+    }
+    payload["hash"] = _calendar_table_hash(payload)
+    return payload
+
+
+class HebrewCalendarTable:
+    """
+    טבלת חגים ופרשות טעונה לזיכרון.
+
+    ממפה ordinals של ימים לשמות חגים ו-ordinals של שבתות לשמות פרשות,
+    וכן מאפשרת לאתר את השנה העברית של יום בלי המרת תאריך.
+    """
+
+    def __init__(self, payload: dict):
+        self.first_year = payload["first_year"]
+        self.last_year = payload["last_year"]
+        # year_starts[i] = ordinal של א' בתשרי בשנה first_year + i (כולל השנה שאחרי האחרונה)
+        self.year_starts = [payload["first_ordinal"]]
+        for length in payload["year_lengths"]:
+            self.year_starts.append(self.year_starts[-1] + length)
+        labels = payload["labels"]
+        self.holiday_ordinals = list(
+            itertools.accumulate(payload["holiday_deltas"])
+        )
+        self.holidays = {
+            o: labels[i]
+            for o, i in zip(self.holiday_ordinals, payload["holiday_labels"])
+        }
+        self.parshiyot = {
+            o: labels[i]
+            for o, i in zip(
+                itertools.accumulate(payload["parsha_deltas"]), payload["parsha_labels"]
+            )
+        }
+
+    def covers_year(self, hebrew_year: int) -> bool:
+        return self.first_year <= hebrew_year <= self.last_year
+
+    def covers_ordinal(self, ordinal: int) -> bool:
+        return self.year_starts[0] <= ordinal < self.year_starts[-1]
+
+    def year_of(self, ordinal: int) -> int:
+        """מחזיר את השנה העברית של ordinal הנמצא בטווח הטבלה."""
+        return self.first_year + bisect_right(self.year_starts, ordinal) - 1
+
+    def year_bounds(self, hebrew_year: int) -> tuple[int, int]:
+        """מחזיר את ה-ordinal של היום הראשון והאחרון בשנה עברית שבטווח הטבלה."""
+        i = hebrew_year - self.first_year
+        return self.year_starts[i], self.year_starts[i + 1] - 1
+
+    def holidays_between(self, start_ordinal: int, end_ordinal: int) -> dict[int, str]:
+        """מחזיר את ימי החג בטווח ordinals (כולל) כמיפוי ordinal->שם החג."""
+        lo = bisect_left(self.holiday_ordinals, start_ordinal)
+        hi = bisect_right(self.holiday_ordinals, end_ordinal)
+        return {o: self.holidays[o] for o in self.holiday_ordinals[lo:hi]}
+
+    def parsha(self, ordinal: int) -> str:
+        """מחזיר את שם הפרשה בשבת הנתונה, או מחרוזת ריקה."""
+        return self.parshiyot.get(ordinal, "")
+
+
+def _is_valid_calendar_table(payload, first_year, last_year) -> bool:
+    """בודק שהטבלה השמורה תואמת לגרסה, לטווח השנים ול-pyluach המותקן."""
+    return (
+        isinstance(payload, dict)
+        and payload.get("version") == CALENDAR_TABLE_VERSION
+        and payload.get("pyluach_version") == _pyluach_version()
+        and payload.get("first_year") == first_year
+        and payload.get("last_year") == last_year
+        and payload.get("hash") == _calendar_table_hash(payload)
+    )
+
+
+def read_calendar_table(
+    path: str = CALENDAR_TABLE_FILE,
+    first_year: int = CALENDAR_TABLE_FIRST_YEAR,
+    last_year: int = CALENDAR_TABLE_LAST_YEAR,
+) -> HebrewCalendarTable:
+    """
+    קורא את טבלת החגים והפרשות מהדיסק, ובונה ושומר אותה אם היא חסרה או אינה תקפה.
+
+    Args:
+        path (str, optional): שם קובץ הטבלה (ליד קובץ נתוני העץ).
+        first_year (int, optional): השנה העברית הראשונה בטבלה.
+        last_year (int, optional): השנה העברית האחרונה בטבלה.
+
+    Returns:
+        HebrewCalendarTable: הטבלה הטעונה.
+    """
+    full_path = resource_path(path)
+    payload = None
+    try:
+        with open(full_path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        payload = None
+
+    if not _is_valid_calendar_table(payload, first_year, last_year):
+        payload = build_calendar_table(first_year, last_year)
+        try:
+            with open(full_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        except OSError as e:
+            # אם אין הרשאת כתיבה נמשיך עם הטבלה שבזיכרון
+            print(f"אזהרה: לא ניתן לשמור את טבלת החגים: {e}")
+
+    return HebrewCalendarTable(payload)
+
+
+CALENDAR_TABLE_CACHE = None
+
+
+def load_calendar_table() -> HebrewCalendarTable:
+    """טוען פעם אחת את טבלת החגים והפרשות של ברירת המחדל ושומר אותה במטמון."""
+    global CALENDAR_TABLE_CACHE
+    if CALENDAR_TABLE_CACHE is None:
+        CALENDAR_TABLE_CACHE = read_calendar_table()
+    return CALENDAR_TABLE_CACHE
+
+
+# ==================== אינדקס חגים ====================
+class HolidayIndex:
+    """
+    אינדקס חגים המחושב פעם אחת לכל שנה עברית.
+
+    עבור כל שנה עברית נשמרים כל התאריכים שבהם חל חג או מועד (חגים רגילים
+    לפי pyluach וחגים לאומיים), כך שבדיקת חג היא חיפוש במילון ושאילתות טווח
+    הן חיפוש בינארי ברשימה ממוינת. שנים המכוסות על ידי טבלת החגים השמורה
+    נקראות ממנה, ורק שנים מחוץ לטווח הטבלה מחושבות בעזרת pyluach.
+    """
+
+    def __init__(self, table: HebrewCalendarTable | None = None):
+        """
+        Args:
+            table (HebrewCalendarTable, optional): טבלת חגים ופרשות.
+                אם לא הועברה, תיטען טבלת ברירת המחדל בשימוש הראשון.
+        """
+        self._table = table
+        self._labels = {}  # ordinal -> שם החג (חגים רגילים ולאומיים מופרדים בפסיק)
+        self._sorted_ordinals = []  # כל ימי החג בשנים שנטענו, ממוינים
+        self._years = set()  # השנים העבריות שכבר נטענו
+        self._min_ordinal = None  # ordinal של היום הראשון בטווח השנים שנטען
+        self._max_ordinal = None  # ordinal של היום האחרון בטווח השנים שנטען
+
+    @property
+    def table(self) -> HebrewCalendarTable:
+        if self._table is None:
+            self._table = load_calendar_table()
+        return self._table
+
+    def _year_of(self, ordinal: int) -> int:
+        """מחזיר את השנה העברית של ordinal, מהטבלה אם אפשר."""
+        if self.table.covers_ordinal(ordinal):
+            return self.table.year_of(ordinal)
+        return date_to_hebrew(date.fromordinal(ordinal))[0]
+
+    def _load_year(self, hebrew_year: int):
+        """טוען את כל ימי החג בשנה עברית אחת לאינדקס."""
+        if hebrew_year in self._years:
+            return
+        if self.table.covers_year(hebrew_year):
+            first, last = self.table.year_bounds(hebrew_year)
+            year_labels = self.table.holidays_between(first, last)
+        else:
+            first, last = _hebrew_year_bounds(hebrew_year)
+            year_labels = _compute_year_holidays(hebrew_year)
+        self._labels.update(year_labels)
+        self._years.add(hebrew_year)
+        self._sorted_ordinals = sorted(self._sorted_ordinals + list(year_labels))
+        if self._min_ordinal is None or first < self._min_ordinal:
+            self._min_ordinal = first
+        if self._max_ordinal is None or last > self._max_ordinal:
+            self._max_ordinal = last
+
+    def _ensure_range(self, start_ordinal: int, end_ordinal: int):
+        """מוודא שכל השנים העבריות המכסות את טווח ה-ordinals טעונות באינדקס."""
+        if (
+            self._min_ordinal is not None
+            and self._min_ordinal <= start_ordinal
+            and end_ordinal <= self._max_ordinal
+        ):
+            return
+        first_year = self._year_of(start_ordinal)
+        last_year = self._year_of(end_ordinal)
+        if self._years:
+            # שומרים על טווח שנים רציף כדי שבדיקת הכיסוי תישאר השוואה פשוטה
+            first_year = min(first_year, min(self._years))
+            last_year = max(last_year, max(self._years))
+        for hebrew_year in range(first_year, last_year + 1):
+            self._load_year(hebrew_year)
+
+    def __contains__(self, gregorian_date: date) -> bool:
+        ordinal = gregorian_date.toordinal()
+        self._ensure_range(ordinal, ordinal)
+        return ordinal in self._labels
+
+    def label(self, gregorian_date: date) -> str:
+        """מחזיר את שם החג בתאריך הנתון, או מחרוזת ריקה אם אינו חג."""
+        ordinal = gregorian_date.toordinal()
+        self._ensure_range(ordinal, ordinal)
+        return self._labels.get(ordinal, "")
+
+    def parsha(self, gregorian_date: date) -> str:
+        """מחזיר את פרשת השבוע בשבת הנתונה (מנהג ארץ ישראל), או מחרוזת ריקה."""
+        if gregorian_date.weekday() != 5:
+            return ""
+        ordinal = gregorian_date.toordinal()
+        if self.table.covers_ordinal(ordinal):
+            return self.table.parsha(ordinal)
+        return (
+            parshios.getparsha_string(
+                dates.GregorianDate.from_pydate(gregorian_date), hebrew=True, israel=True
+            )
+            or ""
+        )
+
+    def holiday_ordinals_between(self, start_date: date, end_date: date) -> list[int]:
+        """מחזיר רשימה ממוינת של ordinals של ימי חג בטווח (כולל שני הקצוות)."""
+        start_ordinal, end_ordinal = start_date.toordinal(), end_date.toordinal()
+        if start_ordinal > end_ordinal:
+            return []
+        self._ensure_range(start_ordinal, end_ordinal)
+        lo = bisect_left(self._sorted_ordinals, start_ordinal)
+        hi = bisect_right(self._sorted_ordinals, end_ordinal)
+        return self._sorted_ordinals[lo:hi]
+
+    def holidays_between(self, start_date: date, end_date: date) -> list[date]:
+        """מחזיר את כל ימי החג בטווח התאריכים (כולל שני הקצוות)."""
+        return [
+            date.fromordinal(o)
+            for o in self.holiday_ordinals_between(start_date, end_date)
+        ]
+
+    def count_between(self, start_date: date, end_date: date) -> int:
+        """מחזיר את מספר ימי החג בטווח התאריכים (כולל שני הקצוות)."""
+        return len(self.holiday_ordinals_between(start_date, end_date))
+
+
+HOLIDAY_INDEX = HolidayIndex()
 
 
 # ==================== בדיקת חגים ====================
 def is_holiday(gregorian_date: date) -> bool:
     """בודק אם תאריך גרגוריאני כלשהו הוא חג או מועד ישראלי (לא כולל שבת)."""
-    g_date = dates.GregorianDate(
-        gregorian_date.year, gregorian_date.month, gregorian_date.day
+    return gregorian_date in HOLIDAY_INDEX
+
+
+# ==================== מחרוזות תאריך עברי ====================
+@lru_cache(maxsize=None)
+def hebrew_day_string(day: int) -> str:
+    """מחזיר את יום החודש באותיות עבריות (למשל א׳, ט״ו)."""
+    return dates.HebrewDate(5785, 7, day).hebrew_day()
+
+
+@lru_cache(maxsize=None)
+def hebrew_month_name(hebrew_year: int, month: int) -> str:
+    """מחזיר את שם החודש העברי (למשל אדר א׳ בשנה מעוברת)."""
+    return hebrewcal.Month(hebrew_year, month).month_name(True)
+
+
+@lru_cache(maxsize=None)
+def hebrew_year_string(hebrew_year: int) -> str:
+    """מחזיר את השנה העברית באותיות כולל האלפים (למשל ה׳תשפ״ה)."""
+    return dates.HebrewDate(hebrew_year, 7, 1).hebrew_year(True)
+
+
+@lru_cache(maxsize=4096)
+def hebrew_date_string(hebrew_year: int, month: int, day: int) -> str:
+    """מחזיר את התאריך העברי המלא, זהה ל-``HebrewDate.hebrew_date_string(True)``."""
+    return (
+        f"{hebrew_day_string(day)} {hebrew_month_name(hebrew_year, month)} "
+        f"{hebrew_year_string(hebrew_year)}"
     )
-    h_d = g_date.to_heb()
-    regular_holiday = h_d.holiday(hebrew=True, israel=True)
-    national = get_israeli_national_holiday_on_gregorian_date(gregorian_date, h_d.year)
-    return bool(regular_holiday or national)
 
 
 # ==================== כלי עזר ====================
 def load_data(path):
     """
     טוען נתונים מקובץ JSON.
+    העץ מהודר מיד לאינדקס שטוח (ראו get_tree_index) כדי שהאוספים והממשק
+    לא יצטרכו לנווט שוב במילון המקונן. כאשר אין צורך במילון עצמו, עדיף
+    load_tree_index שמדלג על פענוח ה-JSON בעזרת הקובץ המהודר.
 
     Args:
         path (str): הנתיב לקובץ ה-JSON.
@@ -335,7 +875,9 @@ def load_data(path):
         dict: מילון המכיל את נתוני ה-JSON, או None אם הקובץ לא נמצא או שיש שגיאה בטעינה.
     """
     with open(resource_path(path), encoding="utf-8") as f:
-        return json.load(f)
+        tree_data = json.load(f)
+    get_tree_index(tree_data)
+    return tree_data
 
 
 def has_relevant_data_recursive(node, mode):
@@ -421,230 +963,741 @@ def get_length_from_node(node, mode):
     return total
 
 
-def calculate_study_days(start_date, end_date, no_study_weekdays, skip_holidays=False):
-    """
-    מחשב את מספר ימי הלימוד הפנויים בטווח תאריכים נתון,
-    בניכוי ימי חופשה שבועיים וחגים.
+# ==================== אינדקס עץ מהודר ====================
+# מפתחות נתונים שאינם מייצגים צמתים בעץ (כאשר ערכם אינו מילון)
+TREE_DATA_KEYS = ("אורך בדפים", "עמוד אחרון", "משניות", "פרקים")
+# סוגי הספירה, לפי הסדר שבו הם מוצגים, וביט לכל אחד במסכת הרלוונטיות
+TREE_MODES = ("פרקים", "משניות", "דפים", "עמודים")
+TREE_MODE_BITS = {mode: 1 << i for i, mode in enumerate(TREE_MODES)}
 
-    Args:
-        start_date (date): תאריך התחלת הטווח.
-        end_date (date): תאריך סיום הטווח (כולל).
-        no_study_weekdays (set[int]): קבוצת מספרים המייצגים ימים בשבוע בהם אין לימוד
-                                      (0=שני, 1=שלישי, ..., 6=ראשון).
-        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
-    Returns:
-        int: מספר ימי הלימוד הפנויים.
+
+class TreeIndex:
     """
-    count = 0
-    current_date = start_date
-    while current_date <= end_date:
-        if current_date.weekday() not in no_study_weekdays:
-            if not (skip_holidays and is_holiday(current_date)):
-                count += 1
-        current_date += timedelta(days=1)
-    return count
+    טבלת צמתים שטוחה המהודרת פעם אחת מעץ ה-JSON.
 
+    כל צומת מזוהה במספר שלם (0 הוא שורש וירטואלי), והמזהים ניתנים בסדר
+    pre-order כך שצומת אב תמיד קודם לילדיו. הנתונים נשמרים במערכים מקבילים
+    (אב, שם, מספר פרקים, מספר משניות, אורך בדפים, עמוד ראשון ואחרון), לצד
+    מילון נתיב→מזהה ורשימות ילדים ממוינות מראש, כך שהאוספים והממשק אינם
+    צריכים לנווט שוב במילון המקונן. בנוסף נשמרים לכל צומת האורכים הכוללים
+    של תת-העץ בכל סוגי הספירה ומסכת ביטים של סוגי הספירה הרלוונטיים.
 
-def _convert_int_to_hebrew_gematria(num):
+    ערכים שאינם מילון ואינם מפתחות נתונים (למשל "עמוד ראשון") נשמרים כעלים
+    לתצוגה בלבד (is_branch=False), בדיוק כפי שהממשק הציג אותם עד כה.
     """
-    פונקציית עזר להמרת מספר שלם לגימטריה עברית ללא פיסוק.
-    משתמשת במחלקת Gematria.
 
-    Args:
-        num (int): המספר להמרה.
-    Returns:
-        str: המספר בגימטריה, או כמחרוזת אם ההמרה נכשלת.
-    """
-    if HEBREW_NUMBERS_AVAILABLE:
-        try:
-            return Gematria.format_hebrew_number(num, punctuation=False)
-        except Exception:
-            return str(num)
-    return str(num)
+    ROOT = 0
+
+    def __init__(
+        self,
+        names,
+        parents,
+        is_branch,
+        chapters,
+        mishnayot,
+        daf_length,
+        first_page,
+        last_amud,
+        derived=None,
+    ):
+        self.names = list(names)
+        self.size = len(self.names)
+        self.parents = np.asarray(parents, dtype=np.int32)
+        self.is_branch = np.asarray(is_branch, dtype=bool)
+        self.chapters = np.asarray(chapters, dtype=np.int64)  # -1 אם אין
+        self.mishnayot = np.asarray(mishnayot, dtype=np.int64)  # -1 אם אין
+        self.daf_length = np.asarray(daf_length, dtype=np.float64)  # NaN אם אין
+        self.first_page = np.asarray(first_page, dtype=np.int64)
+        self.last_amud = list(last_amud)  # "" אם אין
+        if derived is not None:
+            # מבנים מחושבים שנשמרו בקובץ המהודר - נטענים ללא חישוב מחדש
+            for name, _ in _TREE_INDEX_DERIVED:
+                setattr(self, name, derived[name])
+            self.totals = self.totals.reshape(self.size, len(TREE_MODES))
+            self.paths = derived["paths"]
+            # המזהה הנמוך ביותר גובר בנתיבים כפולים, כמו ב-setdefault
+            self.path_ids = dict(zip(reversed(self.paths[1:]), range(self.size - 1, 0, -1)))
+        else:
+            self._compute_structure()
+            self._compute_aggregates()
+        self.unit_numberings = {}  # מספור יחידות לפי סוג ספירה (ראו get_unit_numbering)
+        self._fingerprint = None
+
+    def _compute_structure(self):
+        """מחשב את רשימות הילדים, רשימות הפרקים הממוינות והנתיבים המלאים."""
+        self.is_chapter = self.is_branch & np.fromiter(
+            (name.startswith("פרק ") for name in self.names), dtype=bool, count=self.size
+        )
 
+        # רשימות ילדים בפורמט CSR: ילדי צומת i הם child_ids[child_offsets[i]:child_offsets[i+1]]
+        # מיון יציב לפי האב שומר על סדר ההכנסה המקורי של ה-JSON
+        child_parents = self.parents[1:]
+        self.child_ids = (np.argsort(child_parents, kind="stable") + 1).astype(np.int32)
+        self.child_offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(child_parents, minlength=self.size), out=self.child_offsets[1:]
+        )
 
-def _hebrew_chapter_sort_key(chap_str):
-    """
-    פונקציית מפתח למיון שמות פרקים בעברית (למשל, "פרק א", "פרק יא").
-    ממירה את החלק המספרי של שם הפרק למספר שלם לצורך מיון נכון.
+        # פרקים מפורשים ("פרק X") של כל צומת, ממוינים לפי ערך הגימטריה
+        is_chapter = self.is_chapter.tolist()
+        chapter_lists = []
+        for node_id in range(self.size):
+            kids = [c for c in self.children(node_id) if is_chapter[c]]
+            kids.sort(key=lambda c: _hebrew_chapter_sort_key(self.names[c]))
+            chapter_lists.append(kids)
+        self.chapter_ids = np.fromiter(
+            itertools.chain.from_iterable(chapter_lists), dtype=np.int32
+        )
+        self.chapter_offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum([len(kids) for kids in chapter_lists], out=self.chapter_offsets[1:])
+
+        # נתיבים מלאים (" / ") ומילון נתיב→מזהה
+        parents_list = self.parents.tolist()
+        self.paths = [""] * self.size
+        self.path_ids = {}
+        for node_id in range(1, self.size):
+            parent = parents_list[node_id]
+            name = self.names[node_id]
+            path = sys.intern(
+                name if parent == self.ROOT else f"{self.paths[parent]} / {name}"
+            )
+            self.paths[node_id] = path
+            self.path_ids.setdefault(path, node_id)
 
-    Args:
-        chap_str (str): שם הפרק (למשל, "פרק א'").
+    @classmethod
+    def from_tree(cls, tree_data):
+        """
+        מהדר עץ JSON מקונן לטבלת צמתים.
 
-    Returns:
-        int or str: הערך המספרי של הפרק אם ההמרה הצליחה, אחרת המחרוזת המקורית.
-    """
-    if HEBREW_NUMBERS_AVAILABLE:
-        try:
-            num_part = chap_str.split()[-1]
-            return Gematria.gematria_to_int(num_part)
-        except Exception:
-            return chap_str
-    return chap_str
+        Args:
+            tree_data (dict): עץ הנתונים כפי שנטען מקובץ ה-JSON.
 
+        Returns:
+            TreeIndex: האינדקס המהודר.
+        """
+        names, parents, is_branch = [""], [-1], [True]
+        chapters, mishnayot, daf_length = [-1], [-1], [math.nan]
+        first_page, last_amud = [2], [""]
+
+        def add_node(name, parent, node):
+            names.append(name)
+            parents.append(parent)
+            branch = isinstance(node, dict)
+            is_branch.append(branch)
+            node = node if branch else {}
+            value = node.get("פרקים")
+            chapters.append(value if isinstance(value, int) else -1)
+            value = node.get("משניות")
+            mishnayot.append(value if isinstance(value, int) else -1)
+            value = node.get("אורך בדפים")
+            daf_length.append(value if isinstance(value, (int, float)) else math.nan)
+            value = node.get("עמוד ראשון", 2)  # דף ברירת מחדל להתחלה הוא ב'
+            first_page.append(value if isinstance(value, int) else 2)
+            value = node.get("עמוד אחרון")
+            last_amud.append(value if isinstance(value, str) else "")
+            return len(names) - 1
+
+        def visit(node, node_id):
+            for key, val in node.items():
+                if key in TREE_DATA_KEYS and not isinstance(val, dict):
+                    continue
+                child_id = add_node(key, node_id, val)
+                if isinstance(val, dict):
+                    visit(val, child_id)
+
+        if isinstance(tree_data, dict):
+            visit(tree_data, cls.ROOT)
+        return cls(
+            names,
+            parents,
+            is_branch,
+            chapters,
+            mishnayot,
+            daf_length,
+            first_page,
+            last_amud,
+        )
 
-def _get_node_from_path(path_parts, tree_data):
-    """
-    מאחזר צומת ספציפי מעץ הנתונים על פי נתיב נתון.
+    def find(self, path):
+        """
+        מחזיר את מזהה הצומת עבור נתיב מלא (למשל "משנה / סדר זרעים / ברכות").
 
-    Args:
-        path_parts (list[str]): רשימת חלקי הנתיב לצומת המבוקש.
-        tree_data (dict): מילון המייצג את כלל עץ הנתונים.
+        Returns:
+            int or None: מזהה הצומת, או None אם הנתיב אינו קיים.
+        """
+        return self.path_ids.get(path)
 
-    Returns:
-        dict or None: הצומת המבוקש אם נמצא, אחרת None.
-    """
-    node = tree_data
-    for part in path_parts:
-        node = node.get(part)
-        if node is None:
-            return None
-    return node
+    def children(self, node_id):
+        """מחזיר את מזהי הילדים הישירים של צומת, בסדר המקורי."""
+        return self.child_ids[
+            self.child_offsets[node_id] : self.child_offsets[node_id + 1]
+        ].tolist()
 
+    def branch_children(self, node_id):
+        """מחזיר את הילדים הישירים שהם ענפים (מילונים), בסדר המקורי."""
+        return [c for c in self.children(node_id) if self.is_branch[c]]
 
-def _recursive_collect_chapters(node_data, path_parts, out_list):
-    """
-    אוסף באופן רקורסיבי את כל הפרקים מצומת נתון ומתתי-הצמתים שלו.
-    הפרקים נאספים עם שם הספר המלא שלהם.
+    def chapter_children(self, node_id):
+        """מחזיר את הפרקים המפורשים של צומת, ממוינים לפי סדר הפרקים."""
+        return self.chapter_ids[
+            self.chapter_offsets[node_id] : self.chapter_offsets[node_id + 1]
+        ].tolist()
 
-    Args:
-        node_data (dict): הצומת הנוכחי בעץ הנתונים.
-        path_parts (list[str]): רשימת חלקי הנתיב עד לצומת הנוכחי (משמש לבניית שם הספר).
-        out_list (list[dict]): רשימה אליה יתווספו הפרקים שנאספו.
-                               כל פריט ברשימה הוא מילון עם "book_display_name" ו-"chapter_name".
-    """
-    if not isinstance(node_data, dict):
-        return
-    book_name = " / ".join(path_parts)
-    explicit_keys = sorted(
-        # איסוף מפתחות שמתחילים ב "פרק " ומייצגים פרקים מפורשים
-        [
-            k
-            for k, v in node_data.items()
-            if k.startswith("פרק ") and isinstance(v, dict)
-        ],
-        key=_hebrew_chapter_sort_key,
-    )
-    if explicit_keys:
-        for chap_key in explicit_keys:
-            out_list.append({"book_display_name": book_name, "chapter_name": chap_key})
-    elif "פרקים" in node_data and isinstance(node_data["פרקים"], int):
-        # אם יש מפתח "פרקים" עם מספר, מייצרים שמות פרקים גנריים
-        num_chaps = node_data["פרקים"]
-        for i in range(1, num_chaps + 1):
-            hebrew_num = _convert_int_to_hebrew_gematria(i)
-            out_list.append(
-                {"book_display_name": book_name, "chapter_name": f"פרק {hebrew_num}"}
-            )
+    def _compute_aggregates(self):
+        """
+        מחשב מלמטה למעלה, פעם אחת, את האורך הכולל של כל צומת בכל סוגי הספירה
+        ואת מסכת הביטים של סוגי הספירה הרלוונטיים לו.
+        """
+        branch = self.is_branch
+        chapter_counts = np.diff(self.chapter_offsets)
+        daf = np.nan_to_num(self.daf_length, nan=0.0)
+        has_daf = ~np.isnan(self.daf_length)
+
+        # התרומה של הצומת עצמו (ללא תתי-הצמתים), עמודה לכל סוג ספירה
+        totals = np.zeros((self.size, len(TREE_MODES)), dtype=np.float64)
+        totals[:, 0] = np.where(self.chapters >= 0, self.chapters, chapter_counts)
+        totals[:, 1] = np.maximum(self.mishnayot, 0)
+        totals[:, 2] = daf
+        totals[:, 3] = daf * 2  # כל דף הוא שני עמודים
+        totals[~branch] = 0
+
+        masks = np.zeros(self.size, dtype=np.int64)
+        masks |= ((self.chapters >= 0) | (chapter_counts > 0)) * TREE_MODE_BITS["פרקים"]
+        masks |= (self.mishnayot >= 0) * TREE_MODE_BITS["משניות"]
+        masks |= has_daf * (TREE_MODE_BITS["דפים"] | TREE_MODE_BITS["עמודים"])
+        masks[~branch] = 0
+
+        # צבירה מהרמה העמוקה ביותר כלפי מעלה (אב תמיד קודם לילדיו במזהים)
+        parents_list = self.parents.tolist()
+        depth = [0] * self.size
+        for node_id in range(1, self.size):
+            depth[node_id] = depth[parents_list[node_id]] + 1
+        depth = np.asarray(depth, dtype=np.int64)
+        for level in range(int(depth.max(initial=0)), 0, -1):
+            ids = np.flatnonzero(depth == level)
+            np.add.at(totals, self.parents[ids], totals[ids])
+            np.bitwise_or.at(masks, self.parents[ids], masks[ids])
+
+        self.totals = totals
+        self.relevant_masks = masks
+
+    def subtree_length(self, node_id, mode):
+        """
+        מחזיר את האורך הכולל של צומת ותתי-הצמתים שלו (כמו get_length_from_node).
+
+        Args:
+            node_id (int): מזהה הצומת.
+            mode (str): סוג הספירה ("פרקים", "משניות", "דפים", "עמודים").
+
+        Returns:
+            int or float: האורך הכולל.
+        """
+        if mode not in TREE_MODES:
+            return 0
+        length = float(self.totals[node_id, TREE_MODES.index(mode)])
+        return int(length) if length.is_integer() else length
+
+    def mode_totals(self, node_id):
+        """מחזיר את האורכים הכוללים של הצומת בכל סוגי הספירה, לפי סדר TREE_MODES."""
+        return self.totals[node_id].tolist()
+
+    def relevant_mask(self, node_id):
+        """מחזיר את מסכת הביטים של סוגי הספירה הרלוונטיים לצומת (ראו TREE_MODE_BITS)."""
+        return int(self.relevant_masks[node_id])
+
+    def has_relevant_data(self, node_id, mode):
+        """
+        בודק אם לצומת או לאחד מצאצאיו יש נתונים לסוג הספירה
+        (כמו has_relevant_data_recursive).
+        """
+        return bool(self.relevant_masks[node_id] & TREE_MODE_BITS.get(mode, 0))
+
+    def fingerprint(self) -> str:
+        """
+        מחזיר גיבוב sha256 של תוכן האינדקס, המשמש כגרסת העץ במפתחות מטמון.
+        הגיבוב מחושב פעם אחת לכל אינדקס.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for name, dtype in _TREE_INDEX_COLUMNS:
+                digest.update(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+            for strings in (self.names, self.last_amud):
+                blob, offsets = _encode_string_table(strings)
+                digest.update(offsets.tobytes())
+                digest.update(blob.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
 
-    # קריאה רקורסיבית לתתי-צמתים שאינם פרקים מפורשים
-    for key, val in node_data.items():
-        if isinstance(val, dict) and not key.startswith("פרק "):
-            _recursive_collect_chapters(val, path_parts + [key], out_list)
 
+# מטמון אינדקסים לפי זהות אובייקט העץ (העץ נחשב לקריאה בלבד לאחר הטעינה)
+TREE_INDEX_CACHE = {}
+TREE_INDEX_CACHE_SIZE = 8
 
-def _collect_all_chapters_for_selection(titles_list, tree_data):
+
+def get_tree_index(tree_data):
     """
-    אוסף את כל הפרקים הרלוונטיים לבחירה הנוכחית של המשתמש בעץ.
+    מחזיר את האינדקס המהודר של עץ נתונים, ומהדר אותו בפעם הראשונה בלבד.
 
     Args:
-        titles_list (list[str]): רשימת הנתיבים המלאים של הפריטים שנבחרו בעץ.
-        tree_data (dict): מילון המייצג את כלל עץ הנתונים.
+        tree_data (dict or TreeIndex): עץ הנתונים, או אינדקס מוכן.
+
     Returns:
-        list[dict]: רשימת כל הפרקים שנאספו, כאשר כל פריט הוא מילון.
+        TreeIndex: האינדקס המהודר.
     """
-    collected = []
-    for title_path_str in titles_list:
-        path_parts = title_path_str.split(" / ")
-        node = _get_node_from_path(path_parts, tree_data)
-        if node:
-            _recursive_collect_chapters(node, path_parts, collected)
-    return collected
-
-
-def _recursive_collect_units(node_data, path_parts, out_list, mode):
+    if isinstance(tree_data, TreeIndex):
+        return tree_data
+    cached = TREE_INDEX_CACHE.get(id(tree_data))
+    # שמירת הפניה לעץ מבטיחה שה-id לא ימוחזר לאובייקט אחר
+    if cached is not None and cached[0] is tree_data:
+        return cached[1]
+    index = TreeIndex.from_tree(tree_data)
+    if len(TREE_INDEX_CACHE) >= TREE_INDEX_CACHE_SIZE:
+        TREE_INDEX_CACHE.pop(next(iter(TREE_INDEX_CACHE)))
+    TREE_INDEX_CACHE[id(tree_data)] = (tree_data, index)
+    return index
+
+
+# ==================== קובץ עץ מהודר ====================
+# הייצוג הבינארי של האינדקס נשמר ליד קובץ ה-JSON (למשל torah_tree_data_full.json.treeidx)
+# ונטען במיפוי זיכרון לקריאה בלבד, כך שטעינה חוזרת אינה מפענחת את ה-JSON כלל.
+TREE_INDEX_SUFFIX = ".treeidx"
+TREE_INDEX_MAGIC = b"HSPKTREE"
+TREE_INDEX_VERSION = 2
+# עמודות האינדקס הנשמרות בקובץ וסוגי הנתונים שלהן
+_TREE_INDEX_COLUMNS = (
+    ("parents", np.int32),
+    ("is_branch", np.bool_),
+    ("chapters", np.int64),
+    ("mishnayot", np.int64),
+    ("daf_length", np.float64),
+    ("first_page", np.int64),
+)
+# מבנים מחושבים הנשמרים גם הם, כך שטעינה מהקובץ אינה מחשבת אותם מחדש
+# (totals נשמר שטוח ומעוצב מחדש לפי TREE_MODES)
+_TREE_INDEX_DERIVED = (
+    ("is_chapter", np.bool_),
+    ("child_ids", np.int32),
+    ("child_offsets", np.int64),
+    ("chapter_ids", np.int32),
+    ("chapter_offsets", np.int64),
+    ("totals", np.float64),
+    ("relevant_masks", np.int64),
+)
+
+
+def _file_sha256(path: str) -> str:
+    """מחשב את ה-sha256 של תוכן קובץ."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _encode_string_table(strings):
+    """מקודד רשימת מחרוזות לטבלת בתים רציפה ומערך היסטים."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_string_table(blob, offsets):
+    """מפענח טבלת מחרוזות שנוצרה ע"י _encode_string_table."""
+    raw = blob.tobytes()
+    bounds = offsets.tolist()
+    return [raw[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def write_tree_index_file(index: TreeIndex, path: str, source: dict) -> None:
     """
-    אוסף באופן רקורסיבי יחידות לימוד (משניות, דפים) מצומת נתון ומתתי-הצמתים שלו.
+    כותב את האינדקס לקובץ בינארי: כותרת JSON קצרה ואחריה מערכים מיושרים.
 
     Args:
-        node_data (dict): הצומת הנוכחי בעץ הנתונים.
-        path_parts (list[str]): רשימת חלקי הנתיב עד לצומת הנוכחי.
-        out_list (list[dict]): רשימה אליה יתווספו היחידות שנאספו.
-                               כל פריט הוא מילון עם פרטי היחידה.
-        mode (str): סוג היחידות לאיסוף ("משניות", "דפים", "עמודים").
+        index (TreeIndex): האינדקס לשמירה.
+        path (str): נתיב קובץ היעד.
+        source (dict): פרטי קובץ המקור (mtime_ns, size, sha256) לבדיקת תוקף.
     """
-    if not isinstance(node_data, dict):
-        return
-    full_path_str = " / ".join(path_parts)
+    name_bytes, name_offsets = _encode_string_table(index.names)
+    amud_bytes, amud_offsets = _encode_string_table(index.last_amud)
+    path_bytes, path_offsets = _encode_string_table(index.paths)
+    arrays = [
+        (name, getattr(index, name).astype(dtype).ravel())
+        for name, dtype in _TREE_INDEX_COLUMNS + _TREE_INDEX_DERIVED
+    ]
+    arrays += [
+        ("name_bytes", name_bytes),
+        ("name_offsets", name_offsets),
+        ("amud_bytes", amud_bytes),
+        ("amud_offsets", amud_offsets),
+        ("path_bytes", path_bytes),
+        ("path_offsets", path_offsets),
+    ]
+
+    layout, offset = {}, 0
+    for name, array in arrays:
+        layout[name] = [offset, array.dtype.str, int(array.size)]
+        offset += -(-array.nbytes // 8) * 8  # יישור ל-8 בתים
+    header = json.dumps(
+        {
+            "version": TREE_INDEX_VERSION,
+            "source": source,
+            "size": index.size,
+            "arrays": layout,
+        }
+    ).encode("utf-8")
+    prefix_len = len(TREE_INDEX_MAGIC) + 4 + len(header)
+    padding = -prefix_len % 8
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(TREE_INDEX_MAGIC)
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        f.write(b"\0" * padding)
+        for _, array in arrays:
+            data = array.tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+
+def read_tree_index_file(path: str):
+    """
+    טוען אינדקס מקובץ בינארי במיפוי זיכרון לקריאה בלבד.
 
-    if mode == "משניות":
-        if "משניות" in node_data and isinstance(node_data["משניות"], int):
-            for i in range(1, node_data["משניות"] + 1):
-                # הוספת משניות אם הצומת עצמו מגדיר מספר משניות
-                out_list.append(
-                    {
-                        "book_display_name": full_path_str,
-                        "unit_type": "משנה",
-                        "unit_num_int": i,
-                    }
-                )
-        elif any(
-            k.startswith("פרק ") and isinstance(v, dict) for k, v in node_data.items()
-        ):
-            for k, v in node_data.items():
-                if k.startswith("פרק ") and isinstance(v, dict) and "משניות" in v:
-                    for i in range(1, v["משניות"] + 1):
-                        prk_name = full_path_str + " / " + k
-                        out_list.append(
-                            {
-                                "book_display_name": prk_name,
-                                "unit_type": "משנה",
-                                "unit_num_int": i,
-                            }
-                        )
+    Returns:
+        tuple[dict, TreeIndex] or None: כותרת הקובץ והאינדקס, או None אם הקובץ
+        חסר, פגום או מגרסה אחרת.
+    """
+    try:
+        mm = np.memmap(path, dtype=np.uint8, mode="r")
+        magic_len = len(TREE_INDEX_MAGIC)
+        if mm[:magic_len].tobytes() != TREE_INDEX_MAGIC:
+            return None
+        header_len = int.from_bytes(mm[magic_len : magic_len + 4].tobytes(), "little")
+        header_end = magic_len + 4 + header_len
+        header = json.loads(mm[magic_len + 4 : header_end].tobytes().decode("utf-8"))
+        if header.get("version") != TREE_INDEX_VERSION:
+            return None
+        data_start = header_end + (-header_end % 8)
+        arrays = {}
+        for name, (offset, dtype, count) in header["arrays"].items():
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            view = mm[start : start + count * dtype.itemsize]
+            if view.size != count * dtype.itemsize:
+                return None
+            arrays[name] = view.view(dtype)
+        index = TreeIndex(
+            _decode_string_table(arrays["name_bytes"], arrays["name_offsets"]),
+            arrays["parents"],
+            arrays["is_branch"],
+            arrays["chapters"],
+            arrays["mishnayot"],
+            arrays["daf_length"],
+            arrays["first_page"],
+            _decode_string_table(arrays["amud_bytes"], arrays["amud_offsets"]),
+            derived={
+                **{name: arrays[name] for name, _ in _TREE_INDEX_DERIVED},
+                "paths": _decode_string_table(arrays["path_bytes"], arrays["path_offsets"]),
+            },
+        )
+    except (OSError, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        return None
+    if index.size != header.get("size"):
+        return None
+    return header, index
 
-    elif mode in ("דפים", "עמודים"):
-        if "אורך בדפים" in node_data and isinstance(
-            node_data["אורך בדפים"], (int, float)
+
+def load_tree_index(path: str) -> TreeIndex:
+    """
+    טוען את אינדקס העץ של קובץ JSON, דרך הקובץ המהודר שלידו כשהוא בתוקף.
+
+    הקובץ המהודר נחשב בתוקף כאשר זמן השינוי והגודל של קובץ המקור זהים לאלו
+    שנשמרו בו, או - אם השתנו - כאשר ה-sha256 של התוכן זהה. אחרת ה-JSON
+    מפוענח, מהודר ונכתב מחדש. כשל בכתיבה (למשל תיקייה לקריאה בלבד) אינו
+    עוצר את הטעינה.
+
+    Args:
+        path (str): הנתיב לקובץ ה-JSON.
+
+    Returns:
+        TreeIndex: האינדקס המהודר.
+    """
+    source_path = resource_path(path)
+    stat = os.stat(source_path)
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": None}
+    compiled_path = source_path + TREE_INDEX_SUFFIX
+
+    loaded = read_tree_index_file(compiled_path)
+    if loaded is not None:
+        header, index = loaded
+        cached = header.get("source") or {}
+        if (cached.get("mtime_ns"), cached.get("size")) == (
+            source["mtime_ns"],
+            source["size"],
         ):
-            start_page = node_data.get("עמוד ראשון", 2)  # דף ברירת מחדל להתחלה הוא ב'
-            for i in range(int(node_data["אורך בדפים"])):
-                daf_num = start_page + i
-                # עבור "דפים" ו"עמודים", היחידה הבסיסית היא דף. "עמודים" יטופל בהמשך.
-                out_list.append(
-                    {
-                        "book_display_name": full_path_str,
-                        "unit_type": "דף",
-                        "unit_num_int": daf_num,
-                    }
-                )
+            return index
+        source["sha256"] = _file_sha256(source_path)
+        if cached.get("sha256") == source["sha256"]:
+            # התוכן לא השתנה (רק זמן השינוי) - מעדכנים את הכותרת לפעם הבאה.
+            # האינדקס מועתק לזיכרון ומיפוי הקובץ משוחרר לפני ההחלפה, כי
+            # ב-Windows לא ניתן להחליף קובץ ממופה
+            index = TreeIndex(
+                index.names,
+                *(np.array(getattr(index, name)) for name, _ in _TREE_INDEX_COLUMNS),
+                index.last_amud,
+                derived={
+                    **{name: np.array(getattr(index, name)) for name, _ in _TREE_INDEX_DERIVED},
+                    "paths": index.paths,
+                },
+            )
+            del loaded
+            try:
+                write_tree_index_file(index, compiled_path, source)
+            except OSError:
+                pass
+            return index
+        del loaded, index  # שחרור המיפוי לפני כתיבת הקובץ מחדש
+
+    with open(source_path, encoding="utf-8") as f:
+        index = TreeIndex.from_tree(json.load(f))
+    if source["sha256"] is None:
+        source["sha256"] = _file_sha256(source_path)
+    try:
+        write_tree_index_file(index, compiled_path, source)
+    except OSError as e:
+        print(f"אזהרה: לא ניתן לשמור את העץ המהודר ({e}).")
+    return index
+
+
+# ==================== אינדקס ימי לימוד ====================
+class StudyDayIndex:
+    """
+    מסכת בוליאנית (NumPy) של ימי לימוד בטווח תאריכים, יחד עם הסכום המצטבר שלה.
+
+    האינדקס נבנה פעם אחת עבור (טווח תאריכים, ימי חופשה שבועיים, דילוג על חגים)
+    ומאפשר לענות על "כמה ימי לימוד יש בין שני תאריכים" בזמן קבוע
+    ועל "מהו יום הלימוד ה-N" בחיפוש בינארי.
+    """
+
+    def __init__(self, start_date, end_date, no_study_weekdays, skip_holidays=False):
+        """
+        Args:
+            start_date (date): תאריך תחילת הטווח.
+            end_date (date): תאריך סוף הטווח (כולל).
+            no_study_weekdays (set[int]): ימים בשבוע בהם אין לימוד (0=שני, ..., 6=ראשון).
+            skip_holidays (bool, optional): האם לדלג על חגים.
+        """
+        self.start_ordinal = start_date.toordinal()
+        self.end_ordinal = max(end_date.toordinal(), self.start_ordinal - 1)
+        self.ordinals = np.arange(self.start_ordinal, self.end_ordinal + 1, dtype=np.int64)
+        # date.toordinal() של יום שני הוא 1 (mod 7), ולכן זהו weekday() של פייתון
+        weekdays = (self.ordinals - 1) % 7
+        self.mask = ~np.isin(weekdays, list(no_study_weekdays))
+        if skip_holidays and len(self.ordinals):
+            holiday_ordinals = np.asarray(
+                HOLIDAY_INDEX.holiday_ordinals_between(start_date, end_date),
+                dtype=np.int64,
+            )
+            self.mask[holiday_ordinals - self.start_ordinal] = False
+        # cumulative[i] = מספר ימי הלימוד מתחילת הטווח ועד היום ה-i (כולל)
+        self.cumulative = np.cumsum(self.mask, dtype=np.int64)
+
+    @property
+    def total(self) -> int:
+        """מספר ימי הלימוד בכל הטווח."""
+        return int(self.cumulative[-1]) if len(self.cumulative) else 0
+
+    def _count_until(self, ordinal: int) -> int:
+        """מספר ימי הלימוד מתחילת הטווח ועד ה-ordinal הנתון (כולל)."""
+        if ordinal < self.start_ordinal:
+            return 0
+        if ordinal > self.end_ordinal:
+            return self.total
+        return int(self.cumulative[ordinal - self.start_ordinal])
+
+    def count_between(self, start_date, end_date) -> int:
+        """מחזיר את מספר ימי הלימוד בין שני תאריכים (כולל שני הקצוות)."""
+        start_ordinal, end_ordinal = start_date.toordinal(), end_date.toordinal()
+        if start_ordinal > end_ordinal:
+            return 0
+        return self._count_until(end_ordinal) - self._count_until(start_ordinal - 1)
+
+    def is_study_day(self, gregorian_date) -> bool:
+        """בודק האם התאריך הוא יום לימוד בטווח האינדקס."""
+        ordinal = gregorian_date.toordinal()
+        if not self.start_ordinal <= ordinal <= self.end_ordinal:
+            return False
+        return bool(self.mask[ordinal - self.start_ordinal])
+
+    def nth_study_day(self, n: int):
+        """
+        מחזיר את התאריך של יום הלימוד ה-N בטווח (ספירה מ-1).
+
+        Returns:
+            date or None: התאריך, או None אם אין בטווח N ימי לימוד.
+        """
+        if n < 1 or n > self.total:
+            return None
+        pos = int(np.searchsorted(self.cumulative, n, side="left"))
+        return date.fromordinal(int(self.ordinals[pos]))
+
+    def study_ordinals(self, limit: int | None = None):
+        """מחזיר מערך NumPy של ordinals של ימי הלימוד (לכל היותר ``limit`` הראשונים)."""
+        study = self.ordinals[self.mask]
+        return study if limit is None else study[:limit]
+
+    def study_dates(self, limit: int | None = None) -> list:
+        """מחזיר רשימת תאריכי ימי הלימוד (לכל היותר ``limit`` הראשונים)."""
+        return [date.fromordinal(int(o)) for o in self.study_ordinals(limit)]
+
+
+@lru_cache(maxsize=32)
+def _cached_study_day_index(start_date, end_date, no_study_weekdays, skip_holidays):
+    return StudyDayIndex(start_date, end_date, no_study_weekdays, skip_holidays)
+
+
+def get_study_day_index(start_date, end_date, no_study_weekdays, skip_holidays=False):
+    """
+    מחזיר אינדקס ימי לימוד עבור הפרמטרים הנתונים. אינדקסים נשמרים במטמון,
+    כך שקריאות חוזרות עם אותם פרמטרים אינן בונות את המסכה מחדש.
+    """
+    return _cached_study_day_index(
+        start_date, end_date, frozenset(no_study_weekdays), bool(skip_holidays)
+    )
+
+
+# תוכנית לימוד ארוכה מ-50 שנה נחשבת לשגויה
+MAX_PLAN_DAYS = 365 * 50
+
+
+def get_study_day_index_for_count(
+    start_date, count, no_study_weekdays, skip_holidays=False, max_days=MAX_PLAN_DAYS
+):
+    """
+    מחזיר אינדקס ימי לימוד המתחיל ב-``start_date`` ומכיל לפחות ``count`` ימי לימוד.
+
+    אורך הטווח מוערך לפי מספר ימי הלימוד בשבוע ומוכפל במידת הצורך.
+
+    Returns:
+        StudyDayIndex or None: האינדקס, או None אם אין ``count`` ימי לימוד
+        בתוך ``max_days`` ימים.
+    """
+    study_weekdays = 7 - len(set(no_study_weekdays) & set(range(7)))
+    if study_weekdays == 0:
+        return None
+    span = math.ceil(count * 7 / study_weekdays * 1.1) + 31
+    while True:
+        span = min(span, max_days)
+        index = get_study_day_index(
+            start_date,
+            start_date + timedelta(days=span),
+            no_study_weekdays,
+            skip_holidays,
+        )
+        if index.total >= count:
+            return index
+        if span >= max_days:
+            return None
+        span *= 2
+
+
+def calculate_study_days(start_date, end_date, no_study_weekdays, skip_holidays=False):
+    """
+    מחשב את מספר ימי הלימוד הפנויים בטווח תאריכים נתון,
+    בניכוי ימי חופשה שבועיים וחגים.
+
+    Args:
+        start_date (date): תאריך התחלת הטווח.
+        end_date (date): תאריך סיום הטווח (כולל).
+        no_study_weekdays (set[int]): קבוצת מספרים המייצגים ימים בשבוע בהם אין לימוד
+                                      (0=שני, 1=שלישי, ..., 6=ראשון).
+        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
+    Returns:
+        int: מספר ימי הלימוד הפנויים.
+    """
+    if start_date > end_date:
+        return 0
+    return get_study_day_index(
+        start_date, end_date, no_study_weekdays, skip_holidays
+    ).total
+
 
-    # קריאה רקורסיבית לתתי-צמתים שאינם פרקים מפורשים (עבור מבנים מקוננים)
-    for key, val in node_data.items():
-        if isinstance(val, dict) and not key.startswith("פרק "):
-            _recursive_collect_units(val, path_parts + [key], out_list, mode)
+def find_nth_study_day(
+    start_date, n, no_study_weekdays, skip_holidays=False, max_days=MAX_PLAN_DAYS
+):
+    """
+    מחזיר את התאריך של יום הלימוד ה-N החל מ-``start_date`` (ספירה מ-1).
+
+    Returns:
+        date or None: התאריך, או None אם אין N ימי לימוד בתוך ``max_days`` ימים.
+    """
+    if n < 1:
+        return None
+    index = get_study_day_index_for_count(
+        start_date, n, no_study_weekdays, skip_holidays, max_days
+    )
+    return index.nth_study_day(n) if index else None
 
 
-def _collect_all_units_for_selection(titles_list, tree_data, mode):
+@lru_cache(maxsize=8192)
+def _convert_int_to_hebrew_gematria(num):
     """
-    אוסף את כל יחידות הלימוד (משניות, דפים) הרלוונטיות לבחירה הנוכחית של המשתמש.
+    פונקציית עזר להמרת מספר שלם לגימטריה עברית ללא פיסוק.
+    משתמשת במחלקת Gematria.
 
     Args:
-        titles_list (list[str]): רשימת הנתיבים המלאים של הפריטים שנבחרו בעץ.
+        num (int): המספר להמרה.
+    Returns:
+        str: המספר בגימטריה, או כמחרוזת אם ההמרה נכשלת.
+    """
+    if HEBREW_NUMBERS_AVAILABLE:
+        try:
+            return Gematria.format_hebrew_number(num, punctuation=False)
+        except Exception:
+            return str(num)
+    return str(num)
+
+
+def _hebrew_chapter_sort_key(chap_str):
+    """
+    פונקציית מפתח למיון שמות פרקים בעברית (למשל, "פרק א", "פרק יא").
+    ממירה את החלק המספרי של שם הפרק למספר שלם לצורך מיון נכון.
+
+    Args:
+        chap_str (str): שם הפרק (למשל, "פרק א'").
+
+    Returns:
+        int or str: הערך המספרי של הפרק אם ההמרה הצליחה, אחרת המחרוזת המקורית.
+    """
+    if HEBREW_NUMBERS_AVAILABLE:
+        try:
+            num_part = chap_str.split()[-1]
+            return Gematria.gematria_to_int(num_part)
+        except Exception:
+            return chap_str
+    return chap_str
+
+
+def _get_node_from_path(path_parts, tree_data):
+    """
+    מאחזר צומת ספציפי מעץ הנתונים על פי נתיב נתון.
+
+    Args:
+        path_parts (list[str]): רשימת חלקי הנתיב לצומת המבוקש.
         tree_data (dict): מילון המייצג את כלל עץ הנתונים.
-        mode (str): סוג היחידות לאיסוף ("משניות", "דפים", "עמודים").
 
     Returns:
-        list[dict]: רשימת כל היחידות שנאספו.
+        dict or None: הצומת המבוקש אם נמצא, אחרת None.
     """
-    collected = []
-    for title_path_str in titles_list:
-        path_parts = title_path_str.split(" / ")
-        node = _get_node_from_path(path_parts, tree_data)
-        if node:
-            # קריאה לפונקציה הרקורסיבית עבור כל פריט שנבחר
-            _recursive_collect_units(node, path_parts, collected, mode)
-    return collected
+    node = tree_data
+    for part in path_parts:
+        node = node.get(part)
+        if node is None:
+            return None
+    return node
 
 
 def find_exact_whole_branch(titles_list, tree_data):
@@ -654,7 +1707,7 @@ def find_exact_whole_branch(titles_list, tree_data):
 
     Args:
         titles_list (list[str]): רשימת הנתיבים המלאים של הפריטים שנבחרו.
-        tree_data (dict): מילון המייצג את כלל עץ הנתונים.
+        tree_data (dict or TreeIndex): עץ הנתונים או האינדקס המהודר שלו.
 
     Returns:
         str or None: הנתיב המלא לענף המשותף אם נמצא ענף שלם, אחרת None.
@@ -675,13 +1728,11 @@ def find_exact_whole_branch(titles_list, tree_data):
         # אם הייתה בחירה בודדת, הנתיב המשותף הוא הנתיב של הבחירה
         common_path = split_paths[0]
 
-    # ניווט לצומת המשותף
-    node = tree_data
-    for part in common_path:
-        if part in node:
-            node = node[part]
-        else:
-            return None  # נתיב לא תקין
+    # איתור הצומת המשותף באינדקס
+    index = get_tree_index(tree_data)
+    node_id = index.find(" / ".join(common_path))
+    if node_id is None:
+        return None  # נתיב לא תקין
 
     # בדיקה האם כל הילדים של הצומת המשותף נבחרו
     selected_last_parts = {
@@ -689,9 +1740,9 @@ def find_exact_whole_branch(titles_list, tree_data):
     }
     # ילדים פוטנציאליים של הצומת (לא כולל "פרק X" כי הם לא נחשבים תתי-ענפים לבחירה)
     all_children = {
-        key
-        for key, val in node.items()
-        if isinstance(val, dict) and not key.startswith("פרק")
+        index.names[child_id]
+        for child_id in index.branch_children(node_id)
+        if not index.names[child_id].startswith("פרק")
     }
 
     if selected_last_parts and selected_last_parts == all_children:
@@ -704,6 +1755,400 @@ def find_exact_whole_branch(titles_list, tree_data):
     return None
 
 
+# ==================== מספור יחידות גלובלי ====================
+class StudyUnit:
+    """
+    רשומה קומפקטית של יחידת לימוד אחת (פרק, משנה, דף או עמוד).
+
+    במקום מילון לכל יחידה נשמרים רק השדות עצמם (__slots__), ונתיב הספר
+    הוא מחרוזת משותפת (interned) מאינדקס העץ. לצורך תאימות הרשומה תומכת
+    גם בגישה בסגנון מילון (unit["..."], unit.get, in) לשדות שהוגדרו.
+    """
+
+    __slots__ = (
+        "book_display_name",
+        "chapter_name",
+        "unit_type",
+        "unit_display_name",
+        "sort_key",
+        "unit_num_int",
+        "side",
+    )
+
+    def __init__(
+        self,
+        book_display_name="",
+        chapter_name=None,
+        unit_type=None,
+        unit_display_name=None,
+        sort_key=None,
+        unit_num_int=None,
+        side=None,
+    ):
+        self.book_display_name = book_display_name
+        self.chapter_name = chapter_name
+        self.unit_type = unit_type
+        self.unit_display_name = unit_display_name
+        self.sort_key = sort_key
+        self.unit_num_int = unit_num_int
+        self.side = side
+
+    @classmethod
+    def coerce(cls, unit):
+        """ממיר מילון יחידה (בפורמט הישן) לרשומה; רשומה מוחזרת כמות שהיא."""
+        if isinstance(unit, cls):
+            return unit
+        return cls(
+            unit.get("book_display_name", ""),
+            unit.get("chapter_name"),
+            unit.get("unit_type"),
+            unit.get("unit_display_name"),
+            unit.get("sort_key"),
+            unit.get("unit_num_int"),
+            unit.get("side"),
+        )
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def as_dict(self):
+        """מחזיר את השדות שהוגדרו כמילון."""
+        return {key: getattr(self, key) for key in self.__slots__ if key in self}
+
+    def __eq__(self, other):
+        if isinstance(other, (StudyUnit, dict)):
+            return self.as_dict() == StudyUnit.coerce(other).as_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"StudyUnit({self.as_dict()!r})"
+
+
+class UnitNumbering:
+    """
+    מספור גלובלי ורציף של כל יחידות הלימוד בעץ עבור סוג ספירה אחד.
+
+    היחידות מתוארות ב"מקטעים": כל מקטע הוא רצף יחידות של צומת מקור אחד
+    (הפרקים של ספר, המשניות של פרק או הדפים/העמודים של מסכת), עם היסט
+    מצטבר (prefix sum) לתחילתו. הסדר זהה לסדר האיסוף המקורי - היחידות של
+    הצומת עצמו ואחריהן תתי-הצמתים שאינם פרקים - ולכן היחידות של כל צומת
+    הן טווח רציף [unit_start, unit_end). צמתים שאינם נגישים מהשורש במעבר
+    זה (פרקים מפורשים וצאצאיהם) ממוספרים בהמשך, אחרי כל העץ.
+
+    שמות היחידות מפוענחים ממספר היחידה רק כאשר יש בהם צורך.
+    """
+
+    # סוגי מקטעים
+    NUMBERED = 0  # יחידות ממוספרות (פרקים גנריים, משניות, דפים, עמודים)
+    EXPLICIT_CHAPTERS = 1  # פרקים מפורשים ("פרק X") של צומת המקור
+
+    def __init__(self, index, mode):
+        self.index = index
+        self.mode = mode
+        seg_sources, seg_kinds, seg_firsts, seg_counts = [], [], [], []
+        unit_start = [-1] * index.size
+        unit_end = [-1] * index.size
+        total = 0
+
+        def add_segment(source, kind, first, count):
+            nonlocal total
+            if count > 0:
+                seg_sources.append(source)
+                seg_kinds.append(kind)
+                seg_firsts.append(first)
+                seg_counts.append(count)
+                total += count
+
+        def walk(node_id):
+            unit_start[node_id] = total
+            if index.is_branch[node_id]:
+                self._add_own_segments(node_id, add_segment)
+                for child_id in index.branch_children(node_id):
+                    if not index.is_chapter[child_id]:
+                        walk(child_id)
+            unit_end[node_id] = total
+
+        walk(index.ROOT)
+        for node_id in range(index.size):
+            if unit_start[node_id] < 0:
+                walk(node_id)
+
+        self.seg_sources = np.asarray(seg_sources, dtype=np.int32)
+        self.seg_kinds = np.asarray(seg_kinds, dtype=np.int8)
+        self.seg_firsts = np.asarray(seg_firsts, dtype=np.int64)
+        self.seg_starts = np.zeros(len(seg_counts) + 1, dtype=np.int64)
+        np.cumsum(seg_counts, out=self.seg_starts[1:])
+        self._seg_starts_list = self.seg_starts.tolist()
+        self.unit_start = np.asarray(unit_start, dtype=np.int64)
+        self.unit_end = np.asarray(unit_end, dtype=np.int64)
+        self.total = total
+        self._chapter_weights = None
+        # הספר/המסכת של כל מקטע: מקטע של פרק מפורש שייך לצומת האב שלו
+        sources = self.seg_sources
+        self.seg_books = np.where(
+            index.is_chapter[sources], index.parents[sources], sources
+        ).astype(np.int32)
+
+    def _add_own_segments(self, node_id, add_segment):
+        """מוסיף את המקטעים שהצומת עצמו תורם (ללא תתי-הצמתים)."""
+        index = self.index
+        if self.mode == "פרקים":
+            explicit_ids = index.chapter_children(node_id)
+            if explicit_ids:
+                add_segment(node_id, self.EXPLICIT_CHAPTERS, 0, len(explicit_ids))
+            elif index.chapters[node_id] >= 0:
+                add_segment(node_id, self.NUMBERED, 1, int(index.chapters[node_id]))
+        elif self.mode == "משניות":
+            if index.mishnayot[node_id] >= 0:
+                add_segment(node_id, self.NUMBERED, 1, int(index.mishnayot[node_id]))
+            else:
+                # פרקים מפורשים לפי סדר ההופעה בקובץ
+                for chap_id in index.children(node_id):
+                    if index.is_chapter[chap_id] and index.mishnayot[chap_id] >= 0:
+                        add_segment(
+                            chap_id, self.NUMBERED, 1, int(index.mishnayot[chap_id])
+                        )
+        elif self.mode in ("דפים", "עמודים"):
+            if not math.isnan(index.daf_length[node_id]):
+                count = int(index.daf_length[node_id])
+                if self.mode == "עמודים":
+                    count *= 2  # שני עמודים לכל דף
+                add_segment(node_id, self.NUMBERED, int(index.first_page[node_id]), count)
+
+    def node_range(self, node_id):
+        """מחזיר את טווח מספרי היחידות (start, end) של צומת."""
+        return int(self.unit_start[node_id]), int(self.unit_end[node_id])
+
+    def _locate(self, unit_id):
+        """מחזיר את מספר המקטע וההיסט בתוכו עבור מספר יחידה."""
+        seg = bisect_right(self._seg_starts_list, unit_id) - 1
+        return seg, unit_id - self._seg_starts_list[seg]
+
+    def decode(self, unit_id):
+        """
+        מפענח מספר יחידה גלובלי לפרטי היחידה.
+
+        Returns:
+            StudyUnit: פרטי היחידה.
+        """
+        seg, offset = self._locate(unit_id)
+        source = int(self.seg_sources[seg])
+        book_name = self.index.paths[source]
+        first = int(self.seg_firsts[seg])
+        if self.mode == "פרקים":
+            if self.seg_kinds[seg] == self.EXPLICIT_CHAPTERS:
+                chapter_id = self.index.chapter_children(source)[offset]
+                chapter_name = self.index.names[chapter_id]
+            else:
+                chapter_name = f"פרק {_convert_int_to_hebrew_gematria(first + offset)}"
+            return StudyUnit(book_name, chapter_name=chapter_name)
+
+        if self.mode == "עמודים":
+            unit_num = first + offset // 2
+            hebrew_num = _convert_int_to_hebrew_gematria(unit_num)
+            side = "ab"[offset % 2]
+            return StudyUnit(
+                book_name,
+                unit_type="עמוד",
+                unit_display_name=f"{hebrew_num}." if side == "a" else f"{hebrew_num}:",
+                sort_key=unit_num * 2 - (1 if side == "a" else 0),
+                unit_num_int=unit_num,
+                side=side,
+            )
+
+        unit_num = first + offset
+        return StudyUnit(
+            book_name,
+            unit_type="משנה" if self.mode == "משניות" else "דף",
+            unit_display_name=_convert_int_to_hebrew_gematria(unit_num),
+            sort_key=unit_num,
+            unit_num_int=unit_num,
+        )
+
+    @property
+    def chapter_weights(self):
+        """
+        מערך משקלים לכל יחידה במספור: אורך הפרק במשניות (לאיזון פרקים),
+        או 1 לפרק שאינו מופיע בעץ. מחושב פעם אחת לכל מספור.
+        """
+        if self._chapter_weights is None:
+            weights = np.ones(self.total, dtype=np.int64)
+            for seg in np.flatnonzero(self.seg_kinds == self.EXPLICIT_CHAPTERS).tolist():
+                chapter_ids = self.index.chapter_children(int(self.seg_sources[seg]))
+                start = self._seg_starts_list[seg]
+                weights[start : start + len(chapter_ids)] = [
+                    int(self.index.subtree_length(c, "משניות")) for c in chapter_ids
+                ]
+            self._chapter_weights = weights
+        return self._chapter_weights
+
+
+# סוגי גבולות בין יחידות (לסגמנטציה המיושרת לגבולות)
+BOUNDARY_NONE = 0
+BOUNDARY_PEREK = 1
+BOUNDARY_MASECHET = 2
+
+
+class UnitSelection(Sequence):
+    """
+    רצף יחידות הלימוד של בחירה, המיוצג כרשימה קצרה של טווחי מספרים
+    (start, end) במספור הגלובלי. חיתוך מחזיר בחירה חדשה בחישוב אריתמטי,
+    והיחידות עצמן מפוענחות רק בעת גישה אליהן.
+    """
+
+    def __init__(self, numbering, ranges):
+        self.numbering = numbering
+        self.ranges = [(start, end) for start, end in ranges if end > start]
+        self._offsets = [0]
+        for start, end in self.ranges:
+            self._offsets.append(self._offsets[-1] + end - start)
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def __eq__(self, other):
+        if isinstance(other, UnitSelection):
+            return self.numbering is other.numbering and self.ranges == other.ranges
+        return NotImplemented
+
+    __hash__ = None
+
+    def unit_id(self, position):
+        """ממיר מיקום בבחירה למספר היחידה הגלובלי."""
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("unit position out of range")
+        r = bisect_right(self._offsets, position) - 1
+        return self.ranges[r][0] + position - self._offsets[r]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            ranges = []
+            for (r_start, r_end), offset in zip(self.ranges, self._offsets):
+                lo = max(start - offset, 0)
+                hi = min(stop - offset, r_end - r_start)
+                if lo < hi:
+                    ranges.append((r_start + lo, r_start + hi))
+            return UnitSelection(self.numbering, ranges)
+        return self.numbering.decode(self.unit_id(item))
+
+    def __iter__(self):
+        decode = self.numbering.decode
+        for start, end in self.ranges:
+            for unit_id in range(start, end):
+                yield decode(unit_id)
+
+    def unit_ids(self):
+        """מחזיר את מספרי היחידות הגלובליים של הבחירה לפי הסדר."""
+        return itertools.chain.from_iterable(
+            range(start, end) for start, end in self.ranges
+        )
+
+    def boundary_levels(self):
+        """
+        מחזיר לכל נקודת חיתוך q (בין יחידה q-1 ליחידה q, 0..len) את סוג הגבול:
+        BOUNDARY_MASECHET בסוף ספר/מסכת, BOUNDARY_PEREK בסוף פרק, ו-BOUNDARY_NONE אחרת.
+        """
+        levels = np.zeros(len(self) + 1, dtype=np.int8)
+        if not self.ranges:
+            return levels
+        unit_ids = np.concatenate(
+            [np.arange(start, end, dtype=np.int64) for start, end in self.ranges]
+        )
+        segments = np.searchsorted(self.numbering.seg_starts, unit_ids, side="right") - 1
+        books = self.numbering.seg_books[segments]
+        levels[1:-1][segments[1:] != segments[:-1]] = BOUNDARY_PEREK
+        levels[1:-1][books[1:] != books[:-1]] = BOUNDARY_MASECHET
+        levels[-1] = BOUNDARY_MASECHET
+        return levels
+
+    def book_runs(self):
+        """
+        מחלק את הבחירה לרצפים של יחידות עוקבות מאותו ספר/מסכת.
+
+        Returns:
+            list[tuple[int, int]]: טווחי מיקומים ``[start, end)`` בבחירה.
+        """
+        if not self.ranges:
+            return []
+        unit_ids = np.concatenate(
+            [np.arange(start, end, dtype=np.int64) for start, end in self.ranges]
+        )
+        segments = np.searchsorted(self.numbering.seg_starts, unit_ids, side="right") - 1
+        books = self.numbering.seg_books[segments]
+        breaks = np.flatnonzero(
+            (books[1:] != books[:-1]) | (unit_ids[1:] != unit_ids[:-1] + 1)
+        ) + 1
+        bounds = [0] + breaks.tolist() + [len(unit_ids)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def chapter_weights(self):
+        """מחזיר את משקלי הפרקים (במשניות) של יחידות הבחירה, כמערך NumPy."""
+        weights = self.numbering.chapter_weights
+        if not self.ranges:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([weights[start:end] for start, end in self.ranges])
+
+
+def get_unit_numbering(tree_data, mode):
+    """
+    מחזיר את המספור הגלובלי של היחידות בעץ עבור סוג ספירה, ובונה אותו בפעם הראשונה בלבד.
+
+    Args:
+        tree_data (dict or TreeIndex): עץ הנתונים או האינדקס המהודר שלו.
+        mode (str): סוג הספירה ("פרקים", "משניות", "דפים", "עמודים").
+
+    Returns:
+        UnitNumbering: המספור עבור סוג הספירה.
+    """
+    index = get_tree_index(tree_data)
+    numbering = index.unit_numberings.get(mode)
+    if numbering is None:
+        numbering = index.unit_numberings[mode] = UnitNumbering(index, mode)
+    return numbering
+
+
+def resolve_selection(titles_list, tree_data, mode):
+    """
+    ממיר את הבחירה הנוכחית של המשתמש לרשימת טווחי יחידות במספור הגלובלי.
+
+    Args:
+        titles_list (list[str]): רשימת הנתיבים המלאים של הפריטים שנבחרו בעץ.
+        tree_data (dict or TreeIndex): עץ הנתונים או האינדקס המהודר שלו.
+        mode (str): סוג הספירה ("פרקים", "משניות", "דפים", "עמודים").
+
+    Returns:
+        UnitSelection: יחידות הבחירה לפי הסדר.
+    """
+    numbering = get_unit_numbering(tree_data, mode)
+    ranges = []
+    for title_path_str in titles_list:
+        node_id = numbering.index.find(title_path_str)
+        if node_id is None:
+            continue
+        start, end = numbering.node_range(node_id)
+        if ranges and ranges[-1][1] == start:
+            # בחירות צמודות (למשל כל הילדים של צומת) מתאחדות לטווח אחד
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return UnitSelection(numbering, ranges)
+
+
 # ==================== יוצר שם חכם ====================
 def generate_smart_filename(
     titles_list, mode, start_date, end_date, tree_data, extension, units_per_day=None
@@ -792,457 +2237,1750 @@ def generate_smart_filename(
     return f"{title} {time_str}.{extension}"
 
 
-# ==================== מחשב לוח לימוד ====================
-def _generate_study_schedule(
-    start_date,
-    end_date,
-    titles_list,
-    mode,
-    tree_data,
-    no_study_weekdays,
-    units_per_day=None,
-    skip_holidays=False,
-    balance_chapters_by_mishnayot=False,
-):
+# ==================== מנוע הקצאת יחידות לימים ====================
+def allocate_units_to_days(weights, day_ordinals):
     """
-    מייצר את לוח הלימודים המפורט יום אחר יום.
+    מחלק רצף יחידות משוקללות על פני ימי הלימוד, בחישוב וקטורי אחד.
+
+    היעד המצטבר של כל יום הוא חלק שווה מהמשקל הכולל (השארית מתחלקת בין
+    הימים הראשונים), וכל יחידה משויכת ליום שבו נופלת נקודת האמצע של המשקל
+    המצטבר שלה. כל גבולות הימים מחושבים יחד בעזרת cumsum ו-searchsorted.
+    עבור משקלים אחידים התוצאה זהה לחלוקה לפי מספר יחידות.
 
     Args:
-        start_date (date): תאריך התחלת הלימוד.
-        end_date (date): תאריך סיום הלימוד (במצב חלוקה לפי טווח).
-        titles_list (list[str]): רשימת הנתיבים של הפריטים הנלמדים.
-        mode (str): סוג הלימוד ("פרקים", "משניות", "דפים", "עמודים").
-        tree_data (dict): עץ הנתונים המלא.
-        no_study_weekdays (set[int]): קבוצת ימי חופשה שבועיים.
-        units_per_day (int, optional): מספר יחידות לימוד ביום (במצב הספק קבוע).
-                                       אם None, הלימוד מחולק על פני טווח התאריכים.
-        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
-        balance_chapters_by_mishnayot (bool, optional):
-            איזון פרקי משניות לפי מספר המשניות בכל פרק.
+        weights (np.ndarray): משקל כל יחידה, לפי סדר הלימוד.
+        day_ordinals (np.ndarray): ימי הלימוד (ordinal) לפי הסדר.
+
     Returns:
-        list[dict]: רשימת אירועי לימוד. כל פריט מכיל:
-            - ``date``: התאריך הגרגוריאני.
-            - ``description``: תיאור הלימוד ליום.
-            - ``first_unit`` ו-``last_unit``: פרטי היחידות הפותחות והחותמות
-              את הלימוד באותו יום.
+        tuple[np.ndarray, np.ndarray, np.ndarray]: ימי הלימוד שקיבלו יחידות,
+        ולכל אחד מהם אינדקס היחידה הראשונה ואינדקס הסיום (לא כולל).
+    """
+    weights = np.asarray(weights, dtype=np.int64)
+    day_ordinals = np.asarray(day_ordinals, dtype=np.int64)
+    day_count = len(day_ordinals)
+    if day_count == 0 or len(weights) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    cumulative = np.cumsum(weights)
+    total = int(cumulative[-1])
+    base_per_day, remainder = divmod(total, day_count)
+    days_elapsed = np.arange(1, day_count + 1, dtype=np.int64)
+    targets = days_elapsed * base_per_day + np.minimum(days_elapsed, remainder)
+
+    # נקודת האמצע של כל יחידה (כפול 2 כדי להישאר במספרים שלמים)
+    midpoints = 2 * cumulative - weights
+    ends = np.searchsorted(midpoints, 2 * targets, side="right")
+    ends[-1] = len(weights)
+    starts = np.concatenate(([0], ends[:-1]))
+    used = ends > starts
+    return day_ordinals[used], starts[used], ends[used]
+
+
+def _greedy_group_count(cumulative, cap, limit):
     """
-    schedule = []
+    סופר כמה ימים נדרשים כשכל יום מתמלא ברצף עד תקרת עומס cap
+    (קפיצות בחיפוש בינארי על הסכום המצטבר). מפסיק לספור מעבר ל-limit.
+    """
+    count, pos, base = 0, 0, 0
+    while pos < len(cumulative):
+        pos = bisect_right(cumulative, base + cap, lo=pos)
+        base = cumulative[pos - 1]
+        count += 1
+        if count > limit:
+            break
+    return count
 
-    # בחירת אוסף יחידות לפי מצב
-    if mode == "פרקים":
-        all_units = _collect_all_chapters_for_selection(titles_list, tree_data)
-    else:
-        all_units = _collect_all_units_for_selection(titles_list, tree_data, mode)
-        # המשך העיבוד ל"עמודים"/"דפים"/"משניות" (כמו בקוד שלך):
-        if mode in ("עמודים", "דפים", "משניות"):
-            processed_units = []
-            for unit in all_units:
-                book_name = unit.get("book_display_name", "לא ידוע")
-                unit_num = unit.get("unit_num_int")
-                if unit_num is None:
-                    continue
-                hebrew_num = _convert_int_to_hebrew_gematria(unit_num)
-                if mode == "עמודים":
-                    processed_units.append(
-                        {
-                            "book_display_name": book_name,
-                            "unit_type": "עמוד",
-                            "unit_display_name": f"{hebrew_num}.",
-                            "sort_key": unit_num * 2 - 1,  # עמוד א'
-                            "unit_num_int": unit_num,
-                            "side": "a",
-                        }
-                    )
-                    processed_units.append(
-                        {
-                            "book_display_name": book_name,
-                            "unit_type": "עמוד",
-                            "unit_display_name": f"{hebrew_num}:",
-                            "sort_key": unit_num * 2,  # עמוד ב'
-                            "unit_num_int": unit_num,
-                            "side": "b",
-                        }
-                    )
-                elif mode == "דפים":
-                    processed_units.append(
-                        {
-                            "book_display_name": book_name,
-                            "unit_type": "דף",
-                            "unit_display_name": hebrew_num,
-                            "sort_key": unit_num,
-                            "unit_num_int": unit_num,
-                        }
-                    )
-                elif mode == "משניות":
-                    processed_units.append(
-                        {
-                            "book_display_name": book_name,
-                            "unit_type": "משנה",
-                            "unit_display_name": hebrew_num,
-                            "sort_key": unit_num,
-                            "unit_num_int": unit_num,
-                        }
-                    )
-            # processed_units.sort(key=lambda x: (x["book_display_name"], x["sort_key"])) # מיון היחידות
-            all_units = processed_units
 
-    total_units = len(all_units)
-    if total_units == 0:
-        return []
+def partition_units_min_max(weights, day_ordinals):
+    """
+    מחלק רצף יחידות משוקללות (לפי הסדר) על פני ימי הלימוד כך שהעומס ביום
+    העמוס ביותר יהיה מינימלי (linear partition מדויק).
 
-    current_date = start_date
-    day_idx = 0
-    unit_idx = 0
+    התקרה האופטימלית נמצאת בחיפוש בינארי על העומס היומי המרבי, עם בדיקת
+    היתכנות חמדנית - סה"כ O(n log W). לאחר מכן הימים נבנים בתקרה זו, תוך
+    השארת יחידה אחת לפחות לכל יום שנותר, כך שכל ימי הלימוד מנוצלים.
 
-    if units_per_day is None:
+    Args:
+        weights (np.ndarray): משקל כל יחידה, לפי סדר הלימוד.
+        day_ordinals (np.ndarray): ימי הלימוד (ordinal) לפי הסדר.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: כמו allocate_units_to_days.
+    """
+    weights = np.asarray(weights, dtype=np.int64)
+    day_ordinals = np.asarray(day_ordinals, dtype=np.int64)
+    unit_count, day_count = len(weights), len(day_ordinals)
+    if day_count == 0 or unit_count == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    cumulative = np.cumsum(weights).tolist()
+    low, high = int(weights.max()), cumulative[-1]
+    while low < high:
+        cap = (low + high) // 2
+        if _greedy_group_count(cumulative, cap, day_count) <= day_count:
+            high = cap
+        else:
+            low = cap + 1
+
+    ends = []
+    pos, base = 0, 0
+    for day in range(min(day_count, unit_count)):
+        days_left = day_count - day
+        end = bisect_right(cumulative, base + low, lo=pos)
+        end = max(pos + 1, min(end, unit_count - (days_left - 1)))
+        ends.append(end)
+        pos, base = end, cumulative[end - 1]
+        if pos >= unit_count:
+            break
+    ends = np.asarray(ends, dtype=np.int64)
+    starts = np.concatenate(([0], ends[:-1]))
+    return day_ordinals[: len(ends)], starts, ends
+
+
+# אסטרטגיות לאיזון פרקי משנה לפי מספר המשניות
+BALANCE_PROPORTIONAL = "proportional"  # יעד מצטבר שווה לכל יום
+BALANCE_MIN_MAX = "min_max"  # חלוקה אופטימלית: מזעור היום העמוס ביותר
+BALANCE_STRATEGIES = {
+    BALANCE_PROPORTIONAL: allocate_units_to_days,
+    BALANCE_MIN_MAX: partition_units_min_max,
+}
+
+
+def _resolve_balance_strategy(balance_chapters_by_mishnayot):
+    """
+    ממיר את הפרמטר balance_chapters_by_mishnayot לשם אסטרטגיה.
+    False/None - ללא איזון, True - ברירת המחדל (יעד מצטבר), או שם אסטרטגיה מפורש.
+    """
+    if not balance_chapters_by_mishnayot:
+        return None
+    if balance_chapters_by_mishnayot is True:
+        return BALANCE_PROPORTIONAL
+    if balance_chapters_by_mishnayot not in BALANCE_STRATEGIES:
+        raise ValueError(f"אסטרטגיית איזון לא מוכרת: {balance_chapters_by_mishnayot}")
+    return balance_chapters_by_mishnayot
+
+
+# פרמטרים לסגמנטציה המיושרת לגבולות: תגמול על סיום יום בגבול, ורדיוס החלון
+# (ביחידות) סביב נקודת החיתוך הנומינלית של כל יום
+BOUNDARY_BONUS = {BOUNDARY_NONE: 0.0, BOUNDARY_PEREK: 0.3, BOUNDARY_MASECHET: 1.0}
+SEGMENT_WINDOW_MAX = 12
+
+
+def segment_units_at_boundaries(boundary_levels, day_ordinals):
+    """
+    מחלק רצף יחידות על פני ימי הלימוד כך שימים יסתיימו ככל האפשר בסוף פרק
+    או מסכת, תוך שמירה על עומס יומי קרוב ליעד.
+
+    פותר תכנון דינמי על נקודות החיתוך: עלות יום היא סטיית אורכו מהיעד
+    (בריבוע, ביחס ליעד) פחות תגמול על סוג הגבול שבו הוא מסתיים. חיתוך היום
+    ה-d מוגבל לחלון קטן סביב נקודת החיתוך הנומינלית שלו (כמו בחלוקה הרגילה),
+    ולכן הזמן הוא O(n·K) עבור חלון ברוחב K - כמעט לינארי.
+
+    Args:
+        boundary_levels (np.ndarray): סוג הגבול בכל נקודת חיתוך (אורך n+1),
+            כפי שמחזירה UnitSelection.boundary_levels.
+        day_ordinals (np.ndarray): ימי הלימוד (ordinal) לפי הסדר.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: כמו allocate_units_to_days.
+    """
+    unit_count = len(boundary_levels) - 1
+    day_ordinals = np.asarray(day_ordinals, dtype=np.int64)
+    day_count = len(day_ordinals)
+    if unit_count <= day_count:
+        # אין מה ליישר: לכל היותר יחידה אחת ליום
+        return allocate_units_to_days(np.ones(unit_count, dtype=np.int64), day_ordinals)
+
+    target = unit_count / day_count
+    radius = int(min(SEGMENT_WINDOW_MAX, max(1, math.ceil(target / 2))))
+    bonus = np.vectorize(BOUNDARY_BONUS.get, otypes=[float])(boundary_levels)
+    days_elapsed = np.arange(1, day_count + 1, dtype=np.int64)
+    base_per_day, remainder = divmod(unit_count, day_count)
+    nominal = days_elapsed * base_per_day + np.minimum(days_elapsed, remainder)
+
+    prev_positions = np.zeros(1, dtype=np.int64)
+    prev_costs = np.zeros(1, dtype=np.float64)
+    back_pointers = []
+    candidates_per_day = []
+    for day in range(day_count):
+        if day == day_count - 1:
+            positions = np.array([unit_count], dtype=np.int64)
+        else:
+            # כל יום מקבל יחידה אחת לפחות, ונשארת יחידה לכל יום שאחריו
+            low = max(int(nominal[day]) - radius, day + 1)
+            high = min(int(nominal[day]) + radius, unit_count - (day_count - day - 1))
+            positions = np.arange(low, high + 1, dtype=np.int64)
+        lengths = positions[None, :] - prev_positions[:, None]
+        costs = prev_costs[:, None] + ((lengths - target) / target) ** 2
+        costs[lengths < 1] = np.inf
+        best = np.argmin(costs, axis=0)
+        prev_costs = costs[best, np.arange(len(positions))] - bonus[positions]
+        prev_positions = positions
+        back_pointers.append(best)
+        candidates_per_day.append(positions)
+
+    ends = np.empty(day_count, dtype=np.int64)
+    choice = 0
+    for day in range(day_count - 1, -1, -1):
+        ends[day] = candidates_per_day[day][choice]
+        choice = back_pointers[day][choice]
+    starts = np.concatenate(([0], ends[:-1]))
+    return day_ordinals, starts, ends
+
+
+# ==================== מחשב לוח לימוד ====================
+def _study_day_record(units, mode, ordinal, day_start, day_end):
+    """בונה רשומת יום לימוד עבור היחידות ``units[day_start:day_end]``."""
+    todays_units = units[day_start:day_end]
+    first_unit, last_unit = todays_units[0], todays_units[-1]
+    return {
+        "date": date.fromordinal(ordinal),
+        "description": build_description(first_unit, last_unit, mode),
+        "first_unit": first_unit,
+        "last_unit": last_unit,
+        "units": todays_units,
+    }
+
+
+class StudySchedule:
+    """
+    לוח לימוד מחושב, המיוצג בגבולות הימים בלבד: ה-ordinal של כל יום לימוד
+    וטווח היחידות ``[start, end)`` שלו בבחירה, כמערכי NumPy ממוינים.
+
+    רשומות הימים (תיאור, יחידות) נבנות רק לפי דרישה, ולכן ניתן לשאול
+    "מה לומדים בתאריך D" או "באיזה תאריך נלמדת היחידה U" בחיפוש בינארי,
+    ולהפיק חלון ימים (למשל 30 הימים הבאים) בלי לבנות את הלוח כולו.
+    """
+
+    def __init__(self, units, mode, day_ordinals, day_starts, day_ends):
+        """
+        Args:
+            units (UnitSelection): יחידות הבחירה לפי סדר הלימוד.
+            mode (str): סוג הלימוד.
+            day_ordinals (np.ndarray): ordinals של ימי הלימוד, בסדר עולה.
+            day_starts (np.ndarray): מיקום היחידה הראשונה של כל יום בבחירה.
+            day_ends (np.ndarray): מיקום היחידה שאחרי האחרונה של כל יום.
+        """
+        self.units = units
+        self.mode = mode
+        self.day_ordinals = np.asarray(day_ordinals, dtype=np.int64)
+        self.day_starts = np.asarray(day_starts, dtype=np.int64)
+        self.day_ends = np.asarray(day_ends, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.day_ordinals)
+
+    @property
+    def first_date(self) -> date:
+        """תאריך יום הלימוד הראשון."""
+        return date.fromordinal(int(self.day_ordinals[0]))
+
+    @property
+    def last_date(self) -> date:
+        """תאריך יום הלימוד האחרון."""
+        return date.fromordinal(int(self.day_ordinals[-1]))
+
+    def day(self, index: int) -> dict:
+        """
+        בונה את רשומת יום הלימוד ה-index (ספירה מ-0, תומך באינדקס שלילי).
+
+        Returns:
+            dict: ``date``, ``description``, ``first_unit``, ``last_unit``
+            ו-``units`` (UnitSelection של יחידות היום).
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("study day out of range")
+        return _study_day_record(
+            self.units,
+            self.mode,
+            int(self.day_ordinals[index]),
+            int(self.day_starts[index]),
+            int(self.day_ends[index]),
+        )
+
+    def iter_days(self, first: int = 0, stop: int | None = None):
+        """מפיק את רשומות הימים בטווח האינדקסים ``[first, stop)``."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(max(first, 0), stop):
+            yield self.day(index)
+
+    def __iter__(self):
+        return self.iter_days()
+
+    def day_index_on(self, gregorian_date) -> int | None:
+        """מחזיר את אינדקס יום הלימוד שחל בתאריך הנתון, או None אם אינו יום לימוד."""
+        ordinal = gregorian_date.toordinal()
+        index = int(np.searchsorted(self.day_ordinals, ordinal, side="left"))
+        if index < len(self) and self.day_ordinals[index] == ordinal:
+            return index
+        return None
+
+    def portion_on(self, gregorian_date) -> dict | None:
+        """מחזיר את רשומת הלימוד של התאריך הנתון, או None אם אין בו לימוד."""
+        index = self.day_index_on(gregorian_date)
+        return None if index is None else self.day(index)
+
+    def next_day_index(self, gregorian_date) -> int | None:
+        """מחזיר את אינדקס יום הלימוד הראשון החל בתאריך הנתון או אחריו."""
+        index = int(np.searchsorted(self.day_ordinals, gregorian_date.toordinal()))
+        return index if index < len(self) else None
+
+    def window(self, from_date, days: int = 30):
+        """
+        מפיק את ימי הלימוד שבחלון ``[from_date, from_date + days)`` בלבד.
+
+        Args:
+            from_date (date): תחילת החלון.
+            days (int, optional): אורך החלון בימים קלנדריים.
+
+        Yields:
+            dict: רשומות ימי הלימוד שבחלון, לפי הסדר.
+        """
+        first_ordinal = from_date.toordinal()
+        first, stop = np.searchsorted(
+            self.day_ordinals, [first_ordinal, first_ordinal + days], side="left"
+        ).tolist()
+        return self.iter_days(first, stop)
+
+    def day_index_of_unit(self, position: int) -> int:
+        """מחזיר את אינדקס היום שבו נלמדת היחידה במיקום הנתון בבחירה."""
+        if position < 0:
+            position += len(self.units)
+        if not 0 <= position < len(self.units):
+            raise IndexError("unit position out of range")
+        return int(np.searchsorted(self.day_ends, position, side="right"))
+
+    def date_of_unit(self, position: int) -> date:
+        """מחזיר את התאריך שבו נלמדת היחידה במיקום הנתון בבחירה."""
+        return date.fromordinal(int(self.day_ordinals[self.day_index_of_unit(position)]))
+
+
+def build_study_schedule(
+    start_date,
+    end_date,
+    titles_list,
+    mode,
+    tree_data,
+    no_study_weekdays,
+    units_per_day=None,
+    skip_holidays=False,
+    balance_chapters_by_mishnayot=False,
+    align_to_boundaries=False,
+):
+    """
+    מחשב את חלוקת הלימוד לימים בלבד - ללא פענוח היחידות.
+
+    הפרמטרים זהים לאלו של iter_study_schedule.
+
+    Returns:
+        StudySchedule | None: הלוח המחושב, או ``None`` אם אין מה ללמוד.
+    """
+    # הבחירה מיוצגת כטווחי מספרים במספור הגלובלי של סוג הספירה;
+    # היחידות מפוענחות רק לתיאור ולקישורים
+    all_units = resolve_selection(titles_list, tree_data, mode)
+    if len(all_units) == 0:
+        return None
+
+    days = _allocate_study_days(
+        all_units,
+        mode,
+        start_date,
+        end_date,
+        no_study_weekdays,
+        units_per_day,
+        skip_holidays,
+        balance_chapters_by_mishnayot,
+        align_to_boundaries,
+    )
+    if days is None:
+        return None
+    return StudySchedule(all_units, mode, *days)
+
+
+def _allocate_study_days(
+    all_units,
+    mode,
+    start_date,
+    end_date,
+    no_study_weekdays,
+    units_per_day,
+    skip_holidays,
+    balance_chapters_by_mishnayot,
+    align_to_boundaries,
+):
+    """
+    מחלק את יחידות הבחירה לימי הלימוד שמ-start_date.
+
+    Returns:
+        tuple | None: ``(day_ordinals, day_starts, day_ends)``, או None אם
+        אין ימי לימוד בטווח.
+    """
+    if units_per_day is None:
         # מצב רגיל: מחלקים לפי מספר ימי לימוד בפועל בין התאריכים
-        study_days_count = calculate_study_days(
+        if start_date > end_date:
+            return None
+        study_ordinals = get_study_day_index(
             start_date, end_date, no_study_weekdays, skip_holidays
+        ).study_ordinals()
+    else:
+        # מצב הספק יומי קבוע: מספר ימי הלימוד הנדרשים ידוע מראש
+        sessions_needed = math.ceil(len(all_units) / units_per_day)
+        study_index = get_study_day_index_for_count(
+            start_date, sessions_needed, no_study_weekdays, skip_holidays
         )
-        if study_days_count == 0:
-            return []
+        if study_index is None:
+            return None
+        study_ordinals = study_index.study_ordinals(sessions_needed)
+    return _allocate_units_over_days(
+        all_units,
+        mode,
+        study_ordinals,
+        units_per_day,
+        balance_chapters_by_mishnayot,
+        align_to_boundaries,
+    )
 
-        if mode == "פרקים" and balance_chapters_by_mishnayot:
-            # חלוקה לפי אורך הפרקים במשניות
-            for unit in all_units:
-                path = unit["book_display_name"].split(" / ") + [unit["chapter_name"]]
-                node = _get_node_from_path(path, tree_data)
-                unit["length"] = get_length_from_node(node, "משניות") if node else 1
-
-            total_length = sum(u.get("length", 1) for u in all_units)
-            base_per_day = total_length // study_days_count
-            remainder = total_length % study_days_count
-            allocations = [
-                base_per_day + (1 if i < remainder else 0)
-                for i in range(study_days_count)
-            ]
 
-            while current_date <= end_date and unit_idx < total_units:
-                if current_date.weekday() not in no_study_weekdays and not (
-                    skip_holidays and is_holiday(current_date)
-                ):
-                    target = (
-                        allocations[day_idx]
-                        if day_idx < len(allocations)
-                        else base_per_day
-                    )
-                    todays_units = []
-                    length_today = 0
-                    while unit_idx < total_units:
-                        chap = all_units[unit_idx]
-                        chap_len = chap.get("length", 1)
-                        if (
-                            todays_units
-                            and length_today + chap_len > target
-                            and day_idx < len(allocations) - 1
-                        ):
-                            break
-                        todays_units.append(chap)
-                        length_today += chap_len
-                        unit_idx += 1
-                        if length_today >= target:
-                            break
-                    first_unit, last_unit = todays_units[0], todays_units[-1]
-                    desc = build_description(first_unit, last_unit, mode)
-                    schedule.append(
-                        {
-                            "date": current_date,
-                            "description": desc,
-                            "first_unit": first_unit,
-                            "last_unit": last_unit,
-                            "units": todays_units,
-                        }
-                    )
-                    day_idx += 1
-                current_date += timedelta(days=1)
-        else:
-            base_per_day = total_units // study_days_count
-            remainder = total_units % study_days_count  # יחידות עודפות לחלוקה
-            allocations = [
-                base_per_day + (1 if i < remainder else 0)
-                for i in range(study_days_count)
-            ]
+def _allocate_units_over_days(
+    all_units,
+    mode,
+    study_ordinals,
+    units_per_day,
+    balance_chapters_by_mishnayot,
+    align_to_boundaries,
+):
+    """
+    מחלק את יחידות הבחירה על ימי לימוד נתונים.
 
-            while current_date <= end_date and unit_idx < total_units:
-                # לולאה על כל יום בטווח התאריכים
-                if current_date.weekday() not in no_study_weekdays and not (
-                    skip_holidays and is_holiday(current_date)
-                ):
-                    num_today = allocations[day_idx]
-                    if num_today > 0:
-                        todays_units = all_units[unit_idx : unit_idx + num_today]
-                        first_unit, last_unit = todays_units[0], todays_units[-1]
-                        desc = build_description(first_unit, last_unit, mode)
-                        schedule.append(
-                            {
-                                "date": current_date,
-                                "description": desc,
-                                "first_unit": first_unit,
-                                "last_unit": last_unit,
-                                "units": todays_units,
-                            }
-                        )
-                        unit_idx += num_today
-                    day_idx += 1  # קדם אינדקס יום לימוד
-                current_date += timedelta(days=1)
+    Args:
+        study_ordinals (np.ndarray): ימי הלימוד - כל ימי הטווח במצב חלוקה
+            לפי טווח, או בדיוק הימים הנדרשים במצב הספק קבוע.
+
+    Returns:
+        tuple | None: ``(day_ordinals, day_starts, day_ends)``, או None אם
+        אין ימי לימוד.
+    """
+    total_units = len(all_units)
+    if len(study_ordinals) == 0:
+        return None
+    if units_per_day is None:
+        strategy = _resolve_balance_strategy(balance_chapters_by_mishnayot)
+        if mode == "פרקים" and strategy:
+            # חלוקה לפי אורך הפרקים במשניות
+            weights = all_units.chapter_weights()
+            allocate = BALANCE_STRATEGIES[strategy]
+            day_ordinals, day_starts, day_ends = allocate(weights, study_ordinals)
+        elif mode != "פרקים" and align_to_boundaries:
+            day_ordinals, day_starts, day_ends = segment_units_at_boundaries(
+                all_units.boundary_levels(), study_ordinals
+            )
+        else:
+            day_ordinals, day_starts, day_ends = allocate_units_to_days(
+                np.ones(total_units, dtype=np.int64), study_ordinals
+            )
     else:
-        # מצב הספק יומי קבוע
-        while unit_idx < total_units:
-            if current_date.weekday() not in no_study_weekdays and not (
-                skip_holidays and is_holiday(current_date)
-            ):
-                # לוקחים units_per_day יחידות או פחות אם זה סוף הרשימה
-                todays_units = all_units[unit_idx : unit_idx + units_per_day]
-                first_unit, last_unit = todays_units[0], todays_units[-1]
-                desc = build_description(first_unit, last_unit, mode)
-                schedule.append(
-                    {
-                        "date": current_date,
-                        "description": desc,
-                        "first_unit": first_unit,
-                        "last_unit": last_unit,
-                        "units": todays_units,
-                    }
-                )
-                unit_idx += len(todays_units)
-            current_date += timedelta(days=1)
+        day_ordinals = study_ordinals
+        if mode != "פרקים" and align_to_boundaries:
+            # אותו מספר ימים, עם חיתוכים מיושרים לגבולות סביב ההספק הקבוע
+            day_ordinals, day_starts, day_ends = segment_units_at_boundaries(
+                all_units.boundary_levels(), day_ordinals
+            )
+        else:
+            day_starts = np.arange(len(day_ordinals), dtype=np.int64) * units_per_day
+            day_ends = np.minimum(day_starts + units_per_day, total_units)
+
+    return day_ordinals, day_starts, day_ends
+
+
+def reschedule_study_schedule(
+    schedule,
+    pivot_date,
+    completed_units=None,
+    end_date=None,
+    no_study_weekdays=frozenset(),
+    units_per_day=None,
+    skip_holidays=False,
+    balance_chapters_by_mishnayot=False,
+    align_to_boundaries=False,
+):
+    """
+    מחשב מחדש את המשך הלוח מתאריך נתון (השלמת פיגור או שינוי ימי מנוחה).
+
+    ימי הלוח שלפני ``pivot_date`` נשמרים כפי שהם, והיחידות שטרם הושלמו
+    מחולקות מחדש על ימי הלימוד מ-``pivot_date`` ואילך, לפי הפרמטרים החדשים.
+
+    Args:
+        schedule (StudySchedule): הלוח הקיים.
+        pivot_date (date): היום הראשון של החלק המחושב מחדש.
+        completed_units (int, optional): מספר היחידות שכבר נלמדו מתחילת
+            הבחירה. ברירת המחדל - כל היחידות שתוכננו לפני pivot_date.
+        end_date (date, optional): תאריך הסיום החדש (במצב חלוקה לפי טווח).
+            ברירת המחדל - יום הלימוד האחרון של הלוח הקיים.
+        no_study_weekdays (set[int], optional): ימי החופשה השבועיים מעתה.
+        units_per_day (int, optional): הספק יומי קבוע מעתה.
+        skip_holidays (bool, optional): האם לדלג על חגים.
+        balance_chapters_by_mishnayot (bool or str, optional): ראו iter_study_schedule.
+        align_to_boundaries (bool, optional): ראו iter_study_schedule.
+
+    Returns:
+        StudySchedule | None: הלוח המעודכן, או None אם לא נמצאו ימי לימוד
+        ליחידות שנותרו.
+
+    Raises:
+        ValueError: אם ``completed_units`` מחוץ לטווח, או שבמצב חלוקה לפי
+        טווח תאריך הסיום קודם ל-``pivot_date``.
+    """
+    if not units_per_day:
+        if end_date is None:
+            end_date = schedule.last_date
+        if end_date < pivot_date:
+            raise ValueError("end_date is before pivot_date")
+    head = int(np.searchsorted(schedule.day_ordinals, pivot_date.toordinal()))
+    if completed_units is None:
+        completed_units = (
+            int(schedule.day_starts[head]) if head < len(schedule) else len(schedule.units)
+        )
+    if not 0 <= completed_units <= len(schedule.units):
+        raise ValueError("completed_units out of range")
+
+    day_ordinals = [schedule.day_ordinals[:head]]
+    day_starts = [schedule.day_starts[:head]]
+    day_ends = [schedule.day_ends[:head]]
+    remaining = schedule.units[completed_units:]
+    if len(remaining):
+        tail = _allocate_study_days(
+            remaining,
+            schedule.mode,
+            pivot_date,
+            end_date,
+            no_study_weekdays,
+            units_per_day,
+            skip_holidays,
+            balance_chapters_by_mishnayot,
+            align_to_boundaries,
+        )
+        if tail is None:
+            return None
+        day_ordinals.append(tail[0])
+        day_starts.append(tail[1] + completed_units)
+        day_ends.append(tail[2] + completed_units)
+
+    return StudySchedule(
+        schedule.units,
+        schedule.mode,
+        np.concatenate(day_ordinals),
+        np.concatenate(day_starts),
+        np.concatenate(day_ends),
+    )
+
+
+# ==================== מטמון לוחות לימוד ====================
+# לוחות מחושבים נשמרים לפי גיבוב קנוני של פרמטרי התוכנית, כך שייצוא חוזר
+# (ICS, HTML ו-PDF לאותם נתונים) אינו מחשב את הלוח שוב. השכבה בזיכרון היא
+# LRU; השכבה בדיסק אופציונלית (ראו configure_schedule_cache) ושומרת את גבולות
+# הימים ואת טווחי הבחירה בקובץ npz לכל לוח.
+SCHEDULE_CACHE_VERSION = 1
+SCHEDULE_CACHE = OrderedDict()
+SCHEDULE_CACHE_SIZE = 32
+SCHEDULE_CACHE_DIR = None  # None - ללא שכבת דיסק
+SCHEDULE_CACHE_DISK_ENTRIES = 64
+
+
+def configure_schedule_cache(disk_dir=None, memory_size=32, disk_entries=64):
+    """
+    מגדיר את מטמון הלוחות.
+
+    Args:
+        disk_dir (str | None, optional): תיקיית המטמון בדיסק. None מבטל את שכבת הדיסק.
+        memory_size (int, optional): מספר הלוחות המרבי בזיכרון.
+        disk_entries (int, optional): מספר הקבצים המרבי בתיקיית המטמון;
+            הקבצים שהשימוש בהם הוא הישן ביותר נמחקים תחילה.
+    """
+    global SCHEDULE_CACHE_DIR, SCHEDULE_CACHE_SIZE, SCHEDULE_CACHE_DISK_ENTRIES
+    SCHEDULE_CACHE_DIR = disk_dir
+    SCHEDULE_CACHE_SIZE = memory_size
+    SCHEDULE_CACHE_DISK_ENTRIES = disk_entries
+    while len(SCHEDULE_CACHE) > SCHEDULE_CACHE_SIZE:
+        SCHEDULE_CACHE.popitem(last=False)
+
+
+def schedule_cache_key(
+    start_date,
+    end_date,
+    titles_list,
+    mode,
+    tree_data,
+    no_study_weekdays,
+    units_per_day=None,
+    skip_holidays=False,
+    balance_chapters_by_mishnayot=False,
+    align_to_boundaries=False,
+) -> str:
+    """
+    מחשב מפתח קנוני ללוח: פרמטרים שאינם משפיעים על התוצאה (למשל תאריך
+    הסיום במצב הספק קבוע) אינם נכללים, וגרסת העץ נלקחת מתוכן האינדקס.
+
+    Returns:
+        str: גיבוב sha256 הקסדצימלי.
+    """
+    range_mode = units_per_day is None
+    payload = {
+        "version": SCHEDULE_CACHE_VERSION,
+        "titles": list(titles_list),
+        "mode": mode,
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat() if range_mode else None,
+        "weekdays": sorted(no_study_weekdays),
+        "skip_holidays": bool(skip_holidays),
+        "calendar": _pyluach_version() if skip_holidays else None,
+        "units_per_day": units_per_day,
+        "balance": (
+            _resolve_balance_strategy(balance_chapters_by_mishnayot)
+            if range_mode and mode == "פרקים"
+            else None
+        ),
+        "align": bool(align_to_boundaries) and mode != "פרקים",
+        "tree": get_tree_index(tree_data).fingerprint(),
+    }
+    blob = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def _schedule_cache_path(key: str) -> str:
+    return os.path.join(SCHEDULE_CACHE_DIR, f"{key}.npz")
+
+
+def _read_cached_schedule(key, tree_data, mode):
+    """טוען לוח משכבת הדיסק, או None אם אינו קיים או פגום."""
+    path = _schedule_cache_path(key)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            ranges = data["ranges"].reshape(-1, 2).tolist()
+            days = data["day_ordinals"], data["day_starts"], data["day_ends"]
+        os.utime(path)  # סימון שימוש לצורך פינוי הקבצים הישנים
+    except (OSError, ValueError, KeyError):
+        return None
+    units = UnitSelection(get_unit_numbering(tree_data, mode), ranges)
+    if len(days[0]) == 0 or int(days[2][-1]) > len(units):
+        return None
+    return StudySchedule(units, mode, *days)
+
+
+def _write_cached_schedule(key, schedule):
+    """שומר לוח בשכבת הדיסק ומפנה קבצים ישנים מעבר למגבלה."""
+    path = _schedule_cache_path(key)
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(SCHEDULE_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ranges=np.asarray(schedule.units.ranges, dtype=np.int64).reshape(-1, 2),
+                day_ordinals=schedule.day_ordinals,
+                day_starts=schedule.day_starts,
+                day_ends=schedule.day_ends,
+            )
+        os.replace(tmp_path, path)
+        entries = [
+            os.path.join(SCHEDULE_CACHE_DIR, name)
+            for name in os.listdir(SCHEDULE_CACHE_DIR)
+            if name.endswith(".npz")
+        ]
+        if len(entries) > SCHEDULE_CACHE_DISK_ENTRIES:
+            entries.sort(key=os.path.getmtime)
+            for stale in entries[: len(entries) - SCHEDULE_CACHE_DISK_ENTRIES]:
+                os.remove(stale)
+    except OSError as e:
+        print(f"אזהרה: לא ניתן לשמור את הלוח במטמון ({e}).")
+
+
+def get_study_schedule(
+    start_date,
+    end_date,
+    titles_list,
+    mode,
+    tree_data,
+    no_study_weekdays,
+    units_per_day=None,
+    skip_holidays=False,
+    balance_chapters_by_mishnayot=False,
+    align_to_boundaries=False,
+):
+    """
+    מחזיר את הלוח המחושב (כמו build_study_schedule) דרך מטמון הלוחות.
+
+    הלוח המוחזר משותף לכל הקוראים, ולכן מערכיו מסומנים לקריאה בלבד.
 
+    Returns:
+        StudySchedule | None: הלוח המחושב, או ``None`` אם אין מה ללמוד.
+    """
+    args = (
+        start_date,
+        end_date,
+        titles_list,
+        mode,
+        tree_data,
+        no_study_weekdays,
+        units_per_day,
+        skip_holidays,
+        balance_chapters_by_mishnayot,
+        align_to_boundaries,
+    )
+    key = schedule_cache_key(*args)
+    schedule = SCHEDULE_CACHE.get(key)
+    if schedule is not None:
+        SCHEDULE_CACHE.move_to_end(key)
+        return schedule
+
+    if SCHEDULE_CACHE_DIR is not None:
+        schedule = _read_cached_schedule(key, tree_data, mode)
+    if schedule is None:
+        schedule = build_study_schedule(*args)
+        if schedule is None:
+            return None
+        if SCHEDULE_CACHE_DIR is not None:
+            _write_cached_schedule(key, schedule)
+
+    for array in (schedule.day_ordinals, schedule.day_starts, schedule.day_ends):
+        array.flags.writeable = False
+    SCHEDULE_CACHE[key] = schedule
+    while len(SCHEDULE_CACHE) > SCHEDULE_CACHE_SIZE:
+        SCHEDULE_CACHE.popitem(last=False)
     return schedule
 
 
+# ==================== מחזורי לימוד נצחיים ====================
+class StudyCycle:
+    """
+    מחזור לימוד חוזר בהספק קבוע (למשל דף יומי), המעוגן בתאריך התחלה.
+
+    ימי הלימוד נקבעים לפי ימות השבוע בלבד, ולכן מספר ימי הלימוד בין שני
+    תאריכים מחושב בחשבון מודולרי על שבועות שלמים, ומיקום היום במחזור הוא
+    שארית החלוקה במספר הימים במחזור. כך ניתן לחשב את הלימוד של כל תאריך -
+    בעבר או בעתיד - בזמן קבוע, בלי לעבור על הימים שבדרך.
+    """
+
+    def __init__(
+        self, units, mode, anchor_date, units_per_day, no_study_weekdays=frozenset()
+    ):
+        """
+        Args:
+            units (UnitSelection): יחידות המחזור לפי סדר הלימוד.
+            mode (str): סוג הלימוד.
+            anchor_date (date): תחילת המחזור הראשון. אם אינו יום לימוד,
+                המחזור מתחיל ביום הלימוד הבא.
+            units_per_day (int): מספר יחידות ליום.
+            no_study_weekdays (set[int], optional): ימים בשבוע בהם אין לימוד.
+        """
+        if len(units) == 0:
+            raise ValueError("cycle has no study units")
+        if units_per_day < 1:
+            raise ValueError("units_per_day must be positive")
+        # ordinal % 7 == r מתאים ל-weekday() == (r - 1) % 7
+        self._study_residues = [
+            r for r in range(7) if (r - 1) % 7 not in no_study_weekdays
+        ]
+        if not self._study_residues:
+            raise ValueError("no study weekdays")
+        self._residue_prefix = [0] * 8
+        for r in range(7):
+            self._residue_prefix[r + 1] = self._residue_prefix[r] + (
+                r in self._study_residues
+            )
+        self.units = units
+        self.mode = mode
+        self.anchor_date = anchor_date
+        self.units_per_day = units_per_day
+        self.days_per_cycle = math.ceil(len(units) / units_per_day)
+        self._anchor_count = self._count_before(anchor_date.toordinal())
+
+    def _count_before(self, ordinal: int) -> int:
+        """מספר ימי הלימוד שלפני ה-ordinal, מנקודת ייחוס קבועה."""
+        weeks, residue = divmod(ordinal, 7)
+        return weeks * len(self._study_residues) + self._residue_prefix[residue]
+
+    def _ordinal_of_session(self, session: int) -> int:
+        """ה-ordinal של יום הלימוד ה-session מתחילת המחזור הראשון (ספירה מ-0)."""
+        weeks, k = divmod(self._anchor_count + session, len(self._study_residues))
+        return weeks * 7 + self._study_residues[k]
+
+    def is_study_day(self, gregorian_date) -> bool:
+        """בודק האם התאריך הוא יום לימוד במחזור."""
+        return gregorian_date.toordinal() % 7 in self._study_residues
+
+    def session_number(self, gregorian_date) -> int | None:
+        """
+        מחזיר את מספר יום הלימוד מתחילת המחזור הראשון (שלילי לפני העוגן),
+        או None אם התאריך אינו יום לימוד.
+        """
+        if not self.is_study_day(gregorian_date):
+            return None
+        return self._count_before(gregorian_date.toordinal()) - self._anchor_count
+
+    def cycle_of(self, gregorian_date) -> int:
+        """מספר המחזור (מ-0 בעוגן, שלילי לפניו) שבו חל התאריך."""
+        session = self._count_before(gregorian_date.toordinal()) - self._anchor_count
+        return session // self.days_per_cycle
+
+    def _session_record(self, session: int) -> dict:
+        cycle, day_in_cycle = divmod(session, self.days_per_cycle)
+        day_start = day_in_cycle * self.units_per_day
+        day_end = min(day_start + self.units_per_day, len(self.units))
+        record = _study_day_record(
+            self.units, self.mode, self._ordinal_of_session(session), day_start, day_end
+        )
+        record["cycle"] = cycle
+        return record
+
+    def portion_on(self, gregorian_date) -> dict | None:
+        """
+        מחזיר את רשומת הלימוד של התאריך הנתון, או None אם אינו יום לימוד.
+        הרשומה כוללת גם את ``cycle`` - מספר המחזור.
+        """
+        session = self.session_number(gregorian_date)
+        return None if session is None else self._session_record(session)
+
+    def date_of_unit(self, position: int, cycle: int = 0) -> date:
+        """מחזיר את התאריך שבו נלמדת היחידה במיקום הנתון, במחזור המבוקש."""
+        if position < 0:
+            position += len(self.units)
+        if not 0 <= position < len(self.units):
+            raise IndexError("unit position out of range")
+        session = cycle * self.days_per_cycle + position // self.units_per_day
+        return date.fromordinal(self._ordinal_of_session(session))
+
+    def window(self, from_date, days: int = 30):
+        """
+        מפיק את ימי הלימוד שבחלון ``[from_date, from_date + days)``.
+
+        Yields:
+            dict: רשומות ימי הלימוד שבחלון, לפי הסדר.
+        """
+        first_ordinal = from_date.toordinal()
+        first = self._count_before(first_ordinal) - self._anchor_count
+        stop = self._count_before(first_ordinal + max(days, 0)) - self._anchor_count
+        for session in range(first, stop):
+            yield self._session_record(session)
+
+
+def build_study_cycle(
+    titles_list,
+    mode,
+    tree_data,
+    anchor_date,
+    units_per_day,
+    no_study_weekdays=frozenset(),
+):
+    """
+    בונה מחזור לימוד נצחי על הבחירה.
+
+    Args:
+        titles_list (list[str]): רשימת הנתיבים של הפריטים הנלמדים.
+        mode (str): סוג הלימוד.
+        tree_data (dict or TreeIndex): עץ הנתונים המלא.
+        anchor_date (date): תחילת המחזור הראשון.
+        units_per_day (int): מספר יחידות ליום.
+        no_study_weekdays (set[int], optional): ימים בשבוע בהם אין לימוד.
+
+    Returns:
+        StudyCycle | None: המחזור, או None אם הבחירה ריקה.
+    """
+    units = resolve_selection(titles_list, tree_data, mode)
+    if len(units) == 0:
+        return None
+    return StudyCycle(units, mode, anchor_date, units_per_day, no_study_weekdays)
+
+
+def _schedule_days_for_export(
+    titles_list,
+    mode,
+    start_date,
+    end_date,
+    tree_data,
+    no_study_weekdays_set,
+    units_per_day,
+    skip_holidays,
+    balance_chapters_by_mishnayot,
+    align_to_boundaries,
+    cycle_anchor,
+    schedule=None,
+):
+    """
+    מחשב את ימי הלימוד לייצוא ואת תאריך הסיום בפועל.
+
+    כאשר ``cycle_anchor`` נתון, מיוצא חלון ``[start_date, end_date]`` של
+    מחזור נצחי המעוגן בתאריך זה; כאשר ``schedule`` נתון (למשל לוח שחושב
+    מחדש ב-reschedule_study_schedule) הוא מיוצא כמות שהוא; אחרת - הלוח
+    הרגיל מ-start_date.
+
+    Returns:
+        tuple | None: ``(days, actual_end_date)`` - איטרטור על רשומות הימים
+        ותאריך הסיום בפועל, או None אם אין מה ללמוד.
+    """
+    if cycle_anchor is not None:
+        if not units_per_day:
+            raise ValueError("cycle mode requires units_per_day")
+        if skip_holidays:
+            raise ValueError("cycle mode does not support skipping holidays")
+        cycle = build_study_cycle(
+            titles_list,
+            mode,
+            tree_data,
+            cycle_anchor,
+            units_per_day,
+            no_study_weekdays_set,
+        )
+        if cycle is None:
+            return None
+        return cycle.window(start_date, (end_date - start_date).days + 1), end_date
+
+    if schedule is not None:
+        return iter(schedule), schedule.last_date if units_per_day else end_date
+    schedule = get_study_schedule(
+        start_date,
+        end_date,
+        titles_list,
+        mode,
+        tree_data,
+        no_study_weekdays_set,
+        units_per_day,
+        skip_holidays,
+        balance_chapters_by_mishnayot,
+        align_to_boundaries,
+    )
+    if schedule is None:
+        return None
+    return iter(schedule), schedule.last_date if units_per_day else end_date
+
+
+def iter_study_schedule(
+    start_date,
+    end_date,
+    titles_list,
+    mode,
+    tree_data,
+    no_study_weekdays,
+    units_per_day=None,
+    skip_holidays=False,
+    balance_chapters_by_mishnayot=False,
+    align_to_boundaries=False,
+):
+    """
+    מייצר את לוח הלימודים המפורט יום אחר יום, באופן עצל.
+
+    החלוקה לימים מחושבת מראש כמערכים קטנים (ראו build_study_schedule) ונשמרת
+    במטמון הלוחות (ראו get_study_schedule), אך רשומת כל יום - התיאור והיחידות -
+    נבנית רק כשמגיעים אליה. כך ניתן לייצא תוכניות ארוכות מאוד בזיכרון קבוע.
+
+    Args:
+        start_date (date): תאריך התחלת הלימוד.
+        end_date (date): תאריך סיום הלימוד (במצב חלוקה לפי טווח).
+        titles_list (list[str]): רשימת הנתיבים של הפריטים הנלמדים.
+        mode (str): סוג הלימוד ("פרקים", "משניות", "דפים", "עמודים").
+        tree_data (dict): עץ הנתונים המלא.
+        no_study_weekdays (set[int]): קבוצת ימי חופשה שבועיים.
+        units_per_day (int, optional): מספר יחידות לימוד ביום (במצב הספק קבוע).
+                                       אם None, הלימוד מחולק על פני טווח התאריכים.
+        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
+        balance_chapters_by_mishnayot (bool or str, optional):
+            איזון פרקי משניות לפי מספר המשניות בכל פרק. ``True`` בוחר ב-
+            BALANCE_PROPORTIONAL; ניתן גם להעביר שם אסטרטגיה מ-BALANCE_STRATEGIES.
+        align_to_boundaries (bool, optional):
+            במצבי משניות/דפים/עמודים - לסיים ימים בסוף פרק או מסכת כשהדבר
+            אפשרי בסטייה קטנה מהיעד היומי (ראו segment_units_at_boundaries).
+    Yields:
+        dict: אירוע לימוד ליום אחד, לפי סדר התאריכים. כל פריט מכיל:
+            - ``date``: התאריך הגרגוריאני.
+            - ``description``: תיאור הלימוד ליום.
+            - ``first_unit`` ו-``last_unit``: פרטי היחידות הפותחות והחותמות
+              את הלימוד באותו יום.
+            - ``units``: יחידות היום (UnitSelection, מפוענחות לפי דרישה).
+    """
+    schedule = get_study_schedule(
+        start_date,
+        end_date,
+        titles_list,
+        mode,
+        tree_data,
+        no_study_weekdays,
+        units_per_day,
+        skip_holidays,
+        balance_chapters_by_mishnayot,
+        align_to_boundaries,
+    )
+    if schedule is not None:
+        yield from schedule
+
+
+def _generate_study_schedule(
+    start_date,
+    end_date,
+    titles_list,
+    mode,
+    tree_data,
+    no_study_weekdays,
+    units_per_day=None,
+    skip_holidays=False,
+    balance_chapters_by_mishnayot=False,
+    align_to_boundaries=False,
+):
+    """
+    מחזיר את לוח הלימודים כרשימה מלאה (ראו iter_study_schedule).
+
+    Returns:
+        list[dict]: רשימת אירועי לימוד לפי סדר התאריכים.
+    """
+    return list(
+        iter_study_schedule(
+            start_date,
+            end_date,
+            titles_list,
+            mode,
+            tree_data,
+            no_study_weekdays,
+            units_per_day,
+            skip_holidays,
+            balance_chapters_by_mishnayot,
+            align_to_boundaries,
+        )
+    )
+
+
 # פונקציה עזר משותפת לבניית התיאור
 def build_description(first_unit, last_unit, mode):
     """
     בונה את מחרוזת התיאור עבור יום לימוד, על סמך היחידה הראשונה והאחרונה הנלמדות באותו יום.
 
     Args:
-        first_unit (dict): פרטי היחידה הראשונה ליום.
-        last_unit (dict): פרטי היחידה האחרונה ליום.
+        first_unit (StudyUnit or dict): פרטי היחידה הראשונה ליום.
+        last_unit (StudyUnit or dict): פרטי היחידה האחרונה ליום.
         mode (str): סוג הלימוד.
 
     Returns:
         str: מחרוזת התיאור.
     """
+    first_unit = StudyUnit.coerce(first_unit)
+    last_unit = StudyUnit.coerce(last_unit)
+    first_book, last_book = first_unit.book_display_name, last_unit.book_display_name
     if mode == "פרקים":
-        if first_unit["book_display_name"] == last_unit["book_display_name"]:
-            desc = f"{first_unit['book_display_name']} – {first_unit['chapter_name']}"
-            if first_unit["chapter_name"] != last_unit["chapter_name"]:
-                desc += f" עד {last_unit['chapter_name']}"
+        first_chap, last_chap = first_unit.chapter_name, last_unit.chapter_name
+        if first_book == last_book:
+            desc = f"{first_book} – {first_chap}"
+            if first_chap != last_chap:
+                desc += f" עד {last_chap}"
         else:
-            desc = f"מ-{first_unit['book_display_name']} {first_unit['chapter_name']} עד {last_unit['book_display_name']} {last_unit['chapter_name']}"
+            desc = f"מ-{first_book} {first_chap} עד {last_book} {last_chap}"
     else:
-        if first_unit["book_display_name"] == last_unit["book_display_name"]:
-            desc = f"{first_unit['book_display_name']} – {first_unit['unit_type']} {first_unit['unit_display_name']}"
-            if first_unit["unit_display_name"] != last_unit["unit_display_name"]:
-                desc += f" עד {last_unit['unit_type']} {last_unit['unit_display_name']}"
+        first_name = f"{first_unit.unit_type} {first_unit.unit_display_name}"
+        last_name = f"{last_unit.unit_type} {last_unit.unit_display_name}"
+        if first_book == last_book:
+            desc = f"{first_book} – {first_name}"
+            if first_unit.unit_display_name != last_unit.unit_display_name:
+                desc += f" עד {last_name}"
         else:
-            desc = f"מ-{first_unit['book_display_name']} {first_unit['unit_type']} {first_unit['unit_display_name']} עד {last_unit['book_display_name']} {last_unit['unit_type']} {last_unit['unit_display_name']}"
+            desc = f"מ-{first_book} {first_name} עד {last_book} {last_name}"
     return desc
 
 
+DEFAULT_TREE_FILE = "torah_tree_data_full.json"
 TORAH_TREE_CACHE = None
 
 
-def _load_torah_tree():
-    """Load and cache the main Torah tree data used for book lengths."""
-    global TORAH_TREE_CACHE
-    if TORAH_TREE_CACHE is None:
-        with open(resource_path("torah_tree_data_full.json"), "r", encoding="utf-8") as f:
-            TORAH_TREE_CACHE = json.load(f)
-    return TORAH_TREE_CACHE
+def _load_torah_tree():
+    """Load and cache the compiled index of the main Torah tree used for book lengths."""
+    global TORAH_TREE_CACHE
+    if TORAH_TREE_CACHE is None:
+        TORAH_TREE_CACHE = load_tree_index(DEFAULT_TREE_FILE)
+    return TORAH_TREE_CACHE
+
+
+SEFARIA_MAP_FILE = "sefaria_masechet_map.json"
+_AMUD_PATTERN = re.compile(r"(\d+)([ab])")
+
+
+class SefariaRefResolver:
+    """
+    בונה הפניות ספריא ליחידות לימוד, עם כל הנתונים הנדרשים טעונים מראש.
+
+    מפת המסכתות נקראת פעם אחת, ולכל ספר נשמרים (בפעם הראשונה שהוא נדרש)
+    שם הספר בספריא, הפרק האחרון, מספר המשניות בפרק האחרון והעמוד האחרון -
+    כך שבניית הפניה אינה קוראת קבצים ואינה מנווטת בעץ שוב.
+    """
+
+    def __init__(self, tree, masechet_map):
+        """
+        Args:
+            tree (TreeIndex): עץ הספרים (לאורכי הספרים בהפניות חוצות-ספר).
+            masechet_map (dict[str, str]): שמות המסכתות בספריא.
+        """
+        self.tree = tree
+        self.masechet_map = dict(masechet_map)
+        self._path_parts = {}  # book_display_name -> (ספר, פרק מהנתיב, נתיב הספר)
+        self._book_names = {}  # (קטגוריה, ספר) -> שם הספר בספריא
+        self._book_info = {}  # נתיב הספר -> נתוני סוף הספר
+
+    @classmethod
+    def from_files(cls, tree_path=DEFAULT_TREE_FILE, map_path=SEFARIA_MAP_FILE):
+        """בונה מתרגם מקובץ העץ ומקובץ מפת המסכתות."""
+        with open(resource_path(map_path), "r", encoding="utf-8") as f:
+            masechet_map = json.load(f)
+        tree = _load_torah_tree() if tree_path == DEFAULT_TREE_FILE else load_tree_index(tree_path)
+        return cls(tree, masechet_map)
+
+    def _split_path(self, book_display_name):
+        """מפרק את נתיב היחידה לשם הספר, לפרק (אם הנתיב מסתיים בפרק) ולנתיב הספר."""
+        parts = self._path_parts.get(book_display_name)
+        if parts is None:
+            names = book_display_name.split(" / ")
+            if names[-1].startswith("פרק "):
+                book = names[-2] if len(names) > 1 else None
+                parts = (book, names[-1].split()[-1], " / ".join(names[:-1]))
+            else:
+                parts = (names[-1], None, book_display_name)
+            self._path_parts[book_display_name] = parts
+        return parts
+
+    def _extract(self, unit, mode):
+        book, chap, _ = self._split_path(unit.book_display_name or "")
+        if chap is None and mode == "פרקים" and unit.chapter_name is not None:
+            chap = unit.chapter_name.split()[-1]
+        return book, chap
+
+    def sefaria_book(self, book, category):
+        """מחזיר את שם הספר בספריא לפי הקטגוריה, או None אם אינו ידוע."""
+        key = (category, book)
+        if key not in self._book_names:
+            if category == "talmud":
+                name = self.masechet_map.get(book.replace("מסכת ", ""))
+            elif category == "mishnah" and not book.startswith("משנה_"):
+                name = f"משנה_{book}"
+            else:
+                name = book
+            self._book_names[key] = name or None
+        return self._book_names[key]
+
+    def book_info(self, book_path):
+        """
+        מחזיר את נתוני סוף הספר: ``last_chapter`` (מספר), ``last_perek``
+        (שם בגימטריה), ``last_mishnah`` ו-``last_amud`` (עמוד וצד), או None
+        אם הספר אינו בעץ.
+        """
+        if book_path in self._book_info:
+            return self._book_info[book_path]
+        tree = self.tree
+        node = tree.find(book_path)
+        info = None
+        if node is not None and tree.is_branch[node]:
+            chapter_nums = [
+                Gematria.gematria_to_int(tree.names[c].split()[-1])
+                for c in tree.chapter_children(node)
+            ]
+            last_perek = last_mishnah = None
+            if chapter_nums:
+                last_perek = _convert_int_to_hebrew_gematria(max(chapter_nums))
+                last_node = tree.find(f"{book_path} / פרק {last_perek}")
+                if last_node is not None and tree.mishnayot[last_node] >= 0:
+                    last_mishnah = int(tree.mishnayot[last_node])
+            if tree.chapters[node] >= 0:
+                last_chapter = int(tree.chapters[node])
+            else:
+                last_chapter = max(chapter_nums) if chapter_nums else None
+            m = _AMUD_PATTERN.match(tree.last_amud[node] or "")
+            info = {
+                "last_chapter": last_chapter,
+                "last_perek": last_perek,
+                "last_mishnah": last_mishnah,
+                "last_amud": (int(m.group(1)), m.group(2)) if m else None,
+            }
+        self._book_info[book_path] = info
+        return info
+
+    def resolve(self, first_unit, last_unit, mode):
+        """
+        בונה את הפניית ספריא לטווח היחידות. כאשר הטווח חוצה שני ספרים
+        מוחזרות שתי הפניות.
+
+        Returns:
+            str | list[str] | None: ההפניה, זוג הפניות, או None.
+        """
+        first_unit = StudyUnit.coerce(first_unit)
+        last_unit = StudyUnit.coerce(last_unit)
+        sb, sch = self._extract(first_unit, mode)
+        eb, ech = self._extract(last_unit, mode)
+        if not sb:
+            return None
+
+        book = self.sefaria_book(sb, detect_content_category(first_unit))
+        if not book:
+            return None
+
+        if eb and eb != sb:
+            return self._resolve_cross_book(
+                first_unit, last_unit, mode, book, sch, eb, ech
+            )
+
+        if mode == "פרקים":
+            s = (first_unit.chapter_name or "").split()[-1]
+            e = (last_unit.chapter_name or "").split()[-1]
+            if not s or not e:
+                return None
+            return f"{book}.{s}" if s == e else f"{book}.{s}-{e}"
 
+        if mode == "משניות":
+            s_m, e_m = first_unit.unit_num_int, last_unit.unit_num_int
+            if sch is None or s_m is None or e_m is None:
+                return None
+            if sch == ech:
+                return f"{book}.{sch}.{s_m}" if s_m == e_m else f"{book}.{sch}.{s_m}-{e_m}"
+            if ech is None:
+                return None
+            return f"{book}.{sch}.{s_m}-{ech}.{e_m}"
 
-def build_sefaria_ref(
-    first_unit: dict, last_unit: dict, mode: str
-) -> str | list[str] | None:
-    """Construct Sefaria reference(s).
+        if mode == "דפים":
+            s_d, e_d = first_unit.unit_num_int, last_unit.unit_num_int
+            if s_d is None or e_d is None:
+                return None
+            return f"{book}.{s_d}a" if s_d == e_d else f"{book}.{s_d}a-{e_d}b"
 
-    ``mode`` indicates the unit granularity (פרקים/משניות/דפים/עמודים) only.
-    The content category (Tanakh/Mishnah/Talmud) is detected from the path of
-    ``first_unit``.  When the portion spans two different books, two references
-    are returned.
-    """
-    with open(resource_path("sefaria_masechet_map.json"), "r", encoding="utf-8") as f:
-        SEFARIA_MASECHET_MAP = json.load(f)
-
-    def extract(unit):
-        name = unit.get("book_display_name", "")
-        parts = name.split(" / ")
-        book = chap = None
-        if parts:
-            if parts[-1].startswith("פרק "):
-                chap = parts[-1].split()[-1]
-                book = parts[-2] if len(parts) > 1 else None
-            else:
-                book = parts[-1]
-                if mode == "פרקים" and "chapter_name" in unit:
-                    chap = unit["chapter_name"].split()[-1]
-        return book, chap
+        if mode == "עמודים":
+            s_d, e_d = first_unit.unit_num_int, last_unit.unit_num_int
+            s_side, e_side = first_unit.side, last_unit.side
+            if None in (s_d, e_d, s_side, e_side):
+                return None
+            start = f"{s_d}{s_side}"
+            end = f"{e_d}{e_side}"
+            return f"{book}.{start}" if start == end else f"{book}.{start}-{end}"
 
-    sb, sch = extract(first_unit)
-    eb, ech = extract(last_unit)
-    if not sb:
         return None
-    cross_book = eb and eb != sb
 
-    category = detect_content_category(first_unit)
-    book = sb
-    if category == "talmud":
-        masechet = book.replace("מסכת ", "")
-        book = SEFARIA_MASECHET_MAP.get(masechet)
-        if not book:
+    def _resolve_cross_book(self, first_unit, last_unit, mode, book, sch, eb, ech):
+        """הפניות לטווח החוצה ספר: מהיחידה הראשונה עד סוף ספרה, ומתחילת הספר השני."""
+        info = self.book_info(self._split_path(first_unit.book_display_name)[2])
+        if info is None:
             return None
-    elif category == "mishnah":
-        if not book.startswith("משנה_"):
-            book = f"משנה_{book}"
-
-    if cross_book:
-        tree = _load_torah_tree()
-        first_path_parts = first_unit["book_display_name"].split(" / ")
-        if first_path_parts[-1].startswith("פרק "):
-            first_path_parts = first_path_parts[:-1]
-        first_node = _get_node_from_path(first_path_parts, tree)
-        if not first_node:
+        book2 = self.sefaria_book(eb, detect_content_category(last_unit))
+        if not book2:
             return None
 
-        # map second book name
-        category2 = detect_content_category(last_unit)
-        book2 = eb
-        if category2 == "talmud":
-            masechet = book2.replace("מסכת ", "")
-            book2 = SEFARIA_MASECHET_MAP.get(masechet)
-            if not book2:
-                return None
-        elif category2 == "mishnah":
-            if not book2.startswith("משנה_"):
-                book2 = f"משנה_{book2}"
-
         if mode == "פרקים":
-            last_chap_num = None
-            if "פרקים" in first_node and isinstance(first_node["פרקים"], int):
-                last_chap_num = first_node["פרקים"]
-            else:
-                ch_keys = [k for k in first_node if k.startswith("פרק ")]
-                if ch_keys:
-                    last_chap_num = max(
-                        Gematria.gematria_to_int(k.split()[-1]) for k in ch_keys
-                    )
-            if last_chap_num is None:
+            if info["last_chapter"] is None:
                 return None
-
-            end_first = _convert_int_to_hebrew_gematria(last_chap_num)
-            s = first_unit.get("chapter_name", "").split()[-1]
+            end_first = _convert_int_to_hebrew_gematria(info["last_chapter"])
+            s = (first_unit.chapter_name or "").split()[-1]
             if not s or not ech:
                 return None
-
             ref1 = f"{book}.{s}" if s == end_first else f"{book}.{s}-{end_first}"
             ref2 = f"{book2}.א" if ech == "א" else f"{book2}.א-{ech}"
             return [ref1, ref2]
 
         if mode == "משניות":
-            ch_keys = [k for k in first_node if k.startswith("פרק ")]
-            if not ch_keys:
-                return None
-            last_ch_num = max(Gematria.gematria_to_int(k.split()[-1]) for k in ch_keys)
-            end_ch_name = _convert_int_to_hebrew_gematria(last_ch_num)
-            last_ch_node = first_node.get(f"פרק {end_ch_name}")
-            if not isinstance(last_ch_node, dict) or "משניות" not in last_ch_node:
+            if info["last_perek"] is None or info["last_mishnah"] is None:
                 return None
-            last_mish = last_ch_node["משניות"]
-            s_m = first_unit.get("unit_num_int")
-            if sch is None or s_m is None or ech is None or last_mish is None:
+            s_m = first_unit.unit_num_int
+            if sch is None or s_m is None or ech is None:
                 return None
-            ref1 = f"{book}.{sch}.{s_m}-{end_ch_name}.{last_mish}"
+            ref1 = f"{book}.{sch}.{s_m}-{info['last_perek']}.{info['last_mishnah']}"
             ref2 = (
                 f"{book2}.א.1"
-                if ech == "א" and last_unit.get("unit_num_int") == 1
-                else f"{book2}.א.1-{ech}.{last_unit.get('unit_num_int')}"
+                if ech == "א" and last_unit.unit_num_int == 1
+                else f"{book2}.א.1-{ech}.{last_unit.unit_num_int}"
             )
             return [ref1, ref2]
 
-        if mode == "דפים":
-            end_str = first_node.get("עמוד אחרון")
-            if not end_str:
-                return None
-            m = re.match(r"(\d+)([ab])", end_str)
-            if not m:
-                return None
-            end_page = int(m.group(1))
-            end_side = m.group(2)
-            s_d = first_unit.get("unit_num_int")
-            e_d = last_unit.get("unit_num_int")
-            if s_d is None or e_d is None:
-                return None
-            ref1 = f"{book}.{s_d}a-{end_page}{end_side}"
-            ref2 = f"{book2}.2a-{e_d}b" if e_d != 2 else f"{book2}.2a"
-            return [ref1, ref2]
-
-        if mode == "עמודים":
-            end_str = first_node.get("עמוד אחרון")
-            if not end_str:
+        if mode in ("דפים", "עמודים"):
+            if info["last_amud"] is None:
                 return None
-            m = re.match(r"(\d+)([ab])", end_str)
-            if not m:
-                return None
-            end_page = int(m.group(1))
-            end_side = m.group(2)
-            s_d = first_unit.get("unit_num_int")
-            s_side = first_unit.get("side")
-            e_d = last_unit.get("unit_num_int")
-            e_side = last_unit.get("side")
+            end_page, end_side = info["last_amud"]
+            s_d, e_d = first_unit.unit_num_int, last_unit.unit_num_int
+            if mode == "דפים":
+                if s_d is None or e_d is None:
+                    return None
+                ref1 = f"{book}.{s_d}a-{end_page}{end_side}"
+                ref2 = f"{book2}.2a-{e_d}b" if e_d != 2 else f"{book2}.2a"
+                return [ref1, ref2]
+            s_side, e_side = first_unit.side, last_unit.side
             if None in (s_d, s_side, e_d, e_side):
                 return None
             ref1 = f"{book}.{s_d}{s_side}-{end_page}{end_side}"
-            start_second = "2a"
             end_second = f"{e_d}{e_side}"
-            ref2 = (
-                f"{book2}.{start_second}-{end_second}"
-                if end_second != start_second
-                else f"{book2}.{start_second}"
-            )
+            ref2 = f"{book2}.2a-{end_second}" if end_second != "2a" else f"{book2}.2a"
             return [ref1, ref2]
 
-    if mode == "פרקים":
-        s = first_unit.get("chapter_name", "").split()[-1]
-        e = last_unit.get("chapter_name", "").split()[-1]
-        if not s or not e:
-            return None
-        ref = f"{book}.{s}" if s == e else f"{book}.{s}-{e}"
-        return ref
+        return None
 
-    if mode == "משניות":
-        s_m, e_m = first_unit.get("unit_num_int"), last_unit.get("unit_num_int")
-        if sch is None or s_m is None or e_m is None:
-            return None
-        if sch == ech:
-            ref = f"{book}.{sch}.{s_m}" if s_m == e_m else f"{book}.{sch}.{s_m}-{e_m}"
-        else:
-            if ech is None:
-                return None
-            ref = f"{book}.{sch}.{s_m}-{ech}.{e_m}"
-        return ref
+    def resolve_many(self, units, mode):
+        """
+        מחזיר את ההפניה של כל יחידה בנפרד, לפי הסדר (כמו ``resolve(u, u)``).
 
-    if mode == "דפים":
-        s_d, e_d = first_unit.get("unit_num_int"), last_unit.get("unit_num_int")
-        if s_d is None or e_d is None:
-            return None
-        ref = f"{book}.{s_d}a" if s_d == e_d else f"{book}.{s_d}a-{e_d}b"
-        return ref
+        היחידות מקובצות לרצפים מאותו ספר: שם הספר בספריא והקטגוריה נקבעים
+        פעם אחת לכל רצף, וכל יחידה נבנית ישירות מהמספר שלה.
 
-    if mode == "עמודים":
-        s_d, e_d = first_unit.get("unit_num_int"), last_unit.get("unit_num_int")
-        s_side, e_side = first_unit.get("side"), last_unit.get("side")
-        if None in (s_d, e_d, s_side, e_side):
-            return None
-        start = f"{s_d}{s_side}"
-        end = f"{e_d}{e_side}"
-        ref = f"{book}.{start}" if start == end else f"{book}.{start}-{end}"
-        return ref
+        Args:
+            units (Iterable[StudyUnit | dict]): היחידות, למשל UnitSelection.
+            mode (str): סוג הלימוד.
 
-    return None
+        Returns:
+            list[str | None]: הפניה לכל יחידה (None אם אינה ניתנת לבנייה).
+        """
+        refs = []
+        run_path, book = None, None
+        for unit in units:
+            unit = StudyUnit.coerce(unit)
+            name, chap, book_path = self._split_path(unit.book_display_name or "")
+            if book_path != run_path:
+                # ספר חדש - שמו בספריא נקבע פעם אחת לכל הרצף
+                run_path = book_path
+                book = name and self.sefaria_book(name, detect_content_category(unit))
+            if not book:
+                refs.append(None)
+                continue
+            num = unit.unit_num_int
+            if mode == "פרקים":
+                chapter = (unit.chapter_name or "").split()[-1:]
+                refs.append(f"{book}.{chapter[0]}" if chapter else None)
+            elif mode == "משניות":
+                refs.append(None if chap is None or num is None else f"{book}.{chap}.{num}")
+            elif mode == "דפים":
+                refs.append(None if num is None else f"{book}.{num}a")
+            elif mode == "עמודים":
+                refs.append(None if num is None or unit.side is None else f"{book}.{num}{unit.side}")
+            else:
+                refs.append(None)
+        return refs
+
+
+SEFARIA_RESOLVER_CACHE = None
+
+
+def get_sefaria_resolver():
+    """טוען פעם אחת את מתרגם ההפניות של עץ ברירת המחדל ושומר אותו במטמון."""
+    global SEFARIA_RESOLVER_CACHE
+    if SEFARIA_RESOLVER_CACHE is None:
+        SEFARIA_RESOLVER_CACHE = SefariaRefResolver.from_files()
+    return SEFARIA_RESOLVER_CACHE
+
+
+@lru_cache(maxsize=16)
+def _compile_link_template(link_template):
+    """מפרק את תבנית הקישור לחלקים הקבועים שבין מופעי ``{ref}``."""
+    return link_template.format(ref="\0").split("\0")
+
+
+@lru_cache(maxsize=65536)
+def format_link(link_template, ref):
+    """מחזיר את הקישור להפניה לפי התבנית (עם קידוד URL של ההפניה)."""
+    return quote(ref, safe=".-_%").join(_compile_link_template(link_template))
+
+
+def ref_links(ref, link_template):
+    """מחזיר רשימת קישורים להפניה או לזוג הפניות (ריקה אם אין הפניה)."""
+    if not ref:
+        return []
+    if isinstance(ref, list):
+        return [format_link(link_template, r) for r in ref]
+    return [format_link(link_template, ref)]
+
+
+def build_sefaria_ref(
+    first_unit: dict, last_unit: dict, mode: str
+) -> str | list[str] | None:
+    """Construct Sefaria reference(s).
+
+    ``mode`` indicates the unit granularity (פרקים/משניות/דפים/עמודים) only.
+    The content category (Tanakh/Mishnah/Talmud) is detected from the path of
+    ``first_unit``.  When the portion spans two different books, two references
+    are returned.  Units may be :class:`StudyUnit` records or plain dicts.
+    Resolution goes through the cached :class:`SefariaRefResolver`.
+    """
+    return get_sefaria_resolver().resolve(first_unit, last_unit, mode)
 
 
 # ==================== יצירת ICS ====================
+def _day_links(day_data, mode, link_template):
+    """מחזיר את קישורי הלימוד של יום (טווח היחידות כולו) לפי תבנית הקישור."""
+    ref = get_sefaria_resolver().resolve(
+        day_data["first_unit"], day_data["last_unit"], mode
+    )
+    return ref_links(ref, link_template)
+
+
+def _with_links(description, links):
+    """מצרף את הקישורים לתיאור, שורה לכל קישור."""
+    return description + "\n" + "\n".join(links) if links else description
+
+
+# אורך שורה מרבי בקובץ ICS (באוקטטים, ללא CRLF) לפי RFC 5545 סעיף 3.1
+ICS_LINE_LIMIT = 75
+ICS_PRODID = "-//Hspek//Torah Study Schedule//HE"
+# גודל החוצץ לכתיבת קובצי ICS
+ICS_WRITE_BUFFER = 1 << 16
+
+
+def _ics_escape(text):
+    """מבריח ערך טקסט לפי RFC 5545 (לוכסן הפוך, נקודה-פסיק, פסיק ושורה חדשה)."""
+    return (
+        str(text)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _ics_fold(line):
+    """
+    מקפל שורת תוכן ארוכה לשורות של עד ICS_LINE_LIMIT אוקטטים.
+
+    הקיפול נעשה בגבולות תווים (לא באמצע תו UTF-8 מרובה בתים), וכל שורת
+    המשך מתחילה ברווח, כנדרש בתקן.
+
+    Returns:
+        str: השורה המקופלת, מסתיימת ב-CRLF.
+    """
+    if len(line) * 4 <= ICS_LINE_LIMIT or len(line.encode("utf-8")) <= ICS_LINE_LIMIT:
+        return line + "\r\n"
+    parts = []
+    start = size = 0
+    limit = ICS_LINE_LIMIT
+    for i, ch in enumerate(line):
+        width = len(ch.encode("utf-8"))
+        if size + width > limit:
+            parts.append(line[start:i])
+            start, size = i, 0
+            limit = ICS_LINE_LIMIT - 1  # הרווח המוביל נספר באורך השורה
+        size += width
+    parts.append(line[start:])
+    return "\r\n ".join(parts) + "\r\n"
+
+
+# גרסת מבנה קובץ המצב הנשמר לצד כל קובץ ICS
+ICS_STATE_VERSION = 1
+ICS_UID_DOMAIN = "hspek"
+
+
+def ics_plan_key(plan):
+    """
+    מחזיר מפתח יציב לתוכנית, המשמש בסיס למזהי האירועים (UID).
+
+    Args:
+        plan: מזהה התוכנית (``plan_id`` שנבחר ע"י המשתמש), או מבנה הניתן
+            לסריאליזציה ל-JSON המתאר אותה (ראו default_ics_plan_id).
+    """
+    payload = json.dumps(plan, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def default_ics_plan_id(
+    titles_list,
+    mode,
+    start_date,
+    units_per_day=None,
+    no_study_weekdays=(),
+    skip_holidays=False,
+    cycle_anchor=None,
+):
+    """
+    מחזיר את זהות ברירת המחדל של תוכנית, כך ששתי תוכניות שונות על אותו חומר
+    (הספק, תאריך התחלה, ימי חופשה או דילוג על חגים שונים) לא יחלקו מזהים.
+
+    תאריך הסיום אינו חלק מהזהות, כך שהארכת טווח שומרת על המזהים. במחזור
+    נצחי תאריך העיגון מחליף את תאריך ההתחלה (שהוא רק תחילת חלון הייצוא).
+    לוח שחושב מחדש (reschedule_study_schedule) ומיוצא כעדכון (``diff_from``)
+    יורש את מפתח התוכנית מהייצוא הקודם; בייצוא מלא ישמור על מזהיו אם
+    יועבר לו ה-``plan_id`` של התוכנית המקורית.
+    """
+    anchor = cycle_anchor if cycle_anchor is not None else start_date
+    return [
+        list(titles_list),
+        mode,
+        anchor.isoformat() if anchor else None,
+        units_per_day or None,
+        sorted(no_study_weekdays or ()),
+        bool(skip_holidays),
+        cycle_anchor is not None,
+    ]
+
+
+def ics_event_uid(plan_key, day_key):
+    """מזהה דטרמיניסטי לאירוע יום הלימוד ``day_key`` (YYYYMMDD) בתוכנית."""
+    return f"{plan_key}-{day_key}@{ICS_UID_DOMAIN}"
+
+
+def ics_state_path(ics_path):
+    """נתיב קובץ המצב (מספרי גרסה וחתימות האירועים) של קובץ ICS."""
+    return os.path.splitext(ics_path)[0] + ".state.json"
+
+
+def load_ics_state(ics_path):
+    """טוען את קובץ המצב של ייצוא קודם, או None אם אינו קיים או פגום."""
+    try:
+        with open(ics_state_path(ics_path), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != ICS_STATE_VERSION:
+        return None
+    return state
+
+
+def _save_ics_state(ics_path, state):
+    """שומר את קובץ המצב לצד קובץ ה-ICS."""
+    path = ics_state_path(ics_path)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"אזהרה: לא ניתן לשמור את מצב קובץ ה-ICS ({e}).")
+
+
+def _ics_event_digest(name, description, links, alarm_time):
+    """חתימת התוכן של אירוע, לזיהוי אירועים שהשתנו בין ייצואים."""
+    payload = "\0".join(
+        (name, description, links[0] if links else "", alarm_time.isoformat() if alarm_time else "")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _ics_event_lines(
+    name, day_date, description, links, alarm_time, stamp, uid, sequence, modified
+):
+    """
+    מחזיר את שורות התוכן (לא מקופלות) של אירוע יום-שלם של יום לימוד.
+
+    Args:
+        name (str): כותרת האירוע.
+        day_date (date): תאריך יום הלימוד.
+        description (str): תיאור האירוע.
+        links (list[str]): קישורי הלימוד; הראשון נכתב כ-URL.
+        alarm_time (datetime.time | None): שעת התראה, או None ללא התראה.
+        stamp (str): חותמת DTSTAMP משותפת לכל אירועי הקובץ.
+        uid (str): מזהה האירוע.
+        sequence (int): מספר הגרסה של האירוע (SEQUENCE).
+        modified (str): מועד השינוי האחרון בתוכן האירוע (LAST-MODIFIED).
+    """
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"LAST-MODIFIED:{modified}",
+        f"SEQUENCE:{sequence}",
+        f"DTSTART;VALUE=DATE:{day_date:%Y%m%d}",
+        f"SUMMARY:{_ics_escape(name)}",
+        f"DESCRIPTION:{_ics_escape(description)}",
+    ]
+    if links:
+        lines.append(f"URL:{links[0]}")
+    if alarm_time:
+        alarm_dt = datetime.combine(day_date, alarm_time)
+        lines += [
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{_ics_escape(name)}",
+            f"TRIGGER;VALUE=DATE-TIME:{alarm_dt:%Y%m%dT%H%M%S}Z",
+            "END:VALARM",
+        ]
+    lines.append("END:VEVENT")
+    return lines
+
+
+def _ics_cancel_lines(uid, day_key, stamp, sequence):
+    """שורות התוכן של ביטול אירוע שיצא מהלוח (STATUS:CANCELLED)."""
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"LAST-MODIFIED:{stamp}",
+        f"SEQUENCE:{sequence}",
+        f"DTSTART;VALUE=DATE:{day_key}",
+        "STATUS:CANCELLED",
+        "END:VEVENT",
+    ]
+
+
+def _serialize_ics_events(
+    f, events, plan_key, previous_state=None, diff_only=False, stamp=None
+):
+    """
+    כותב לוח ICS לזרם טקסט ישירות מזרם אירועים, ללא בניית מודל לוח שנה בזיכרון.
+
+    מזהי האירועים נגזרים מ-(``plan_key``, תאריך). מול מצב ייצוא קודם של אותה
+    תוכנית, אירוע שתוכנו השתנה מקבל SEQUENCE ו-LAST-MODIFIED חדשים, ואירוע
+    שיצא מהלוח מסומן כמבוטל.
+
+    Args:
+        f (TextIO): זרם היעד (קובץ שנפתח עם ``newline=""`` או StringIO).
+        events (Iterable[tuple]): רשומות
+            ``(name, day_date, description, links, alarm_time)`` לפי סדר הימים.
+        plan_key (str): מפתח התוכנית (ראו ics_plan_key).
+        previous_state (dict | None): מצב הייצוא הקודם (ראו load_ics_state).
+        diff_only (bool): לכתוב רק אירועים חדשים, שהשתנו או שבוטלו.
+        stamp (str | None): חותמת DTSTAMP (ברירת מחדל - הזמן הנוכחי ב-UTC).
+
+    Returns:
+        tuple[dict, dict]: מצב הייצוא החדש, ומוני האירועים לפי
+        ``added``/``changed``/``unchanged``/``cancelled``.
+    """
+    stamp = stamp or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    previous = {}
+    if previous_state and previous_state.get("plan") == plan_key:
+        previous = previous_state.get("events", {})
+    state = {}
+    counts = dict.fromkeys(("added", "changed", "unchanged", "cancelled"), 0)
+    f.write(f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{ICS_PRODID}\r\n")
+    for name, day_date, description, links, alarm_time in events:
+        day_key = f"{day_date:%Y%m%d}"
+        digest = _ics_event_digest(name, description, links, alarm_time)
+        old = previous.get(day_key)
+        if old is None:
+            status, sequence, modified = "added", 0, stamp
+        elif old["hash"] == digest and not old.get("cancelled"):
+            status, sequence, modified = "unchanged", old["sequence"], old["modified"]
+        else:
+            status, sequence, modified = "changed", old["sequence"] + 1, stamp
+        counts[status] += 1
+        state[day_key] = {"hash": digest, "sequence": sequence, "modified": modified}
+        if diff_only and status == "unchanged":
+            continue
+        f.writelines(
+            _ics_fold(line)
+            for line in _ics_event_lines(
+                name,
+                day_date,
+                description,
+                links,
+                alarm_time,
+                stamp,
+                ics_event_uid(plan_key, day_key),
+                sequence,
+                modified,
+            )
+        )
+    # ימים שיצאו מהלוח - נשמרים כמבוטלים כדי שמספרי הגרסה ימשיכו לעלות
+    for day_key, old in previous.items():
+        if day_key in state:
+            continue
+        if old.get("cancelled"):
+            state[day_key] = old
+            continue
+        sequence = old["sequence"] + 1
+        state[day_key] = {
+            "hash": old["hash"], "sequence": sequence, "modified": stamp, "cancelled": True
+        }
+        counts["cancelled"] += 1
+        if diff_only:
+            f.writelines(
+                _ics_fold(line)
+                for line in _ics_cancel_lines(
+                    ics_event_uid(plan_key, day_key), day_key, stamp, sequence
+                )
+            )
+    f.write("END:VCALENDAR\r\n")
+    return {"version": ICS_STATE_VERSION, "plan": plan_key, "events": state}, counts
+
+
+def _write_ics_events(path, events, plan_key, previous_state=None, diff_only=False):
+    """כותב קובץ ICS דרך חוצץ (ראו _serialize_ics_events) ומחזיר את המצב והמונים."""
+    with open(
+        path, "w", encoding="utf-8", newline="", buffering=ICS_WRITE_BUFFER
+    ) as f:
+        return _serialize_ics_events(f, events, plan_key, previous_state, diff_only)
+
+
+def _ics_plan_events(days, titles_list, mode, link_template, alarm_time):
+    """
+    מפיק את אירועי ה-ICS של תוכנית יחידה מזרם ימי הלימוד.
+
+    Yields:
+        tuple: ``(name, day_date, description, links, alarm_time)``.
+    """
+    # קביעת שם בסיסי לאירוע
+    first_title = titles_list[0].split(" / ")[-1] if titles_list else "לימוד"
+    event_base_name = f"סדר לימוד: {first_title}"
+    if len(titles_list) > 1:
+        event_base_name += " ועוד"
+    # מעבר יחיד על הימים - כל אירוע נכתב מיד עם חישובו
+    for day_data in days:
+        links = _day_links(day_data, mode, link_template)
+        yield (
+            event_base_name,
+            day_data["date"],
+            _with_links(day_data["description"], links),
+            links,
+            alarm_time,
+        )
+
+
+def _export_ics(full_path, events, plan_key, diff_from, inherit_plan=False):
+    """
+    כותב קובץ ICS ואת קובץ המצב שלו, על בסיס מצב הייצוא הקודם.
+
+    Args:
+        full_path (str): נתיב קובץ היעד.
+        events (Iterable[tuple]): זרם האירועים (ראו _write_ics_events).
+        plan_key (str): מפתח התוכנית.
+        diff_from (str | None): נתיב קובץ ICS שיוצא בעבר. אם נתון - נכתבים רק
+            השינויים ביחס אליו; אחרת נכתב לוח מלא, והמספור ממשיך ממצב קודם
+            של אותו קובץ יעד אם קיים.
+        inherit_plan (bool): ``plan_key`` הוא ברירת המחדל ולא נבחר במפורש -
+            בעדכון נלקח מפתח התוכנית מהייצוא הקודם, כדי שלוח שחושב מחדש
+            (למשל עם ימי חופשה אחרים) ישמור על מזהי האירועים.
+
+    Returns:
+        str or None: הנתיב לקובץ שנוצר, או None אם אירעה שגיאה.
+
+    Raises:
+        ValueError: אם ל-``diff_from`` אין קובץ מצב, או שהוא שייך לתוכנית אחרת.
+    """
+    path = resource_path(full_path)
+    previous_state = load_ics_state(resource_path(diff_from) if diff_from else path)
+    if diff_from:
+        if previous_state is None:
+            raise ValueError(f"no ICS export state found for {diff_from!r}")
+        if inherit_plan:
+            plan_key = previous_state["plan"]
+        elif previous_state["plan"] != plan_key:
+            raise ValueError(f"{diff_from!r} was exported for a different plan_id")
+    try:
+        state, counts = _write_ics_events(
+            path, events, plan_key, previous_state, diff_only=bool(diff_from)
+        )
+    except OSError as e:
+        print(f"שגיאה בכתיבת קובץ ICS: {e}")
+        return None
+    _save_ics_state(path, state)
+    if diff_from:
+        print(
+            f"קובץ עדכון ICS נוצר בהצלחה: {full_path} "
+            f"(נוספו {counts['added']}, השתנו {counts['changed']}, בוטלו {counts['cancelled']})"
+        )
+    else:
+        print(f"קובץ ICS נוצר בהצלחה: {full_path}")
+    return full_path
+
+
+def validate_ics_file(path):
+    """
+    מאמת קובץ ICS באמצעות הספרייה ``ics`` (תלות אופציונלית, נדרשת רק כאן).
+
+    Returns:
+        int: מספר האירועים בקובץ.
+
+    Raises:
+        ImportError: אם הספרייה ``ics`` אינה מותקנת.
+    """
+    from ics import Calendar
+
+    with open(path, encoding="utf-8") as f:
+        return len(Calendar(f.read()).events)
+
+
 def write_ics_file(
     titles_list,
     mode,
@@ -1254,91 +3992,308 @@ def write_ics_file(
     skip_holidays=False,
     alarm_time: time | None = None,
     link_template: str = DEFAULT_LESSON_LINK,
-    balance_chapters_by_mishnayot: bool = False,
+    balance_chapters_by_mishnayot: bool | str = False,
+    align_to_boundaries: bool = False,
+    cycle_anchor: date | None = None,
+    schedule: StudySchedule | None = None,
+    output_path: str | None = None,
+    diff_from: str | None = None,
+    plan_id: str | None = None,
 ):
     """
     יוצר קובץ ICS (קובץ לוח שנה) המכיל את אירועי הלימוד.
 
     Args:
-        titles_list (list[str]): רשימת הנתיבים של הפריטים הנלמדים.
+        titles_list (list[str]): רשימת הנתיבים של הפריטים הנלמדים.
+        mode (str): סוג הלימוד.
+        start_date (date): תאריך התחלת הלימוד.
+        end_date (date): תאריך סיום הלימוד (במצב חלוקה לפי טווח).
+        tree_data (dict): עץ הנתונים המלא.
+        no_study_weekdays_set (set[int]): קבוצת ימי חופשה שבועיים.
+        units_per_day (int, optional): הספק יומי (אם רלוונטי).
+        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
+        alarm_time (datetime.time | None, optional): שעת התראה לאירוע. אם ``None`` לא תוגדר התראה.
+        link_template (str, optional):
+            תבנית קישור בה יוחלף ``{ref}`` בהפניה המדויקת בספריא.
+            ברירת המחדל היא ``DEFAULT_LESSON_LINK``.
+        balance_chapters_by_mishnayot (bool or str, optional):
+            אם ``True`` ובחירה במצב "פרקים" למשנה – הפרקים ייאוזנו על פי מספר המשניות שלהם.
+            ניתן להעביר שם אסטרטגיה (BALANCE_PROPORTIONAL או BALANCE_MIN_MAX).
+        align_to_boundaries (bool, optional):
+            לסיים ימים בסוף פרק או מסכת במצבי משניות/דפים/עמודים.
+        cycle_anchor (date | None, optional):
+            אם נתון - מיוצא החלון ``[start_date, end_date]`` של מחזור לימוד
+            נצחי בהספק ``units_per_day`` שהתחיל בתאריך זה (ראו StudyCycle).
+        schedule (StudySchedule | None, optional):
+            לוח מוכן לייצוא (למשל מ-reschedule_study_schedule) במקום חישוב
+            הלוח מהפרמטרים.
+        output_path (str | None, optional):
+            נתיב קובץ היעד. ברירת המחדל היא שם חכם בתיקיית המודול.
+        diff_from (str | None, optional):
+            נתיב קובץ ICS שיוצא בעבר לאותה תוכנית. אם נתון - נכתבים רק
+            האירועים שנוספו, השתנו או בוטלו מאז (ראו _export_ics).
+        plan_id (str | None, optional):
+            מזהה התוכנית, שממנו נגזרים מזהי האירועים. ברירת המחדל נגזרת
+            מפרמטרי התוכנית (ראו default_ics_plan_id).
+
+    Returns:
+        str or None: הנתיב המלא לקובץ ה-ICS שנוצר, או None אם אירעה שגיאה.
+    """
+    export = _schedule_days_for_export(
+        titles_list,
+        mode,
+        start_date,
+        end_date,
+        tree_data,
+        no_study_weekdays_set,
+        units_per_day,
+        skip_holidays,
+        balance_chapters_by_mishnayot,
+        align_to_boundaries,
+        cycle_anchor,
+        schedule,
+    )
+
+    if export is None:
+        print("אזהרה: לא נוצר לוח לימודים.")
+        return None
+
+    schedule, actual_end_date = export
+    events = _ics_plan_events(schedule, titles_list, mode, link_template, alarm_time)
+
+    # יצירת שם קובץ חכם
+    filename = generate_smart_filename(
+        titles_list, mode, start_date, actual_end_date, tree_data, "ics", units_per_day
+    )
+    full_path = output_path or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), filename
+    )
+    # כתיבת הקובץ
+    plan_key = ics_plan_key(
+        plan_id
+        if plan_id is not None
+        else default_ics_plan_id(
+            titles_list,
+            mode,
+            start_date,
+            units_per_day,
+            no_study_weekdays_set,
+            skip_holidays,
+            cycle_anchor,
+        )
+    )
+    return _export_ics(full_path, events, plan_key, diff_from, inherit_plan=plan_id is None)
+
+
+def coalesced_links(units, mode, link_template):
+    """
+    מחזיר קישור אחד לכל רצף יחידות עוקבות מאותו ספר, במקום קישור לכל יחידה.
+
+    Args:
+        units (UnitSelection): יחידות היום.
+        mode (str): סוג הלימוד.
+        link_template (str): תבנית הקישור.
+
+    Returns:
+        list[str]: הקישורים, לפי סדר הלימוד.
+    """
+    resolver = get_sefaria_resolver()
+    links = []
+    for start, end in units.book_runs():
+        ref = resolver.resolve(units[start], units[end - 1], mode)
+        links.extend(ref_links(ref, link_template))
+    return links
+
+
+def _study_cell_info(day_data, mode, link_template):
+    """
+    מחשב את נתוני התא של יום לימוד בסימנייה: תיאור, קישורים וקטגוריה.
+
+    Args:
+        day_data (dict): רשומת יום לימוד.
+        mode (str): סוג הלימוד.
+        link_template (str): תבנית הקישור.
+
+    Returns:
+        dict: ``desc``, ``portions`` (תיאור לכל מסלול), ``links``,
+        ``orig_link`` ו-``category``.
+    """
+    if "tracks" in day_data:
+        # יום בתוכנית רב-מסלולית: תיאור לכל מסלול, הקישורים של כולם ברצף
+        infos = [
+            _study_cell_info(track_day, track_day["mode"], link_template)
+            for track_day in day_data["tracks"]
+            if track_day is not None
+        ]
+        return {
+            "desc": day_data["description"],
+            "portions": [info["desc"] for info in infos],
+            "links": [link for info in infos for link in info["links"]],
+            "orig_link": infos[0]["orig_link"],
+            "category": infos[0]["category"],
+        }
+
+    unit_links = coalesced_links(day_data["units"], mode, link_template)
+    orig_link = unit_links[0] if unit_links else ""
+
+    return {
+        "desc": day_data["description"],
+        "portions": [day_data["description"]],
+        "links": unit_links,
+        "orig_link": orig_link,
+        "category": detect_content_category(day_data["first_unit"]),
+    }
+
+
+def _iter_monthly_schedule(start_date, end_date, days, mode, link_template):
+    """
+    מפיק את חודשי הסימנייה אחד אחד, תוך צריכת ימי הלימוד מאיטרטור.
+
+    בכל רגע נשמרים בזיכרון רק נתוני החודש הנוכחי: ימי הלימוד נצרכים מן
+    האיטרטור עד סוף החודש, והחודש מופק לתבנית לפני המעבר לבא אחריו.
+
+    Args:
+        start_date (date): התאריך הראשון בסימנייה.
+        end_date (date): התאריך האחרון בסימנייה.
+        days (Iterator[dict]): ימי הלימוד לפי סדר התאריכים.
         mode (str): סוג הלימוד.
-        start_date (date): תאריך התחלת הלימוד.
-        end_date (date): תאריך סיום הלימוד (במצב חלוקה לפי טווח).
-        tree_data (dict): עץ הנתונים המלא.
-        no_study_weekdays_set (set[int]): קבוצת ימי חופשה שבועיים.
-        units_per_day (int, optional): הספק יומי (אם רלוונטי).
-        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
-        alarm_time (datetime.time | None, optional): שעת התראה לאירוע. אם ``None`` לא תוגדר התראה.
-        link_template (str, optional):
-            תבנית קישור בה יוחלף ``{ref}`` בהפניה המדויקת בספריא.
-            ברירת המחדל היא ``DEFAULT_LESSON_LINK``.
-        balance_chapters_by_mishnayot (bool, optional):
-            אם ``True`` ובחירה במצב "פרקים" למשנה – הפרקים ייאוזנו על פי מספר המשניות שלהם.
+        link_template (str): תבנית הקישור.
 
-    Returns:
-        str or None: הנתיב המלא לקובץ ה-ICS שנוצר, או None אם אירעה שגיאה.
+    Yields:
+        dict: ``month_name`` ו-``weeks`` - רשימת שבועות של שבעה תאים.
     """
-    schedule = _generate_study_schedule(
-        start_date,
-        end_date,
-        titles_list,
-        mode,
-        tree_data,
-        no_study_weekdays_set,
-        units_per_day,
-        skip_holidays,
-        balance_chapters_by_mishnayot,
-    )
+    # הטווח מורחב בשבוע לכל כיוון כדי לכסות גם את ימי השבועות החלקיים בטבלה,
+    # וכל הטווח מומר לתאריכים עבריים במעבר וקטורי אחד.
+    first_ordinal, last_ordinal = start_date.toordinal(), end_date.toordinal()
+    base_ordinal = first_ordinal - 6
+    padded_ordinals = np.arange(base_ordinal, last_ordinal + 7, dtype=np.int64)
+    h_years, h_months, h_days = ordinals_to_hebrew(padded_ordinals)
+
+    # גבולות החודשים העבריים בתוך הטווח עצמו
+    inner = slice(6, 6 + last_ordinal - first_ordinal + 1)
+    month_keys = h_years[inner] * 100 + h_months[inner]
+    breaks = (np.flatnonzero(np.diff(month_keys)) + 1).tolist()
+    month_firsts = [0] + breaks
+    month_lasts = [b - 1 for b in breaks] + [len(month_keys) - 1]
+    h_years, h_months, h_days = h_years.tolist(), h_months.tolist(), h_days.tolist()
+
+    days = iter(days)
+    pending = next(days, None)
+    for month_first, month_last in zip(month_firsts, month_lasts):
+        h_year = h_years[6 + month_first]
+        h_month = h_months[6 + month_first]
+        month_name_he = hebrew_month_name(h_year, h_month)
+        year_str = hebrew_year_string(h_year)
+        month_data = {"month_name": f"{month_name_he} {year_str}", "weeks": []}
 
-    if not schedule:
-        print("אזהרה: לא נוצר לוח לימודים.")
-        return None
+        # ימי הלימוד של החודש הנוכחי בלבד
+        month_last_ordinal = first_ordinal + month_last
+        study_map = {}
+        while pending is not None and pending["date"].toordinal() <= month_last_ordinal:
+            study_map[pending["date"]] = _study_cell_info(pending, mode, link_template)
+            pending = next(days, None)
+
+        # בניית מבנה שבועות עבור החודש
+        first_day = date.fromordinal(first_ordinal + month_first)
+        days_from_sunday = (first_day.weekday() + 1) % 7
+        week_start = first_day - timedelta(days=days_from_sunday)
+        last_day = date.fromordinal(month_last_ordinal)
+        days_to_saturday = (5 - last_day.weekday()) % 7
+        schedule_end_date = last_day + timedelta(days=days_to_saturday)
+        current_week_start = week_start
+        while current_week_start <= schedule_end_date:
+            # לולאה על כל שבוע בחודש
+            week = []
+            for i in range(7):
+                current_day = current_week_start + timedelta(days=i)
+                offset = current_day.toordinal() - base_ordinal
+                cell_year, cell_month, cell_day = (
+                    h_years[offset],
+                    h_months[offset],
+                    h_days[offset],
+                )
+                is_in_month = cell_year == h_year and cell_month == h_month
+                hebrew_day_number = hebrew_day_string(cell_day) if is_in_month else ""
+                hebrew_date = (
+                    hebrew_date_string(cell_year, cell_month, cell_day)
+                    if is_in_month
+                    else ""
+                )
 
-    actual_end_date = schedule[-1]["date"] if units_per_day else end_date
-    cal = Calendar()  # יצירת אובייקט לוח שנה
+                # חגים רגילים וחגים לאומיים מתוך אינדקס החגים
+                holiday = HOLIDAY_INDEX.label(current_day) if is_in_month else ""
 
-    # קביעת שם בסיסי לאירוע
-    first_title = titles_list[0].split(" / ")[-1] if titles_list else "לימוד"
-    event_base_name = f"סדר לימוד: {first_title}"
-    if len(titles_list) > 1:
-        event_base_name += " ועוד"
-    # יצירת אירועים בלוח השנה
-    for day_data in schedule:
-        ref = build_sefaria_ref(day_data["first_unit"], day_data["last_unit"], mode)
-        links = []
-        if ref:
-            if isinstance(ref, list):
-                links = [link_template.format(ref=quote(r, safe=".-_%")) for r in ref]
-            else:
-                links = [link_template.format(ref=quote(ref, safe=".-_%"))]
-        e = Event()
-        e.name = event_base_name
-        e.begin = day_data["date"].strftime("%Y-%m-%d")
-        e.make_all_day()
-        if alarm_time:
-            alarm_dt = datetime.combine(day_data["date"], alarm_time)
-            e.alarms = [DisplayAlarm(trigger=alarm_dt)]
-        if links:
-            e.description = day_data["description"] + "\n" + "\n".join(links)
-            e.url = links[0]
-        else:
-            e.description = day_data["description"]
-        cal.events.add(e)
+                parsha = HOLIDAY_INDEX.parsha(current_day) if is_in_month else None
+                label = holiday or parsha or ""
+                study_info = study_map.get(current_day)
+                week.append(
+                    {
+                        "is_in_month": is_in_month,
+                        "hebrew_date": hebrew_date,
+                        "hebrew_day_number": hebrew_day_number,
+                        "label": label,
+                        "study_portions": (
+                            study_info["portions"] if is_in_month and study_info else []
+                        ),
+                        "links": (
+                            study_info["links"] if is_in_month and study_info else []
+                        ),
+                        "orig_link": (
+                            study_info["orig_link"]
+                            if is_in_month and study_info
+                            else ""
+                        ),
+                        "category": (
+                            study_info["category"]
+                            if is_in_month and study_info
+                            else ""
+                        ),
+                        "is_shabbat": (
+                            current_day.weekday() == 5 if is_in_month else False
+                        ),
+                        "is_holiday": bool(holiday) if is_in_month else False,
+                    }
+                )
+            month_data["weeks"].append(week)
+            current_week_start += timedelta(weeks=1)
+        yield month_data
 
-    # יצירת שם קובץ חכם
-    filename = generate_smart_filename(
-        titles_list, mode, start_date, actual_end_date, tree_data, "ics", units_per_day
+
+@lru_cache(maxsize=4)
+def _template_environment(search_path: str) -> Environment:
+    """סביבת Jinja לתיקיית התבניות; התבניות מהודרות פעם אחת ונשמרות בה."""
+    return Environment(loader=FileSystemLoader(search_path))
+
+
+def _render_bookmark(out, filename, start_date, end_date, monthly_schedule, pdf_mode):
+    """
+    מרנדר את תבנית הסימנייה לקובץ.
+
+    Args:
+        out (str): נתיב קובץ היעד.
+        filename (str): שם הקובץ, המשמש גם ככותרת הדף.
+        start_date (date): תחילת הטווח המוצג.
+        end_date (date): סוף הטווח המוצג.
+        monthly_schedule (Iterable[dict]): החודשים (ראו _iter_monthly_schedule).
+        pdf_mode (bool): האם להשתמש בתבנית ההדפסה.
+
+    Returns:
+        str: נתיב הקובץ שנכתב.
+    """
+    # טעינת תבנית HTML ורינדור
+    env = _template_environment(os.getcwd())
+    template_name = "bookmark_template_pdf.html" if pdf_mode else "bookmark_template.html"
+    tpl = env.get_template(template_name)
+    stream = tpl.stream(
+        title=filename.replace(".html", ""),
+        date_range=f"{start_date:%d/%m/%Y} - {end_date:%d/%m/%Y}",
+        monthly_schedule=monthly_schedule,
+        heb_weekday_names=HEBREW_WEEKDAY_NAMES,  # הוספת שמות ימות השבוע לתבנית
     )
-    full_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
-    # כתיבת הקובץ
-    try:
-        with open(resource_path(full_path), "w", encoding="utf-8") as f:
-            f.writelines(cal)
-        print(f"קובץ ICS נוצר בהצלחה: {full_path}")
-        return full_path
-    except Exception as e:
-        print(f"שגיאה בכתיבת קובץ ICS: {e}")
-        return None
+    # שמירת קובץ ה-HTML - התבנית נכתבת לקובץ בחלקים, חודש אחר חודש
+    with open(resource_path(out), "w", encoding="utf-8") as f:
+        stream.dump(f)
+    return out
 
 
 def write_bookmark_html(
@@ -1351,8 +4306,12 @@ def write_bookmark_html(
     units_per_day=None,
     skip_holidays=False,
     link_template: str = DEFAULT_LESSON_LINK,
-    balance_chapters_by_mishnayot: bool = False,
+    balance_chapters_by_mishnayot: bool | str = False,
     pdf_mode: bool = False,  # ← הוספה
+    align_to_boundaries: bool = False,
+    cycle_anchor: date | None = None,
+    schedule: StudySchedule | None = None,
+    output_path: str | None = None,
 ):
 
     """
@@ -1370,194 +4329,58 @@ def write_bookmark_html(
         link_template (str, optional):
             תבנית קישור בה יוחלף ``{ref}`` בהפניה המדויקת בספריא.
             ברירת המחדל היא ``DEFAULT_LESSON_LINK``.
-        balance_chapters_by_mishnayot (bool, optional):
-            איזון פרקים לפי מספר המשניות כאשר "mode" הוא "פרקים" למשנה.
+        balance_chapters_by_mishnayot (bool or str, optional):
+            איזון פרקים לפי מספר המשניות כאשר "mode" הוא "פרקים" למשנה
+            (``True`` או שם אסטרטגיה מ-BALANCE_STRATEGIES).
+        align_to_boundaries (bool, optional):
+            לסיים ימים בסוף פרק או מסכת במצבי משניות/דפים/עמודים.
+        cycle_anchor (date | None, optional):
+            אם נתון - מיוצא החלון ``[start_date, end_date]`` של מחזור לימוד
+            נצחי שהתחיל בתאריך זה.
+        schedule (StudySchedule | None, optional):
+            לוח מוכן לייצוא במקום חישוב הלוח מהפרמטרים.
+        output_path (str | None, optional):
+            נתיב קובץ היעד. ברירת המחדל היא שם חכם בתיקייה הנוכחית.
 
     Returns:
         str or None: הנתיב המלא לקובץ ה-HTML שנוצר, או None אם אירעה שגיאה.
     """
-    schedule = _generate_study_schedule(
-        start_date,
-        end_date,
+    export = _schedule_days_for_export(
         titles_list,
         mode,
+        start_date,
+        end_date,
         tree_data,
         no_study_weekdays_set,
         units_per_day,
         skip_holidays,
         balance_chapters_by_mishnayot,
+        align_to_boundaries,
+        cycle_anchor,
+        schedule,
     )
 
-    if not schedule:
+    if export is None:
         print("אזהרה: לא נוצר לוח לימודים.")
         return None
 
-    actual_end_date = schedule[-1]["date"] if units_per_day else end_date
-    # מיפוי תאריכים לתיאורי הלימוד והקישורים שלהם
-    study_map = {}
-    for item in schedule:
-        orig_ref = build_sefaria_ref(item["first_unit"], item["last_unit"], mode)
-        orig_link = ""
-        if orig_ref:
-            if isinstance(orig_ref, list):
-                orig_link = link_template.format(ref=quote(orig_ref[0], safe=".-_%"))
-            else:
-                orig_link = link_template.format(ref=quote(orig_ref, safe=".-_%"))
-
-        unit_links = []
-        for unit in item.get("units", []):
-            ref = build_sefaria_ref(unit, unit, mode)
-            if ref:
-                if isinstance(ref, list):
-                    unit_links.extend(
-                        [link_template.format(ref=quote(r, safe=".-_%")) for r in ref]
-                    )
-                else:
-                    unit_links.append(link_template.format(ref=quote(ref, safe=".-_%")))
-
-        study_map[item["date"]] = {
-            "desc": item["description"],
-            "links": unit_links,
-            "orig_link": orig_link,
-            "category": detect_content_category(item["first_unit"]),
-        }
-
-    # אוספים את כל הימים בטווח, וממפים אותם לשנה וחודש עברי
-    day_map = defaultdict(list)
-    cur = start_date
-    while cur <= actual_end_date:
-        g_date = dates.GregorianDate(cur.year, cur.month, cur.day)
-        # המרה לתאריך עברי
-        h_date = g_date.to_heb()
-        key = (h_date.year, h_date.month)
-        day_map[key].append(cur)
-        cur += timedelta(days=1)
-
-    # סדר עברי של חודשים
-    HEB_MONTH_ORDER = {
-        7: 1,
-        8: 2,
-        9: 3,
-        10: 4,
-        11: 5,
-        12: 6,
-        13: 7,
-        1: 8,
-        2: 9,
-        3: 10,
-        4: 11,
-        5: 12,
-        6: 13,
-    }
-    sorted_keys = sorted(
-        day_map.keys(), key=lambda x: (x[0], HEB_MONTH_ORDER.get(x[1], x[1]))
+    schedule, actual_end_date = export
+    # החודשים נבנים בזמן הרינדור, תוך מעבר יחיד על ימי הלימוד
+    monthly_schedule = _iter_monthly_schedule(
+        start_date,
+        actual_end_date,
+        schedule,
+        mode,
+        link_template,
     )
 
-    monthly_schedule = []
-    for h_year, h_month in sorted_keys:
-        month_name_he = hebrewcal.Month(h_year, h_month).month_name(True)
-        year_str = (
-            dates.HebrewDate(h_year, h_month, 1).hebrew_date_string(True).split()[-1]
-        )
-        month_data = {"month_name": f"{month_name_he} {year_str}", "weeks": []}
-        days = sorted(day_map[(h_year, h_month)])
-        # בניית מבנה שבועות עבור כל חודש
-        if days:
-            first_day = days[0]
-            days_from_sunday = (first_day.weekday() + 1) % 7
-            week_start = first_day - timedelta(days=days_from_sunday)
-            last_day = days[-1]
-            days_to_saturday = (5 - last_day.weekday()) % 7
-            schedule_end_date = last_day + timedelta(days=days_to_saturday)
-            current_week_start = week_start
-            while current_week_start <= schedule_end_date:
-                # לולאה על כל שבוע בחודש
-                week = []
-                for i in range(7):
-                    current_day = current_week_start + timedelta(days=i)
-                    g_date = dates.GregorianDate(
-                        current_day.year, current_day.month, current_day.day
-                    )
-                    h_d = g_date.to_heb()
-                    is_in_month = h_d.year == h_year and h_d.month == h_month
-                    hebrew_day_number = h_d.hebrew_day() if is_in_month else ""
-                    hebrew_date = h_d.hebrew_date_string(True) if is_in_month else ""
-
-                    # איסוף חגים רגילים וחגים לאומיים
-                    holiday_parts = []
-                    if is_in_month:
-                        regular_holiday = h_d.holiday(hebrew=True, israel=True)
-                        if regular_holiday:
-                            holiday_parts.append(regular_holiday)
-                        # קריאה נכונה לפונקציה עם שני הארגומנטים הנדרשים
-                        national_holiday = (
-                            get_israeli_national_holiday_on_gregorian_date(
-                                current_day, h_year
-                            )
-                        )
-                        if national_holiday:
-                            holiday_parts.append(national_holiday)
-                    holiday = ", ".join(holiday_parts) if holiday_parts else ""
-
-                    parsha = (
-                        parshios.getparsha_string(g_date, hebrew=True, israel=True)
-                        if current_day.weekday() == 5 and is_in_month
-                        else None
-                    )
-                    label = holiday or parsha or ""
-                    study_info = study_map.get(current_day)
-                    week.append(
-                        {
-                            "is_in_month": is_in_month,
-                            "hebrew_date": hebrew_date,
-                            "hebrew_day_number": hebrew_day_number,
-                            "label": label,
-                            "study_portion": (
-                                study_info["desc"] if is_in_month and study_info else ""
-                            ),
-                            "links": (
-                                study_info["links"]
-                                if is_in_month and study_info
-                                else []
-                            ),
-                            "orig_link": (
-                                study_info["orig_link"]
-                                if is_in_month and study_info
-                                else ""
-                            ),
-                            "category": (
-                                study_info["category"]
-                                if is_in_month and study_info
-                                else ""
-                            ),
-                            "is_shabbat": (
-                                current_day.weekday() == 5 if is_in_month else False
-                            ),
-                            "is_holiday": bool(holiday) if is_in_month else False,
-                        }
-                    )
-                month_data["weeks"].append(week)
-                current_week_start += timedelta(weeks=1)
-        monthly_schedule.append(month_data)
-
-    # טעינת תבנית HTML ורינדור
-    env = Environment(loader=FileSystemLoader(os.getcwd()))
-    template_name = "bookmark_template_pdf.html" if pdf_mode else "bookmark_template.html"
-    tpl = env.get_template(template_name)
     filename = generate_smart_filename(
         titles_list, mode, start_date, actual_end_date, tree_data, "html", units_per_day
     )
-    html = tpl.render(
-        title=filename.replace(".html", ""),
-        date_range=f"{start_date:%d/%m/%Y} - {actual_end_date:%d/%m/%Y}",
-        monthly_schedule=monthly_schedule,
-        heb_weekday_names=HEBREW_WEEKDAY_NAMES,  # הוספת שמות ימות השבוע לתבנית
+    out = output_path or os.path.join(os.getcwd(), filename)
+    return _render_bookmark(
+        out, filename, start_date, actual_end_date, monthly_schedule, pdf_mode
     )
-    # שמירת קובץ ה-HTML
-    out = os.path.join(os.getcwd(), filename)
-    with open(resource_path(out), "w", encoding="utf-8") as f:
-        f.write(html)
-    return out
 
 def write_bookmark_pdf(
     titles_list,
@@ -1569,7 +4392,11 @@ def write_bookmark_pdf(
     units_per_day=None,
     skip_holidays=False,
     link_template: str = DEFAULT_LESSON_LINK,
-    balance_chapters_by_mishnayot: bool = False,
+    balance_chapters_by_mishnayot: bool | str = False,
+    align_to_boundaries: bool = False,
+    cycle_anchor: date | None = None,
+    schedule: StudySchedule | None = None,
+    output_path: str | None = None,
 ):
     """Create a PDF bookmark file from the study schedule using ``pyppeteer``.
 
@@ -1577,6 +4404,9 @@ def write_bookmark_pdf(
     then rendered to PDF by ``pyppeteer`` using an existing Chrome/Chromium
     installation.
 
+    When ``output_path`` is given the intermediate HTML is written next to it
+    with an ``.html`` extension.
+
     Returns the path to the created PDF file or ``None`` if generation failed.
     """
 
@@ -1591,13 +4421,17 @@ def write_bookmark_pdf(
         skip_holidays=skip_holidays,
         link_template=link_template,
         balance_chapters_by_mishnayot=balance_chapters_by_mishnayot,
-        pdf_mode=True
+        pdf_mode=True,
+        align_to_boundaries=align_to_boundaries,
+        cycle_anchor=cycle_anchor,
+        schedule=schedule,
+        output_path=os.path.splitext(output_path)[0] + ".html" if output_path else None,
     )
 
     if not html_path:
         return None
 
-    pdf_path = html_path.replace(".html", ".pdf")
+    pdf_path = output_path or html_path.replace(".html", ".pdf")
 
     async def _convert():
         import os
@@ -1640,6 +4474,677 @@ def write_bookmark_pdf(
         return None
 
 
+# ==================== תוכניות רב-מסלוליות ====================
+# כל מסלול הוא מילון עם "titles_list" ו-"mode", ואופציונלית "units_per_day",
+# "balance_chapters_by_mishnayot" ו-"align_to_boundaries". מסלול ללא הספק
+# קבוע מתחלק על פני כל הטווח עד end_date.
+def build_multi_track_schedule(
+    start_date,
+    end_date,
+    tracks,
+    tree_data,
+    no_study_weekdays,
+    skip_holidays=False,
+):
+    """
+    מחשב תוכנית רב-מסלולית על גבי מעבר יחיד על לוח ימי הלימוד.
+
+    נבנה אינדקס ימי לימוד אחד, הארוך דיו גם לטווח התאריכים וגם למסלול
+    בהספק הקבוע הארוך ביותר, וכל מסלול מחולק על ימי הלימוד שלו מתוכו.
+
+    Args:
+        start_date (date): תאריך התחלת הלימוד.
+        end_date (date | None): תאריך הסיום של מסלולים ללא הספק קבוע.
+        tracks (list[dict]): הגדרות המסלולים.
+        tree_data (dict or TreeIndex): עץ הנתונים המלא.
+        no_study_weekdays (set[int]): ימי חופשה שבועיים.
+        skip_holidays (bool, optional): האם לדלג על חגים.
+
+    Returns:
+        list[StudySchedule | None]: לוח לכל מסלול (None למסלול ריק).
+
+    Raises:
+        ValueError: אם למסלול אין הספק קבוע ולא נתון ``end_date``.
+    """
+    if end_date is None and any(not track.get("units_per_day") for track in tracks):
+        raise ValueError("range tracks (without units_per_day) require end_date")
+    selections = [
+        resolve_selection(track["titles_list"], tree_data, track["mode"])
+        for track in tracks
+    ]
+    sessions_needed = max(
+        (
+            math.ceil(len(units) / track["units_per_day"])
+            for track, units in zip(tracks, selections)
+            if track.get("units_per_day")
+        ),
+        default=0,
+    )
+
+    calendar = None
+    if sessions_needed:
+        calendar = get_study_day_index_for_count(
+            start_date, sessions_needed, no_study_weekdays, skip_holidays
+        )
+        if calendar is None:
+            raise ValueError("plan is longer than MAX_PLAN_DAYS")
+    if end_date is not None and (
+        calendar is None or calendar.end_ordinal < end_date.toordinal()
+    ):
+        calendar = get_study_day_index(
+            start_date, end_date, no_study_weekdays, skip_holidays
+        )
+    study_ordinals = (
+        calendar.study_ordinals() if calendar is not None else np.zeros(0, np.int64)
+    )
+    range_days = (
+        int(np.searchsorted(study_ordinals, end_date.toordinal(), side="right"))
+        if end_date is not None
+        else 0
+    )
+
+    schedules = []
+    for track, units in zip(tracks, selections):
+        units_per_day = track.get("units_per_day")
+        days = None
+        if len(units):
+            if units_per_day:
+                track_ordinals = study_ordinals[: math.ceil(len(units) / units_per_day)]
+            else:
+                track_ordinals = study_ordinals[:range_days]
+            days = _allocate_units_over_days(
+                units,
+                track["mode"],
+                track_ordinals,
+                units_per_day,
+                track.get("balance_chapters_by_mishnayot", False),
+                track.get("align_to_boundaries", False),
+            )
+        schedules.append(
+            None if days is None else StudySchedule(units, track["mode"], *days)
+        )
+    return schedules
+
+
+def iter_multi_track_schedule(schedules):
+    """
+    ממזג את לוחות המסלולים ליום אחד לכל תאריך שיש בו לימוד במסלול כלשהו.
+
+    Args:
+        schedules (list[StudySchedule | None]): הלוחות, לפי סדר המסלולים.
+
+    Yields:
+        dict: ``date``, ``description`` (תיאורי המסלולים, שורה לכל אחד) ו-
+        ``tracks`` - רשומת היום של כל מסלול (עם ``mode``), או None אם אין בו
+        לימוד באותו יום.
+    """
+    present = [schedule for schedule in schedules if schedule is not None]
+    if not present:
+        return
+    ordinals = np.unique(np.concatenate([s.day_ordinals for s in present]))
+    positions = [0] * len(schedules)
+    for ordinal in ordinals.tolist():
+        track_days = []
+        for t, schedule in enumerate(schedules):
+            day = None
+            if (
+                schedule is not None
+                and positions[t] < len(schedule)
+                and schedule.day_ordinals[positions[t]] == ordinal
+            ):
+                day = schedule.day(positions[t])
+                day["mode"] = schedule.mode
+                positions[t] += 1
+            track_days.append(day)
+        yield {
+            "date": date.fromordinal(ordinal),
+            "description": "\n".join(
+                day["description"] for day in track_days if day is not None
+            ),
+            "tracks": track_days,
+        }
+
+
+def _multi_track_export(start_date, end_date, tracks, tree_data, no_study_weekdays, skip_holidays, extension):
+    """
+    מחשב את ימי התוכנית הרב-מסלולית לייצוא, את תאריך הסיום בפועל ואת שם הקובץ.
+
+    Returns:
+        tuple | None: ``(days, actual_end_date, filename, active_tracks)`` -
+        ``active_tracks`` הם המסלולים שיש בהם לימוד; או None אם אין מה ללמוד.
+    """
+    schedules = build_multi_track_schedule(
+        start_date, end_date, tracks, tree_data, no_study_weekdays, skip_holidays
+    )
+    active_tracks = [
+        track for track, schedule in zip(tracks, schedules) if schedule is not None
+    ]
+    track_ends = [
+        schedule.last_date if track.get("units_per_day") else end_date
+        for track, schedule in zip(tracks, schedules)
+        if schedule is not None
+    ]
+    if not track_ends:
+        return None
+    actual_end_date = max(track_ends)
+    # שם הקובץ מורכב מהשם החכם של כל מסלול
+    names = [
+        generate_smart_filename(
+            track["titles_list"],
+            track["mode"],
+            start_date,
+            actual_end_date,
+            tree_data,
+            extension,
+            track.get("units_per_day"),
+        ).rsplit(".", 1)[0]
+        for track in active_tracks
+    ]
+    filename = f"{' + '.join(names)}.{extension}"
+    return iter_multi_track_schedule(schedules), actual_end_date, filename, active_tracks
+
+
+def write_multi_track_ics_file(
+    tracks,
+    start_date,
+    end_date,
+    tree_data,
+    no_study_weekdays_set,
+    skip_holidays=False,
+    alarm_time: time | None = None,
+    link_template: str = DEFAULT_LESSON_LINK,
+    output_path: str | None = None,
+    diff_from: str | None = None,
+    plan_id: str | None = None,
+):
+    """
+    יוצר קובץ ICS אחד לתוכנית רב-מסלולית - אירוע אחד לכל יום, הכולל את
+    הלימוד והקישורים של כל המסלולים.
+
+    Args:
+        tracks (list[dict]): הגדרות המסלולים (ראו build_multi_track_schedule).
+        start_date (date): תאריך התחלת הלימוד.
+        end_date (date | None): תאריך הסיום של מסלולים ללא הספק קבוע.
+        tree_data (dict): עץ הנתונים המלא.
+        no_study_weekdays_set (set[int]): קבוצת ימי חופשה שבועיים.
+        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
+        alarm_time (datetime.time | None, optional): שעת התראה לאירוע.
+        link_template (str, optional): תבנית הקישור.
+        output_path (str | None, optional): נתיב קובץ היעד.
+        diff_from (str | None, optional): נתיב ייצוא קודם - לכתיבת השינויים בלבד.
+        plan_id (str | None, optional): מזהה התוכנית (ברירת מחדל - לפי המסלולים
+            ופרמטרי התוכנית).
+
+    Returns:
+        str or None: הנתיב המלא לקובץ ה-ICS שנוצר, או None אם אירעה שגיאה.
+    """
+    export = _multi_track_export(
+        start_date, end_date, tracks, tree_data, no_study_weekdays_set, skip_holidays, "ics"
+    )
+    if export is None:
+        print("אזהרה: לא נוצר לוח לימודים.")
+        return None
+    days, _, filename, active_tracks = export
+
+    event_base_name = "סדר לימוד: " + " + ".join(
+        track["titles_list"][0].split(" / ")[-1] if track["titles_list"] else "לימוד"
+        for track in active_tracks
+    )
+
+    def events():
+        for day_data in days:
+            blocks, all_links = [], []
+            for track_day in day_data["tracks"]:
+                if track_day is None:
+                    continue
+                links = _day_links(track_day, track_day["mode"], link_template)
+                blocks.append(_with_links(track_day["description"], links))
+                all_links.extend(links)
+            yield (
+                event_base_name, day_data["date"], "\n\n".join(blocks), all_links, alarm_time
+            )
+
+    full_path = output_path or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), filename
+    )
+    plan_key = ics_plan_key(
+        plan_id
+        if plan_id is not None
+        else [
+            default_ics_plan_id(
+                track["titles_list"],
+                track["mode"],
+                start_date,
+                track.get("units_per_day"),
+                no_study_weekdays_set,
+                skip_holidays,
+            )
+            for track in tracks
+        ]
+    )
+    return _export_ics(full_path, events(), plan_key, diff_from, inherit_plan=plan_id is None)
+
+
+def write_multi_track_bookmark_html(
+    tracks,
+    start_date,
+    end_date,
+    tree_data,
+    no_study_weekdays_set,
+    skip_holidays=False,
+    link_template: str = DEFAULT_LESSON_LINK,
+    pdf_mode: bool = False,
+    output_path: str | None = None,
+):
+    """
+    יוצר דף סימנייה אחד לתוכנית רב-מסלולית, שבו כל תא מציג את הלימוד של
+    כל המסלולים באותו יום.
+
+    Args:
+        tracks (list[dict]): הגדרות המסלולים (ראו build_multi_track_schedule).
+        start_date (date): תאריך התחלת הלימוד.
+        end_date (date | None): תאריך הסיום של מסלולים ללא הספק קבוע.
+        tree_data (dict): עץ הנתונים המלא.
+        no_study_weekdays_set (set[int]): קבוצת ימי חופשה שבועיים.
+        skip_holidays (bool, optional): האם לדלג על חגים בלוח הלימוד.
+        link_template (str, optional): תבנית הקישור.
+        pdf_mode (bool, optional): האם להשתמש בתבנית ההדפסה.
+        output_path (str | None, optional): נתיב קובץ היעד.
+
+    Returns:
+        str or None: הנתיב המלא לקובץ ה-HTML שנוצר, או None אם אין מה ללמוד.
+    """
+    export = _multi_track_export(
+        start_date, end_date, tracks, tree_data, no_study_weekdays_set, skip_holidays, "html"
+    )
+    if export is None:
+        print("אזהרה: לא נוצר לוח לימודים.")
+        return None
+    days, actual_end_date, filename, _ = export
+    monthly_schedule = _iter_monthly_schedule(
+        start_date, actual_end_date, days, None, link_template
+    )
+    out = output_path or os.path.join(os.getcwd(), filename)
+    return _render_bookmark(
+        out, filename, start_date, actual_end_date, monthly_schedule, pdf_mode
+    )
+
+
+# ==================== יצירת תוכניות מרובות ====================
+# כל תוכנית בקבוצה היא מילון של פרמטרי הכותב (כמו ב-write_ics_file, ללא
+# tree_data), ובנוסף "format" - אחד ממפתחות BATCH_WRITERS (ברירת מחדל "ics").
+BATCH_WRITERS = {
+    "ics": write_ics_file,
+    "html": write_bookmark_html,
+    "pdf": write_bookmark_pdf,
+}
+
+# העץ של תהליך העבודה, נטען פעם אחת באתחול התהליך
+_BATCH_TREE = None
+
+
+def _init_batch_worker(tree_path):
+    """מחמם את תהליך העבודה: העץ, טבלת החגים, עץ ההפניות והתבניות."""
+    global _BATCH_TREE
+    _BATCH_TREE = load_tree_index(tree_path)
+    get_sefaria_resolver()
+    load_calendar_table()
+    _template_environment(os.getcwd())
+
+
+def _run_batch_plan(spec):
+    """מייצא תוכנית אחת בתהליך העבודה ומחזיר את נתיב הקובץ שנוצר."""
+    spec = dict(spec)
+    writer = BATCH_WRITERS[spec.pop("format", "ics")]
+    return writer(tree_data=_BATCH_TREE, **spec)
+
+
+def run_plan_batch(specs, tree_path=DEFAULT_TREE_FILE, max_workers=None, mp_context=None):
+    """
+    מייצא קבוצת תוכניות במקביל על פני מאגר תהליכים.
+
+    כל תהליך עבודה טוען את העץ והמטמונים פעם אחת באתחול. שגיאה בתוכנית
+    אחת נרשמת בתוצאה שלה ואינה עוצרת את שאר הקבוצה.
+
+    Args:
+        specs (Iterable[dict]): פרמטרי התוכניות. מומלץ לציין ``output_path``
+            לכל תוכנית, כדי ששמות הקבצים לא יתנגשו.
+        tree_path (str, optional): קובץ העץ שנטען בכל תהליך.
+        max_workers (int, optional): מספר התהליכים (ברירת מחדל - לפי המעבד).
+        mp_context (optional): הקשר multiprocessing ליצירת התהליכים (למשל
+            ``multiprocessing.get_context("spawn")``, ברירת המחדל ב-Windows).
+
+    Yields:
+        dict: לפי סדר הסיום - ``index`` (מיקום התוכנית ב-specs), ``path``
+        (הקובץ שנוצר או None) ו-``error`` (תיאור השגיאה או None).
+    """
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=_init_batch_worker,
+        initargs=(tree_path,),
+    ) as executor:
+        futures = {
+            executor.submit(_run_batch_plan, spec): index
+            for index, spec in enumerate(specs)
+        }
+        for future in as_completed(futures):
+            try:
+                path, error = future.result(), None
+            except Exception as e:
+                path, error = None, f"{type(e).__name__}: {e}"
+            yield {"index": futures[future], "path": path, "error": error}
+
+
+# ==================== שרת מינוי webcal ====================
+# כל הזנה היא תוכנית יחידה, המוגדרת במילון של פרמטרי write_ics_file (ללא
+# tree_data, output_path, schedule ו-diff_from; כולל plan_id אופציונלי),
+# ומוגשת בנתיב "/<שם>.ics".
+# ההזנה מכילה רק חלון מתגלגל של אירועים סביב היום הנוכחי.
+WEBCAL_PAST_DAYS = 30
+WEBCAL_FUTURE_DAYS = 365
+WEBCAL_MAX_AGE = 3600  # שניות - רמז למרווח הבדיקה של הלקוחות
+# תיקיית ברירת המחדל לקובצי המצב של ההזנות (ראו serve_webcal)
+WEBCAL_STATE_DIR = "webcal_state"
+
+# רענון ההזנות עובר דרך מטמוני הלוחות וההפניות המשותפים
+_WEBCAL_REFRESH_LOCK = threading.Lock()
+
+
+class WebcalSnapshot(NamedTuple):
+    """גרסה אחת של הזנה - הגוף בשני הקידודים וה-validators שלו, כיחידה אחת."""
+
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    gzip_etag: str  # לכל קידוד תוכן validator חזק משלו
+    last_modified: datetime
+
+    def is_not_modified(self, if_none_match, if_modified_since):
+        """
+        בודק בקשה מותנית (RFC 7232): If-None-Match קודם ל-If-Modified-Since.
+
+        Returns:
+            bool: True אם ללקוח כבר יש את הגרסה הזו.
+        """
+        if if_none_match:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags or self.gzip_etag in tags
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.last_modified <= since
+        return False
+
+
+class WebcalFeed:
+    """
+    הזנת ICS של תוכנית אחת, בחלון מתגלגל סביב היום הנוכחי.
+
+    גוף ההזנה (גם בגרסה דחוסה) מחושב פעם ביום לכל היותר, מתוך הלוח השמור
+    במטמון. ה-ETag נגזר מתוכן האירועים שבחלון, ו-Last-Modified מתעדכן רק
+    כשהתוכן משתנה, כך שלקוח שבודק שוב מקבל "304" עד לשינוי הבא.
+
+    כאשר ``state_path`` נתון, מצב האירועים (SEQUENCE ו-LAST-MODIFIED) נשמר
+    בקובץ המצב שלו (ראו ics_state_path), כך שהפעלה מחדש של השרת ממשיכה את
+    מספרי הגרסה ומגישה גוף זהה כל עוד התוכן לא השתנה.
+    """
+
+    def __init__(
+        self,
+        spec,
+        tree_data,
+        past_days: int = WEBCAL_PAST_DAYS,
+        future_days: int = WEBCAL_FUTURE_DAYS,
+        state_path: str | None = None,
+    ):
+        self.spec = dict(spec)
+        self.tree_data = tree_data
+        self.past_days = past_days
+        self.future_days = future_days
+        plan_id = self.spec.pop("plan_id", None)
+        if plan_id is None:
+            plan_id = default_ics_plan_id(
+                self.spec["titles_list"],
+                self.spec["mode"],
+                self.spec.get("start_date"),
+                self.spec.get("units_per_day"),
+                self.spec.get("no_study_weekdays_set", set()),
+                self.spec.get("skip_holidays", False),
+                self.spec.get("cycle_anchor"),
+            )
+        self.plan_key = ics_plan_key(plan_id)
+        self.snapshot = None  # WebcalSnapshot הנוכחי; מוחלף בשלמותו בכל רענון
+        self._day = None
+        self.state_path = state_path
+        self._state = load_ics_state(state_path) if state_path else None
+        if self._state is not None and self._state.get("plan") != self.plan_key:
+            self._state = None
+        self._digest = (self._state or {}).get("feed_digest")
+
+    def _window_days(self, today):
+        """מחזיר את ימי הלימוד שבחלון ``[today - past_days, today + future_days]``."""
+        spec = self.spec
+        first = today - timedelta(days=self.past_days)
+        last = today + timedelta(days=self.future_days)
+        args = (
+            spec["titles_list"],
+            spec["mode"],
+            spec.get("start_date"),
+            spec.get("end_date"),
+            self.tree_data,
+            spec.get("no_study_weekdays_set", set()),
+            spec.get("units_per_day"),
+            spec.get("skip_holidays", False),
+            spec.get("balance_chapters_by_mishnayot", False),
+            spec.get("align_to_boundaries", False),
+        )
+        if spec.get("cycle_anchor") is not None:
+            # במחזור נצחי החלון מחושב ישירות, ללא הלוח כולו
+            export = _schedule_days_for_export(
+                *args[:2], first, last, *args[4:], spec["cycle_anchor"]
+            )
+            return [] if export is None else export[0]
+        schedule = get_study_schedule(args[2], args[3], *args[:2], *args[4:])
+        if schedule is None:
+            return []
+        return schedule.window(first, (last - first).days + 1)
+
+    def refresh(self, today: date | None = None) -> WebcalSnapshot:
+        """
+        מחשב מחדש את גוף ההזנה אם היום התחלף מאז החישוב האחרון.
+
+        Returns:
+            WebcalSnapshot: הגרסה הנוכחית, שנלקחה תחת הנעילה. יש להגיש ממנה
+            בלבד, כדי שגוף ו-validators מרענונים שונים לא יתערבבו.
+        """
+        today = today or date.today()
+        with _WEBCAL_REFRESH_LOCK:
+            if self._day == today:
+                return self.snapshot
+            events = list(
+                _ics_plan_events(
+                    self._window_days(today),
+                    self.spec["titles_list"],
+                    self.spec["mode"],
+                    self.spec.get("link_template", DEFAULT_LESSON_LINK),
+                    self.spec.get("alarm_time"),
+                )
+            )
+            digest = hashlib.sha256()
+            for name, day_date, description, links, alarm_time in events:
+                digest.update(day_date.isoformat().encode("ascii"))
+                digest.update(_ics_event_digest(name, description, links, alarm_time).encode("ascii"))
+            digest = digest.hexdigest()
+            if digest != self._digest or self.snapshot is None:
+                # אותו תוכן כמו במצב השמור - משחזרים את החותמת, ולכן גם את הגוף
+                stamp = (self._state or {}).get("feed_stamp")
+                if digest != self._digest or not stamp:
+                    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+                buffer = io.StringIO(newline="")
+                self._state, _ = _serialize_ics_events(
+                    buffer, events, self.plan_key, self._state, stamp=stamp
+                )
+                self._state["feed_digest"] = digest
+                self._state["feed_stamp"] = stamp
+                if self.state_path:
+                    _save_ics_state(self.state_path, self._state)
+                body = buffer.getvalue().encode("utf-8")
+                self.snapshot = WebcalSnapshot(
+                    body,
+                    gzip.compress(body, mtime=0),
+                    f'"{digest[:32]}"',
+                    f'"{digest[:32]}-gz"',
+                    datetime.strptime(stamp, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc),
+                )
+                self._digest = digest
+            self._day = today
+            return self.snapshot
+
+
+def _accepts_gzip(accept_encoding):
+    """האם הלקוח מקבל תוכן דחוס ב-gzip (לפי כותרת Accept-Encoding)."""
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class _WebcalRequestHandler(BaseHTTPRequestHandler):
+    """מגיש את ההזנות של WebcalServer בבקשות GET/HEAD."""
+
+    server_version = "HspekWebcal/1.0"
+
+    def _send_feed(self, head_only):
+        name = unquote(urlsplit(self.path).path).strip("/")
+        feed = self.server.feeds.get(name.removesuffix(".ics"))
+        if feed is None or not name.endswith(".ics"):
+            self.send_error(404)
+            return
+        try:
+            snapshot = feed.refresh()
+        except Exception as e:
+            # שגיאה בחישוב ההזנה מוחזרת ללקוח כ-500 ולא כחיבור שנותק
+            self.log_error("feed %r failed: %s: %s", name, type(e).__name__, e)
+            self.send_error(500)
+            return
+        use_gzip = _accepts_gzip(self.headers.get("Accept-Encoding"))
+        headers = {
+            "ETag": snapshot.gzip_etag if use_gzip else snapshot.etag,
+            "Last-Modified": format_datetime(snapshot.last_modified, usegmt=True),
+            "Cache-Control": f"max-age={WEBCAL_MAX_AGE}",
+            "Vary": "Accept-Encoding",
+        }
+        if snapshot.is_not_modified(
+            self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")
+        ):
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            return
+        body = snapshot.body
+        if use_gzip:
+            body = snapshot.gzip_body
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_feed(head_only=False)
+
+    def do_HEAD(self):
+        self._send_feed(head_only=True)
+
+
+class WebcalServer(ThreadingHTTPServer):
+    """
+    שרת HTTP המגיש תוכניות לימוד כהזנות לוח שנה למינוי (webcal).
+
+    כל ההזנות מחושבות פעם אחת ביצירת השרת, כך שהגדרה שגויה נכשלת מיד
+    ולא בבדיקה של לקוח.
+
+    Args:
+        feeds (dict[str, dict]): שם ההזנה ← פרמטרי התוכנית.
+        tree_data (dict): עץ הנתונים המלא.
+        host (str, optional): כתובת ההאזנה.
+        port (int, optional): פורט ההאזנה (0 - פורט פנוי כלשהו).
+        past_days (int, optional): מספר הימים שעברו הנכללים בהזנה.
+        future_days (int, optional): מספר הימים הבאים הנכללים בהזנה.
+        state_dir (str | None, optional): תיקייה לקובצי המצב של ההזנות, קובץ
+            לכל הזנה. אם None - המצב נשמר בזיכרון בלבד.
+
+    Raises:
+        ValueError: אם לא ניתן לחשב אחת ההזנות.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        feeds,
+        tree_data,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        past_days: int = WEBCAL_PAST_DAYS,
+        future_days: int = WEBCAL_FUTURE_DAYS,
+        state_dir: str | None = None,
+    ):
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self.feeds = {
+            name: WebcalFeed(
+                spec,
+                tree_data,
+                past_days,
+                future_days,
+                os.path.join(state_dir, f"{quote(name, safe='')}.ics") if state_dir else None,
+            )
+            for name, spec in feeds.items()
+        }
+        for name, feed in self.feeds.items():
+            try:
+                feed.refresh()
+            except Exception as e:
+                raise ValueError(f"invalid webcal feed {name!r}: {type(e).__name__}: {e}") from e
+        super().__init__((host, port), _WebcalRequestHandler)
+
+    def feed_url(self, name):
+        """כתובת המינוי (webcal://) של ההזנה."""
+        host, port = self.server_address[:2]
+        return f"webcal://{host}:{port}/{quote(name)}.ics"
+
+
+def serve_webcal(
+    feeds,
+    tree_path=DEFAULT_TREE_FILE,
+    host="127.0.0.1",
+    port=8080,
+    state_dir=WEBCAL_STATE_DIR,
+):
+    """מפעיל את שרת ההזנות עד לעצירה (Ctrl+C); מצב ההזנות נשמר ב-``state_dir``."""
+    with WebcalServer(
+        feeds, load_tree_index(tree_path), host, port, state_dir=resource_path(state_dir)
+    ) as server:
+        for name in server.feeds:
+            print(f"הזנה זמינה: {server.feed_url(name)}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
 # ==================== שימוש לדוגמה ====================
 if __name__ == "__main__":
     try: